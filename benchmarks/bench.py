@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""cbox benchmarks - measures the throughput of streams for each input type
+and worker type, the cold start of the `cbox` cli and compares it end to end
+with `awk` and `cut`.
+
+the results are printed (or saved with `-o`) as json, to be compared across
+releases.
+
+Example Usage:
+
+    $ python benchmarks/bench.py -o bench-0.4.0.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import cbox  # noqa: E402
+
+INPUT_TYPES = ('lines', 'chars', 'raw')
+WORKER_TYPES = ('simple', 'thread', 'asyncio')
+FUNC_TYPES = ('cheap', 'cpu', 'io')
+
+IO_SLEEP = 0.001
+# pools pay a task per item, so they run on a fraction of the data
+POOL_DATA_FRACTION = 20
+CHARS_DATA_FRACTION = 20
+
+
+def cheap(s):
+    return s
+
+
+def cpu(s):
+    total = 0
+    for _ in range(50):
+        total = hash((total, s))
+    return s if total else None
+
+
+def io(s):
+    time.sleep(IO_SLEEP)
+    return s
+
+
+async def async_cheap(s):
+    return s
+
+
+async def async_cpu(s):
+    return cpu(s)
+
+
+async def async_io(s):
+    await asyncio.sleep(IO_SLEEP)
+    return s
+
+
+_funcs = {
+    'cheap': cheap,
+    'cpu': cpu,
+    'io': io,
+}
+
+_async_funcs = {
+    'cheap': async_cheap,
+    'cpu': async_cpu,
+    'io': async_io,
+}
+
+
+def make_data(path, size):
+    """writes about `size` bytes of space separated words lines to `path`"""
+    line = 'lorem ipsum dolor sit amet %d consectetur adipiscing elit\n'
+    with open(path, 'w') as fp:
+        written = i = 0
+        while written < size:
+            written += fp.write(line % i)
+            i += 1
+
+
+def bench_stream(data_path, input_type, worker_type, func_type, repeat,
+                 max_items=None):
+    if worker_type == 'asyncio':
+        func = _async_funcs[func_type]
+    else:
+        func = _funcs[func_type]
+
+    stream_kwargs = {'input_type': input_type, 'worker_type': worker_type}
+    if worker_type == 'thread':
+        stream_kwargs['max_workers'] = 8
+    runner = cbox.stream(**stream_kwargs)(func)
+
+    with open(data_path) as fp:
+        data = fp.read()
+        if max_items is not None:
+            data = _truncate(data, input_type, max_items)
+
+    # raw input iterates the lines of the stream, with their line endings
+    items = len(data) if input_type == 'chars' else len(data.splitlines())
+    size = len(data.encode('utf8'))
+
+    with tempfile.NamedTemporaryFile('w', delete=False) as fp:
+        fp.write(data)
+
+    try:
+        seconds = _best_of(repeat, lambda: _run_stream(runner, fp.name))
+    finally:
+        os.remove(fp.name)
+
+    return {
+        'name': 'stream.%s.%s.%s' % (input_type, worker_type, func_type),
+        'input_type': input_type,
+        'worker_type': worker_type,
+        'func_type': func_type,
+        'items': items,
+        'bytes': size,
+        'seconds': seconds,
+        'items_per_sec': items / seconds,
+        'mb_per_sec': size / seconds / 2 ** 20,
+    }
+
+
+def _truncate(data, input_type, max_items):
+    if input_type == 'chars':
+        return data[:max_items]
+    return ''.join(data.splitlines(True)[:max_items])
+
+
+def _run_stream(runner, path):
+    with open(path) as instream, open(os.devnull, 'w') as outstream:
+        exitcode = runner(instream, outstream, sys.stderr)
+    assert exitcode == 0, 'stream failed with exitcode %s' % exitcode
+
+
+def _best_of(repeat, func):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_cold_start(repeat):
+    cases = [
+        ('python', [sys.executable, '-c', 'pass']),
+        ('import_cbox', [sys.executable, '-c', 'import cbox']),
+        ('cli', [sys.executable, '-m', 'cbox', 's']),
+    ]
+
+    results = []
+    for name, cmd in cases:
+        seconds = _best_of(repeat, lambda: _run_cmd(cmd))
+        results.append({'name': 'cold_start.%s' % name, 'seconds': seconds})
+    return results
+
+
+def bench_cli(data_path, repeat):
+    """compares extracting the 2nd word of each line end to end"""
+    cases = [
+        ('cut', ['cut', '-d', ' ', '-f2', data_path]),
+        ('awk', ['awk', '{print $2}', data_path]),
+        # a regular file input is memory mapped by default
+        ('cbox', [
+            sys.executable, '-m', 'cbox', '-i', data_path, 's.split()[1]',
+        ]),
+        ('cbox_no_mmap', [
+            sys.executable, '-m', 'cbox', '--no-mmap', '-i', data_path,
+            's.split()[1]',
+        ]),
+    ]
+
+    size = os.path.getsize(data_path)
+    results = []
+    for name, cmd in cases:
+        if not shutil.which(cmd[0]):
+            continue
+        seconds = _best_of(repeat, lambda: _run_cmd(cmd))
+        results.append({
+            'name': 'cli.%s' % name,
+            'bytes': size,
+            'seconds': seconds,
+            'mb_per_sec': size / seconds / 2 ** 20,
+        })
+    return results
+
+
+def _run_cmd(cmd):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    with open(os.devnull, 'rb') as devnull_in, \
+            open(os.devnull, 'wb') as devnull_out:
+        subprocess.check_call(
+            cmd, stdin=devnull_in, stdout=devnull_out, env=env,
+        )
+
+
+def run(size, repeat, io_items, input_types, worker_types, func_types):
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        data_path = os.path.join(tmpdir, 'data.txt')
+        make_data(data_path, size)
+
+        for input_type in input_types:
+            for worker_type in worker_types:
+                for func_type in func_types:
+                    max_items = _max_items(
+                        size, input_type, worker_type, func_type, io_items,
+                    )
+                    results.append(bench_stream(
+                        data_path, input_type, worker_type, func_type, repeat,
+                        max_items=max_items,
+                    ))
+
+        results.extend(bench_cold_start(repeat))
+        results.extend(bench_cli(data_path, repeat))
+
+    return {
+        'cbox_version': cbox.__version__,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'data_size': size,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def _max_items(size, input_type, worker_type, func_type, io_items):
+    """limits the items of the slow cases, so the suite runs in minutes"""
+    if func_type == 'io':
+        return io_items
+
+    max_items = None
+    if worker_type != 'simple':
+        max_items = size // 60 // POOL_DATA_FRACTION  # about 60 chars a line
+    if input_type == 'chars':
+        max_items = (max_items or size) // CHARS_DATA_FRACTION
+    return max_items
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument(
+        '-o', '--output', help='json output file (default stdout)',
+    )
+    parser.add_argument(
+        '--size', type=int, default=4 * 2 ** 20,
+        help='input data size in bytes',
+    )
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='runs each case this many times and keeps the best time',
+    )
+    parser.add_argument(
+        '--io-items', type=int, default=500,
+        help='how many items to run with the sleeping (io) function',
+    )
+    parser.add_argument(
+        '-t', '--input-types', nargs='+', choices=INPUT_TYPES,
+        default=INPUT_TYPES,
+    )
+    parser.add_argument(
+        '-w', '--worker-types', nargs='+', choices=WORKER_TYPES,
+        default=WORKER_TYPES,
+    )
+    parser.add_argument(
+        '-f', '--func-types', nargs='+', choices=FUNC_TYPES,
+        default=FUNC_TYPES,
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    report = run(
+        size=args.size,
+        repeat=args.repeat,
+        io_items=args.io_items,
+        input_types=args.input_types,
+        worker_types=args.worker_types,
+        func_types=args.func_types,
+    )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fp:
+            fp.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
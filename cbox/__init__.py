@@ -5,5 +5,5 @@ __url__ = 'https://github.com/shmuelamar/cbox'
 __license__ = 'MIT'
 __keywords__ = 'unix command pipes cli'
 
-from .cli import stream, cmd, main  # noqa
+from .cli import stream, pipeline, cmd, main  # noqa
 from .concurrency import Stop  # noqa
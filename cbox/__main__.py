@@ -1,25 +1,59 @@
 import argparse
-import ast
 import sys
 from sys import stdin, stdout, stderr
 
 import cbox
-from cbox import concurrency
+from cbox import concurrency, streams, utils
 
-__all__ = ('get_inline_func', 'main', )
+__all__ = ('get_inline_func', 'get_inline_pipeline', 'main', )
 
+# the inline string is compiled once into a function with `s` as its local
+_INLINE_SOURCE = '%sdef inline(s):\n    return (\n%s\n    )\n'
 
-def _inline2func(inline_str, inline_globals, **stream_kwargs):
+
+class _InlineFunc(object):
+    """runs the inline string, compiled once into a function, on its input
+    `s`.
+
+    unlike a closure it can be pickled, so it can run on `process` workers.
+    """
+    is_async = False
+
+    def __init__(self, inline_str, modules=None):
+        self.inline_str = inline_str
+        self.modules = modules
+
+        namespace = {}
+        code = _compile_inline(inline_str, self.is_async)
+        exec(code, _import_inline_modules(modules), namespace)
+        self.func = namespace['inline']
+
+    def __call__(self, s):
+        return self.func(s)
+
+    def __getstate__(self):
+        return self.inline_str, self.modules
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class _AsyncInlineFunc(_InlineFunc):
+    is_async = True
+
+
+def _compile_inline(inline_str, is_async=False):
+    source = _INLINE_SOURCE % ('async ' if is_async else '', inline_str)
+    return compile(source, '<inline>', 'exec')
+
+
+def _inline2func(inline_str, modules, **stream_kwargs):
     if stream_kwargs.get('worker_type') != concurrency.ASYNCIO:
-        @cbox.stream(**stream_kwargs)
-        def inline(s):
-            return eval(inline_str, inline_globals, locals())
+        inline = _InlineFunc(inline_str, modules)
     else:
-        @cbox.stream(**stream_kwargs)
-        async def inline(s):
-            return eval(inline_str, inline_globals, locals())
+        inline = _AsyncInlineFunc(inline_str, modules)
 
-    return inline
+    return cbox.stream(**stream_kwargs)(inline)
 
 
 def _import_inline_modules(modules=None):
@@ -32,44 +66,229 @@ def _import_inline_modules(modules=None):
     return inline_globals
 
 
-def _is_compilable(s):
+def _is_compilable(s, is_async=False):
     """returns True if the string is compilable, False otherwise"""
     try:
-        ast.parse(s)
+        _compile_inline(s, is_async)
         return True
-    except Exception:
+    except SyntaxError:
         return False
 
 
+def _shards_type(s):
+    return s if s == cbox.cli.AUTO else int(s)
+
+
+def _errors_type(s):
+    try:
+        utils.parse_errors_mode(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return s
+
+
+def _hedge_after_type(s):
+    try:
+        concurrency.parse_hedge_after(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return s
+
+
+def _cache_type(s):
+    from cbox import caching
+
+    try:
+        caching.parse_cache(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return s
+
+
+def _fields_type(s):
+    try:
+        streams.parse_fields(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return s
+
+
 def _parse_args(argv=None):
     parser = argparse.ArgumentParser(
-        description='runs the inline statement using eval() for each input on '
-                    'stdin and outputs the results to stdout',
+        description='compiles the inline statement once into a function, '
+                    'runs it for each input on stdin and outputs the results '
+                    'to stdout',
+    )
+    parser.add_argument(
+        'inline', nargs='+',
+        help='the statement to run on each input `s`. several statements are '
+             'chained in a single process, each one getting the outputs of '
+             'the previous one as `s` (not supported with --stats and '
+             '--profile)',
     )
-    parser.add_argument('inline')
     parser.add_argument(
         '-m', '--modules', default=None,
         help='comma separated list of modules to import',
     )
     parser.add_argument(
         '-t', '--input-type', default='lines',
-        help='defines how the input stream is split',
-        choices=('lines', 'chars', 'raw')
+        help='defines how the input stream is split. jsonl passes the json '
+             'value of each line as `s`, fields a tuple of the --fields of '
+             'each line',
+        choices=('lines', 'chars', 'raw', 'bytes_lines', 'records', 'jsonl',
+                 'fields')
+    )
+    parser.add_argument(
+        '-o', '--output-type', default=None,
+        help='defines how the outputs are written, defaults to the input '
+             'type. jsonl writes each output as a json line, fields joins '
+             'each tuple output by the --delimiter',
+        choices=('lines', 'chars', 'raw', 'bytes_lines', 'records', 'jsonl',
+                 'fields')
+    )
+    parser.add_argument(
+        '-d', '--delimiter', default=None,
+        help='the fields delimiter of --input-type fields (default tab)',
+    )
+    parser.add_argument(
+        '-f', '--fields', default=None, type=_fields_type,
+        help='comma separated numbers (from 1) or ranges of the fields to '
+             'pass for --input-type fields, i.e. 1,4,7 or 2-5 (default all)',
+    )
+    parser.add_argument(
+        '--dialect', default=None, choices=('excel', 'excel-tab', 'unix'),
+        help='read (and write) the fields as csv of this dialect, handling '
+             'quoted fields',
+    )
+    parser.add_argument(
+        '--record-size', default=None, type=int,
+        help='the size in bytes of each record if --input-type is records',
+    )
+    parser.add_argument(
+        '--block-size', default=None, type=int,
+        help='the size of the blocks the input is read by (default 64KB)',
+    )
+    parser.add_argument(
+        '--line-buffered', default=None, action='store_true',
+        help='write and flush each output right away. by default only when '
+             'the output is a tty, otherwise outputs are buffered',
+    )
+    parser.add_argument(
+        '--flush-interval', default=None, type=float,
+        help='flush the buffered output at least every this many seconds',
+    )
+    parser.add_argument(
+        '-i', '--input', default=None,
+        help='read the input from this file instead of stdin',
+    )
+    parser.add_argument(
+        '--mmap', default=None, action='store_true',
+        help='memory map the input file also for --input-type raw, passing '
+             'a single memoryview of the file as `s`. by default the input '
+             'is memory mapped when it is a regular file for all other input '
+             'types',
+    )
+    parser.add_argument(
+        '--no-mmap', dest='mmap', action='store_false',
+        help='do not memory map the input, read it as a stream',
+    )
+    parser.add_argument(
+        '--shards', default=None, type=_shards_type,
+        help='when the input is a regular file, split it into byte ranges '
+             'that are read and processed by this many worker processes '
+             '(`auto` for one per CPU). only for lines, bytes_lines, records '
+             'and jsonl input types',
     )
     parser.add_argument(
         '-w', '--worker-type', default='simple',
-        choices=('simple', 'thread', 'asyncio'),
+        choices=('simple', 'thread', 'process', 'asyncio'),
         help='worker type to use for concurrency',
     )
     parser.add_argument(
-        '-c', '--max-workers', default=1, type=int,
+        '-c', '--max-workers', default=None, type=int,
         help='how many max workers (i.e. threads) to run in parallel. '
-             'only affect if --worker-type is thread',
+             'only affect if --worker-type is not simple. defaults to 1 '
+             'thread, to the number of CPUs for processes or to '
+             '--workers-window coroutines',
     )
     parser.add_argument(
         '--workers-window', default=100, type=int,
-        help='how many tasks to execute in parallel before waiting for them '
-             'to be completed. only affect if --worker-type is not simple.',
+        help='how many tasks to keep in flight at any given time, a new task '
+             'is submitted as soon as the oldest one is done. only affect if '
+             '--worker-type is not simple.',
+    )
+    parser.add_argument(
+        '--adaptive', default=False, action='store_true',
+        help='tune how many tasks are in flight while running by their '
+             'latency and errors, between --min-workers and --max-workers '
+             '(or --workers-window). only for thread and asyncio workers',
+    )
+    parser.add_argument(
+        '--min-workers', default=None, type=int,
+        help='the lowest number of tasks in flight with --adaptive '
+             '(default 1)',
+    )
+    parser.add_argument(
+        '--hedge-after', default=None, type=_hedge_after_type,
+        help='start a second attempt of an input still running after this '
+             'many seconds, or after the pNN percentile of the recent '
+             'latencies (i.e. p95), and output the first to succeed. for '
+             'idempotent statements with thread and asyncio workers',
+    )
+    parser.add_argument(
+        '--timeout', default=None, type=float,
+        help='fail an input still running after this many seconds with a '
+             'TimeoutError, and move on to the next inputs. for thread and '
+             'asyncio workers',
+    )
+    parser.add_argument(
+        '--cache', default=None, type=_cache_type, metavar='SIZE_OR_PATH',
+        help='memoize the outputs by their input, so repeated inputs run '
+             'the statement once. a number keeps that many last used inputs '
+             'in memory, otherwise a sqlite file path keeping them on disk '
+             'for the next runs',
+    )
+    parser.add_argument(
+        '--unordered', dest='ordered', action='store_false',
+        help='output the results as soon as they are done instead of in the '
+             'input order. only affect if --worker-type is not simple.',
+    )
+    parser.add_argument(
+        '--errors', default=None, type=_errors_type,
+        help='how to report errors to stderr. full (default) for '
+             'tracebacks, short for a line with the input, count for the '
+             'number of errors of each type on exit, first:N for the first '
+             'N tracebacks only or sample:RATE for a RATE (0 to 1) of them',
+    )
+    parser.add_argument(
+        '--stats', default=None, action='store_true',
+        help='print a summary of the run metrics (items in and out, errors, '
+             'latency percentiles, workers busy time, tasks in flight and '
+             'time blocked on reads and writes) to stderr on exit',
+    )
+    parser.add_argument(
+        '--stats-fd', default=None, type=int,
+        help='write the run metrics as json lines into this file descriptor '
+             'every --stats-interval seconds and on exit',
+    )
+    parser.add_argument(
+        '--stats-interval', default=None, type=float,
+        help='seconds between the json lines of --stats-fd (default 1)',
+    )
+    parser.add_argument(
+        '--profile', default=None, choices=('cprofile', 'sampling'),
+        help='profile the inline statement calls, writing a pstats '
+             '(cprofile) or a collapsed stacks (sampling) file on exit',
+    )
+    parser.add_argument(
+        '--profile-path', default=None,
+        help='the profile output file (default cbox.prof for cprofile and '
+             'cbox.collapsed for sampling)',
+    )
+    parser.add_argument(
+        '--batch-size', default=None, type=int,
+        help='pass lists of up to this many inputs as `s`, the inline '
+             'statement should return a list with an output for each input',
     )
     return parser.parse_args(argv)
 
@@ -85,30 +304,62 @@ def get_inline_func(inline_str, modules=None, **stream_kwargs):
     :param dict stream_kwargs: optional arguments to `cbox.stream` decorator
     :rtype: callable
     """
-    if not _is_compilable(inline_str):
+    is_async = stream_kwargs.get('worker_type') == concurrency.ASYNCIO
+    if not _is_compilable(inline_str, is_async):
         raise ValueError(
             'cannot compile the inline expression - "%s"' % inline_str
         )
 
-    inline_globals = _import_inline_modules(modules)
-    func = _inline2func(inline_str, inline_globals, **stream_kwargs)
+    func = _inline2func(inline_str, modules, **stream_kwargs)
     return func
 
 
+def get_inline_pipeline(inline_strs, modules=None, **stream_kwargs):
+    """returns a `cbox.pipeline` of the inline functions of `inline_strs`.
+
+    :param list[str] inline_strs: the inline functions to chain, each one
+      gets the outputs of the previous one as `s`.
+    :param str modules: comma separated list of modules to import before
+      running the inline functions.
+    :param dict stream_kwargs: optional arguments to `cbox.stream` decorator
+      of every function, `output_type` applies to the last one only.
+    :rtype: callable
+    """
+    output_type = stream_kwargs.pop('output_type', None)
+    funcs = [
+        get_inline_func(inline_str, modules, **stream_kwargs)
+        for inline_str in inline_strs[:-1]
+    ]
+    funcs.append(get_inline_func(
+        inline_strs[-1], modules, output_type=output_type, **stream_kwargs
+    ))
+    return cbox.pipeline(*funcs)
+
+
 def main(argv=None, input_stream=stdin, output_stream=stdout,
          error_stream=stderr):
     """runs inline function - more info run `cbox --help`"""
     args = _parse_args(argv)
     args_dict = args.__dict__.copy()
-    inline_str = args_dict.pop('inline')
+    inline_strs = args_dict.pop('inline')
     modules = args_dict.pop('modules')
+    input_path = args_dict.pop('input')
+    stats_fd = args_dict.pop('stats_fd')
+    if stats_fd is not None:
+        args_dict['stats'] = stats_fd
 
-    func = get_inline_func(inline_str, modules, **args_dict)
+    if len(inline_strs) == 1:
+        func = get_inline_func(inline_strs[0], modules, **args_dict)
+    else:
+        func = get_inline_pipeline(inline_strs, modules, **args_dict)
 
-    return cbox.main(
-        func=func, argv=[], input_stream=input_stream,
-        output_stream=output_stream, error_stream=error_stream, exit=False,
-    )
+    # the inline func takes no cli arguments, so it is called directly
+    # rather than by `cbox.main()` to skip building a parser for it
+    if input_path is None:
+        return func(input_stream, output_stream, error_stream)
+
+    with open(input_path) as input_file:
+        return func(input_file, output_stream, error_stream)
 
 
 if __name__ == '__main__':  # pragma: nocover
@@ -0,0 +1,189 @@
+import hashlib
+import inspect
+import pickle
+import threading
+from collections import OrderedDict
+
+__all__ = ('get_cache', 'parse_cache', 'LRUCache', 'DiskCache',
+           'DEFAULT_CACHE_SIZE', )
+
+DEFAULT_CACHE_SIZE = 2 ** 16
+
+# pinned, so the keys of the disk cache are the same across python versions
+_PICKLE_PROTOCOL = 4
+
+
+def parse_cache(cache):
+    """parses the `cache` option into the size of an in-memory cache, or the
+    path of a disk cache.
+
+    :param cache: `True` for an in-memory cache of `DEFAULT_CACHE_SIZE`
+      items, an `int` (or a digits `str`) for its size, or any other `str`
+      for the path of a disk cache.
+    :rtype: tuple
+    :return: `(size, None)` or `(None, path)`.
+    :raises ValueError: on a size that is not positive.
+    """
+    if cache is True:
+        return DEFAULT_CACHE_SIZE, None
+    if isinstance(cache, str) and not cache.isdigit():
+        return None, cache
+
+    size = int(cache)
+    if size <= 0:
+        raise ValueError('cache size must be positive - "%s"' % cache)
+    return size, None
+
+
+def get_cache(cache, func, kwargs=None):
+    """returns the cache of the outputs of `func` by its input items (see
+    `parse_cache`).
+
+    the disk cache keys the items by a hash of `func` source (or its pickle,
+    i.e. for inline statements) and `kwargs` too, so a changed function
+    does not get the outputs of the previous one.
+
+    :param cache: the size of an in-memory cache or a disk cache path.
+    :param callable func: the function whose outputs are cached.
+    :param dict kwargs: the arguments `func` is called with besides items.
+    """
+    size, path = parse_cache(cache)
+    if path is None:
+        return LRUCache(size)
+    return DiskCache(path, _fingerprint(func, kwargs or {}))
+
+
+class LRUCache(object):
+    """keeps the outputs of the last `size` used items in memory.
+
+    items that are not hashable (i.e. lists) are not cached.
+    """
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, item):
+        """returns the key of `item`, or `None` if it cannot be cached"""
+        try:
+            hash(item)
+        except TypeError:
+            return None
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def close(self):
+        pass
+
+
+class DiskCache(object):
+    """keeps the outputs in a sqlite file at `path`, so re-runs skip the
+    items already done.
+
+    the outputs are pickled, and committed every `COMMIT_EVERY` sets and on
+    `close()`. the file is not bounded in size, remove it to clear the
+    cache.
+
+    :param str path: the sqlite file path, created if missing.
+    :param bytes namespace: prefix of the hashed keys, to tell apart the
+      outputs of different functions in the same file.
+    """
+    COMMIT_EVERY = 1000
+
+    def __init__(self, path, namespace=b''):
+        import sqlite3
+
+        self.path = path
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        # outputs are set from the worker threads too, under `_lock`
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cbox_cache '
+            '(key BLOB PRIMARY KEY, value BLOB)'
+        )
+
+    def key(self, item):
+        """returns the hash of `item`, or `None` if it cannot be pickled"""
+        if isinstance(item, str):
+            data = b's' + item.encode('utf8', 'surrogateescape')
+        elif isinstance(item, (bytes, bytearray, memoryview)):
+            data = b'b' + bytes(item)
+        else:
+            try:
+                data = b'p' + pickle.dumps(item, _PICKLE_PROTOCOL)
+            except Exception:
+                return None
+        return hashlib.sha1(self.namespace + data).digest()
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT value FROM cbox_cache WHERE key = ?', (key, )
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        try:
+            data = pickle.dumps(value, _PICKLE_PROTOCOL)
+        except Exception:
+            return
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO cbox_cache VALUES (?, ?)',
+                (key, data),
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_EVERY:
+                self._db.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
+
+
+def _fingerprint(func, kwargs):
+    func = inspect.unwrap(func)
+    try:
+        source = '%s.%s\n%s' % (
+            func.__module__, func.__qualname__, inspect.getsource(func),
+        )
+        data = source.encode('utf8')
+    except (AttributeError, OSError, TypeError):
+        # i.e. callable objects, by their pickled state
+        try:
+            data = pickle.dumps(func, _PICKLE_PROTOCOL)
+        except Exception:
+            data = repr(func).encode('utf8')
+
+    data += repr(sorted(kwargs.items())).encode('utf8')
+    return hashlib.sha1(data).digest()
@@ -1,15 +1,25 @@
+import os
 import sys
+from collections import deque
 from functools import wraps
 from sys import stdin, stdout, stderr
 
 from cbox import executors
-from . import concurrency, streams
+from . import concurrency, streams, utils
 
-__all__ = ('stream', 'cmd', 'main', )
+__all__ = ('stream', 'pipeline', 'cmd', 'main', )
+
+AUTO = 'auto'
 
 
 def stream(input_type='lines', output_type=None, worker_type='simple',
-           max_workers=1, workers_window=100):
+           max_workers=None, workers_window=100, ordered=True,
+           batch_size=None, record_size=None, block_size=None,
+           line_buffered=None, flush_interval=None, mmap=None, shards=None,
+           stats=None, stats_interval=None, profile=None, profile_path=None,
+           errors=None, adaptive=False, min_workers=None, hedge_after=None,
+           timeout=None, cache=None, delimiter=None, fields=None,
+           dialect=None):
     """wrapper for processing data from input stream into output into output
     stream while passing each data piece into the function.
     function should take at least one argument (an input stream piece) and
@@ -26,37 +36,463 @@ def stream(input_type='lines', output_type=None, worker_type='simple',
 
 
     :param str input_type: defines how the input stream is split. one of
-      `lines`, `chars` or `raw`.
+      `lines`, `chars`, `raw`, `bytes_lines`, `records`, `jsonl` or
+      `fields`. `bytes_lines` and `records` (of `record_size` bytes each)
+      pass `bytes` without decoding, `jsonl` passes the json value of each
+      (utf-8) line and `fields` a `tuple` of the `fields` of each line.
     :param str output_type: defines how to write into output stream
       (similarly to input stream). if `None`, split the output stream in the
-      same way of `input_type`. one of `None`, `lines`, `chars` or `raw`.
-    :param str worker_type: one of `simple`, `thread` or `asyncio`.
+      same way of `input_type`. one of `None`, `lines`, `chars`, `raw`,
+      `bytes_lines`, `records`, `jsonl`, which writes each output (i.e. a
+      `dict`) as a json line, or `fields`, which joins each `tuple` output
+      by the `delimiter`. `jsonl` uses `orjson` if installed.
+    :param str worker_type: one of `simple`, `thread`, `process` or
+      `asyncio`. use `process` for cpu bound functions. `asyncio` runs
+      coroutine functions, or async generator functions whose outputs are
+      written as they are yielded (not supported with `batch_size`,
+      `hedge_after` and `cache`).
     :param int max_workers: how many max workers (i.e. threads) to run in
-      parallel. only affect if `worker_type=thread`.
-    :param int workers_window: how many tasks to execute in parallel before
-      waiting for them to be completed. only affect if `worker_type`
+      parallel. only affect if `worker_type` is not simple. defaults to 1
+      thread, to the number of CPUs for processes or to `workers_window`
+      coroutines.
+    :param int workers_window: how many tasks to keep in flight at any given
+      time, a new task is submitted as soon as the oldest one is done.
+      only affect if `worker_type` is not simple.
+    :param bool ordered: if False, outputs the results as soon as they are
+      done instead of in the input order. only affect if `worker_type`
       is not simple.
+    :param int batch_size: if set, the function is called with a list of up
+      to `batch_size` input pieces (instead of one by one) and should return
+      a list with an output for each of them - i.e. for using bulk APIs.
+    :param int record_size: the size in bytes of each record. required if
+      `input_type` is `records`.
+    :param int block_size: the size of the blocks the input stream is read
+      by (default 64KB). not used if `input_type` is `raw`.
+    :param bool line_buffered: write and flush each output right away
+      instead of buffering them into large writes. if `None`, line buffered
+      only when the output stream is a tty.
+    :param float flush_interval: if set, flush buffered output at least
+      once every `flush_interval` seconds (i.e. for slow streams).
+    :param bool mmap: whether to memory map the input stream when it is a
+      regular file instead of reading it. if `None`, maps it for all input
+      types except `raw`. if True, `raw` input gets a single `memoryview`
+      of the whole file.
+    :param shards: if set, and the input stream is a regular file, splits it
+      into line (or record) aligned byte ranges which are read and processed
+      by `shards` worker processes (or one per CPU if `auto`). for `lines`,
+      `bytes_lines`, `records` and `jsonl` input types, otherwise ignored.
+      `worker_type` and `max_workers` do not apply, and `batch_size`,
+      `adaptive`, `hedge_after`, `timeout` and `cache` are not supported.
+    :param stats: if True, writes a summary of the run metrics (items in and
+      out, errors, latency percentiles, workers busy time, tasks in flight
+      and time blocked on reads and writes) into the error stream on exit.
+      if a file descriptor (`int`), writes them as json lines into it every
+      `stats_interval` seconds and on exit.
+    :param float stats_interval: seconds between the json lines of `stats`
+      (default 1).
+    :param str profile: if set, profiles the function calls (and not cbox
+      itself) across threads and worker processes, and writes the profile
+      into `profile_path` when the run ends. `cprofile` writes a pstats
+      file, `sampling` samples the function stacks and writes them as
+      collapsed stacks (i.e. for flame graphs).
+    :param str profile_path: the profile output file, defaults to
+      `cbox.prof` for `cprofile` and `cbox.collapsed` for `sampling`.
+    :param str errors: how to report the errors into the error stream.
+      `full` (default) writes their tracebacks, `short` a single line
+      `ExcType: message` with the input, `count` how many errors of each
+      type there were on exit, `first:N` the tracebacks of the first `N`
+      errors only and `sample:RATE` of a `RATE` (0 to 1) of them. the
+      exitcode is 2 on any error in all modes.
+    :param bool adaptive: if True, tunes how many tasks are in flight while
+      running by the function latency and errors - growing while the
+      function keeps up and backing off when it slows down or fails, between
+      `min_workers` and `max_workers` (or `workers_window`). only for
+      `thread` and `asyncio` workers.
+    :param int min_workers: the lowest number of tasks in flight when
+      `adaptive` (default 1).
+    :param hedge_after: if set, starts a second attempt (a hedge) of an
+      input still running after `hedge_after` seconds, or after the `pNN`
+      percentile of the recent latencies (i.e. `p95`), and outputs the first
+      attempt to succeed - cutting the tail latency of network bound
+      functions. the function must be idempotent. only for `thread` and
+      `asyncio` workers, the number of hedges is counted in the `stats`.
+    :param float timeout: if set, an input still running after `timeout`
+      seconds fails with a `TimeoutError` (written to the error stream like
+      any other error), and the next input takes its place. coroutines are
+      cancelled, threads cannot be stopped and keep running until the call
+      returns. only for `thread` and `asyncio` workers.
+    :param cache: if set, memoizes the outputs by their input, so repeated
+      inputs skip the function and identical inputs in flight are run once.
+      `True` (or an `int` size) keeps the last `65536` (or size) used inputs
+      in memory, a `str` is the path of a sqlite file keeping them on disk
+      for the next runs, keyed by the function source and arguments too.
+      errors are not cached, and generator outputs are cached as lists. not
+      supported with `batch_size` or `shards`.
+    :param str delimiter: the delimiter of the `fields` input and output
+      (default tab).
+    :param fields: the 1-based numbers of the fields to pass for `fields`
+      input, as a list or a `str` like `1,4,7` or `2-5` (default all of
+      them). lines are split no further than the last selected field, so
+      picking a few columns of wide rows is cheap.
+    :param str dialect: if set, the `fields` are read and written by the
+      `csv` module in this dialect (i.e. `excel` or `unix`), handling
+      quoted fields - all the columns of each row are parsed then.
     """
+    # fail on decoration rather than on the first error
+    utils.parse_errors_mode(errors)
+    if hedge_after is not None:
+        concurrency.parse_hedge_after(hedge_after)
+    if cache:
+        from cbox import caching
+        caching.parse_cache(cache)
+    if fields is not None:
+        streams.parse_fields(fields)
+    if shards:
+        unsupported = dict(
+            batch_size=batch_size, adaptive=adaptive, hedge_after=hedge_after,
+            timeout=timeout, cache=cache,
+        )
+        for name, value in unsupported.items():
+            if value is not None and value is not False:
+                raise ValueError('%s is not supported with shards' % name)
+
+    # kept on the wrapper, for `cbox.main` to run it with other options
+    options = dict(
+        input_type=input_type, output_type=output_type,
+        worker_type=worker_type, max_workers=max_workers,
+        workers_window=workers_window, ordered=ordered,
+        batch_size=batch_size, record_size=record_size,
+        block_size=block_size, line_buffered=line_buffered,
+        flush_interval=flush_interval, mmap=mmap, shards=shards, stats=stats,
+        stats_interval=stats_interval, profile=profile,
+        profile_path=profile_path, errors=errors, adaptive=adaptive,
+        min_workers=min_workers, hedge_after=hedge_after, timeout=timeout,
+        cache=cache, delimiter=delimiter, fields=fields, dialect=dialect,
+    )
+
     def inner(f):
 
         @wraps(f)
         def wrapper(input_stream, output_stream, error_stream, **kwargs):
-            in_parser = streams.get_input_parser(input_type)
-            out_parser = streams.get_output_parser(output_type, input_type)
-            runner = concurrency.get_runner(
-                worker_type=worker_type,
-                max_workers=max_workers,
-                workers_window=workers_window,
-            )
-            items = in_parser(input_stream)
-            output = runner(f, items, kwargs)
-            return out_parser(output_stream, error_stream, output)
+            # also checks the input options when sharded
+            in_parser = _get_input_parser(options)
+            sharded = None
+            if shards:
+                sharded = streams.get_input_shards(
+                    input_stream, input_type,
+                    shards=os.cpu_count() if shards == AUTO else shards,
+                    record_size=record_size, block_size=block_size,
+                )
+
+            collector = stats_stream = None
+            if stats:
+                workers = concurrency.get_workers_count(
+                    worker_type, max_workers, workers_window, adaptive,
+                )
+                if sharded:
+                    workers = os.cpu_count() if shards == AUTO else shards
+                collector, stats_stream = _start_stats(
+                    stats, stats_interval, workers,
+                )
+
+            outputs_cache = profiler = None
+            if profile:
+                from cbox import profiling
+                profiler = profiling.get_profiler(profile, profile_path)
+
+            if sharded:
+                # the input is read and the function runs on the workers,
+                # only the outputs are counted in the stats
+                read_shard, items = sharded
+                runner = concurrency.get_shard_runner(
+                    read_shard,
+                    max_workers=None if shards == AUTO else shards,
+                    ordered=ordered,
+                    profiler=profiler,
+                    tracebacks=_full_tracebacks(errors),
+                )
+            else:
+                if cache:
+                    from cbox import caching
+                    outputs_cache = caching.get_cache(cache, f, kwargs)
+                runner = _get_runner(
+                    options, errors, collector, profiler, outputs_cache,
+                )
+                items = in_parser(input_stream)
+                if collector is not None:
+                    items = collector.read_items(items)
+
+            out_parser = _get_output_parser(options, collector)
+            func = f
+            if sharded or worker_type == concurrency.PROCESS:
+                func = _process_func(f)
+            output = runner(func, items, kwargs)
+            try:
+                return out_parser(output_stream, error_stream, output)
+            finally:
+                if collector is not None:
+                    _report_stats(collector, stats_stream, error_stream)
+                if profiler is not None:
+                    # the workers must be done before their profiles are read
+                    output.close()
+                    profiler.close()
+                if outputs_cache is not None:
+                    output.close()
+                    outputs_cache.close()
 
         setattr(wrapper, executors.EXECUTOR_ATTR, executors.STREAM)
+        setattr(wrapper, executors.STREAM_OPTIONS_ATTR, options)
         return wrapper
     return inner
 
 
+def pipeline(*funcs):
+    """chains `cbox.stream` functions into a single stream function running
+    all of them in one process, instead of a process per function joined by
+    pipes. the outputs of each function are passed to the next one as
+    python objects, split as its output type would write them (i.e. each
+    item of a returned list for `lines`) - so returning `None` filters an
+    item out as usual, and `cbox.Stop` stops the functions up to the one
+    raising it while the next ones finish the items they already got.
+
+    Example Usage:
+
+        >>> import cbox
+        >>>
+        >>> @cbox.stream(worker_type='thread', max_workers=16)
+        >>> def fetch(url):
+        >>>     return requests.get(url).text
+        >>>
+        >>> if __name__ == '__main__':
+        >>>     cbox.main(cbox.pipeline(extract_urls, fetch, extract_title))
+
+    each function keeps its own worker type, concurrency, `batch_size` and
+    `cache`. the input is read by the input options of the first function,
+    and the outputs and errors of all of them are written by the output
+    options and `errors` of the last one. the function arguments are passed
+    by their names, so `cbox.main` parses the arguments of all of them.
+    `shards`, `stats` and `profile` are not supported.
+
+    :param funcs: the functions decorated by `cbox.stream`, in order.
+    :rtype: callable
+    """
+    if not funcs:
+        raise ValueError('pipeline requires at least one stream function')
+
+    stages = []
+    for f in funcs:
+        if getattr(f, executors.EXECUTOR_ATTR, None) != executors.STREAM:
+            raise ValueError(
+                'pipeline functions must be decorated by cbox.stream - %s'
+                % getattr(f, '__name__', f)
+            )
+        options = getattr(f, executors.STREAM_OPTIONS_ATTR)
+        for name in ('shards', 'stats', 'profile'):
+            if options[name]:
+                raise ValueError('%s is not supported in a pipeline' % name)
+        stages.append((f.__wrapped__, options))
+
+    first, last = stages[0][1], stages[-1][1]
+
+    def wrapper(input_stream, output_stream, error_stream, **kwargs):
+        # errors of all but the last function, written along its outputs
+        stage_errors = deque()
+        items = _get_input_parser(first)(input_stream)
+        outputs, caches = [], []
+        output_type = None
+
+        try:
+            for f, options in stages:
+                if outputs:
+                    items = streams.iter_output_items(
+                        outputs[-1], output_type, stage_errors,
+                    )
+
+                f_kwargs = _stage_kwargs(f, kwargs)
+                outputs_cache = None
+                if options['cache']:
+                    from cbox import caching
+                    outputs_cache = caching.get_cache(
+                        options['cache'], f, f_kwargs,
+                    )
+                    caches.append(outputs_cache)
+
+                runner = _get_runner(
+                    options, last['errors'], cache=outputs_cache,
+                )
+                func = f
+                if options['worker_type'] == concurrency.PROCESS:
+                    func = _process_func(f)
+                outputs.append(runner(func, items, f_kwargs))
+                output_type = options['output_type'] or options['input_type']
+
+            out_parser = _get_output_parser(last)
+            output = _with_errors(outputs[-1], stage_errors)
+            return out_parser(output_stream, error_stream, output)
+        finally:
+            # the next functions first, as they consume the previous ones
+            for output in reversed(outputs):
+                output.close()
+            for outputs_cache in caches:
+                outputs_cache.close()
+
+    wrapper.__name__ = 'pipeline'
+    wrapper.__doc__ = 'runs %s in a pipeline' % ' | '.join(
+        getattr(f, '__name__', 'stream') for f in funcs
+    )
+    setattr(wrapper, executors.EXECUTOR_ATTR, executors.PIPELINE)
+    setattr(wrapper, executors.PIPELINE_FUNCS_ATTR, funcs)
+    return wrapper
+
+
+def _process_func(f):
+    """returns the function `f` of a `cbox.stream` wrapper to run on worker
+    processes, which get it pickled unless they are forked"""
+    import multiprocessing
+
+    if multiprocessing.get_start_method() == 'fork':
+        return f
+    return _StreamFunc(f)
+
+
+class _StreamFunc(object):
+    """calls the function `f` of a `cbox.stream` wrapper on worker processes.
+
+    the module attribute named as `f` is the wrapper, so `f` itself cannot
+    be pickled by reference when processes are spawned (i.e. on windows and
+    macos). it is pickled as a reference to the wrapper instead, resolved
+    into `f` by the worker.
+    """
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __reduce__(self):
+        module = getattr(self.func, '__module__', None)
+        qualname = getattr(self.func, '__qualname__', None)
+        wrapper = _find_attr(module, qualname)
+        if getattr(wrapper, '__wrapped__', None) is self.func:
+            return _stream_func, (module, qualname)
+        # not a module level function (i.e. inline statements), as is
+        return _StreamFunc, (self.func, )
+
+
+def _stream_func(module, qualname):
+    import importlib
+
+    importlib.import_module(module)
+    return _find_attr(module, qualname).__wrapped__
+
+
+def _find_attr(module, qualname):
+    """returns the object named `qualname` in `module`, or None"""
+    obj = sys.modules.get(module) if module else None
+    for name in (qualname or '').split('.'):
+        obj = getattr(obj, name, None)
+    return obj
+
+
+def _get_input_parser(options):
+    fields_options = {}
+    if options['input_type'] == streams.FIELDS:
+        fields_options = dict(
+            delimiter=options['delimiter'], fields=options['fields'],
+            dialect=options['dialect'],
+        )
+    return streams.get_input_parser(
+        options['input_type'], record_size=options['record_size'],
+        block_size=options['block_size'], use_mmap=options['mmap'],
+        **fields_options
+    )
+
+
+def _full_tracebacks(errors):
+    # the others write a line or a count, or just some of the tracebacks
+    return utils.parse_errors_mode(errors)[0] == utils.FULL_ERRORS
+
+
+def _get_runner(options, errors=None, stats=None, profiler=None,
+                cache=None):
+    return concurrency.get_runner(
+        worker_type=options['worker_type'],
+        max_workers=options['max_workers'],
+        workers_window=options['workers_window'],
+        ordered=options['ordered'],
+        batch_size=options['batch_size'],
+        stats=stats,
+        profiler=profiler,
+        error_items=errors == utils.SHORT_ERRORS,
+        adaptive=options['adaptive'],
+        min_workers=options['min_workers'],
+        hedge_after=options['hedge_after'],
+        timeout=options['timeout'],
+        cache=cache,
+    )
+
+
+def _get_output_parser(options, stats=None):
+    return streams.get_output_parser(
+        options['output_type'], options['input_type'],
+        line_buffered=options['line_buffered'],
+        flush_interval=options['flush_interval'],
+        stats=stats,
+        errors=options['errors'],
+        delimiter=options['delimiter'],
+        dialect=options['dialect'],
+    )
+
+
+def _stage_kwargs(func, kwargs):
+    """returns the `kwargs` that are arguments of `func`"""
+    if not kwargs:
+        return {}
+
+    import inspect
+
+    params = inspect.signature(func).parameters
+    if any(p.kind == p.VAR_KEYWORD for p in params.values()):
+        return kwargs
+    return {k: v for k, v in kwargs.items() if k in params}
+
+
+def _with_errors(output, errors):
+    """yields the runner `output`, adding the `errors` queued meanwhile"""
+    for out, err in output:
+        while errors:
+            yield None, errors.popleft()
+        yield out, err
+
+    while errors:
+        yield None, errors.popleft()
+
+
+def _start_stats(stats, stats_interval, workers):
+    from cbox.stats import StatsCollector, DEFAULT_STATS_INTERVAL
+
+    collector = StatsCollector(workers=workers)
+    if stats is True:
+        return collector, None
+
+    # json lines into the file descriptor `stats`, which is left open
+    stats_stream = open(stats, 'w', closefd=False)
+    collector.report_periodically(
+        stats_stream, stats_interval or DEFAULT_STATS_INTERVAL
+    )
+    return collector, stats_stream
+
+
+def _report_stats(collector, stats_stream, error_stream):
+    collector.stop()
+    if stats_stream is None:
+        error_stream.write(collector.summary())
+        return
+
+    with stats_stream:
+        collector.write_json(stats_stream)
+
+
 def cmd(f):
     """wrapper for easily exposing a function as a CLI command.
     including help message, arguments help and type.
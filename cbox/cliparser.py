@@ -1,6 +1,8 @@
 import inspect
-from argparse import ArgumentParser
+import sys
+from argparse import ArgumentParser, ArgumentError
 import re
+from weakref import WeakKeyDictionary
 
 _empty = inspect.Signature.empty
 
@@ -12,6 +14,14 @@ _DOCSTRING_PARAM_REGEX = re.compile(
 
 __all__ = ('get_cli_parser', 'parse_args', )
 
+# dests of the arguments cbox adds to stream functions, not passed to them
+PROFILE_DEST = '_cbox_profile'
+PROFILE_PATH_DEST = '_cbox_profile_path'
+
+# `func -> (help_msg, func_args)` so the signature and docstring of a function
+# are parsed once, no matter how many times its parser is made
+_func_args_cache = WeakKeyDictionary()
+
 
 def get_cli_parser(func, skip_first=0, parser=None):
     """makes a parser for parsing cli arguments for `func`.
@@ -41,29 +51,90 @@ def get_cli_parser(func, skip_first=0, parser=None):
     return parser
 
 
-def get_cli_multi_parser(funcs, skip_first=0):
+def add_stream_arguments(parser):
+    """adds the arguments cbox handles for any `cbox.stream` function to
+    `parser`, unless the function takes arguments with the same names"""
+    arguments = [
+        (('--profile', ), dict(
+            dest=PROFILE_DEST, choices=('cprofile', 'sampling'),
+            help='profile the function calls, writing a pstats (cprofile) or '
+                 'a collapsed stacks (sampling) file on exit',
+        )),
+        (('--profile-path', ), dict(
+            dest=PROFILE_PATH_DEST,
+            help='the profile output file (default cbox.prof for cprofile '
+                 'and cbox.collapsed for sampling)',
+        )),
+    ]
+    for args, kwargs in arguments:
+        try:
+            parser.add_argument(*args, **kwargs)
+        except ArgumentError:
+            pass
+    return parser
+
+
+def get_cli_multi_parser(funcs, skip_first=0, subcmd=None):
     """makes a parser for parsing cli arguments for `func`.
 
     :param list funcs: the function the parser will parse
     :param int skip_first: skip this many first arguments of the func
+    :param str subcmd: if set, only the subcommand named `subcmd` gets its
+      arguments, the other subcommands are added with their help message
+      only (see `get_subcmd`).
     """
     parser = ArgumentParser(description='which subcommand do you want?')
     subparsers = parser.add_subparsers(
         title='subcommands', dest='subcmd', help=''
     )
     for func in funcs:
-        help_msg, func_args = _get_func_args(func)
+        help_msg = _get_func_help(func)
         sub_parser = subparsers.add_parser(func.__name__, help=help_msg)
-        get_cli_parser(func, skip_first=skip_first, parser=sub_parser)
+        if subcmd is None or subcmd == func.__name__:
+            get_cli_parser(func, skip_first=skip_first, parser=sub_parser)
+    return parser
+
+
+def get_cli_pipeline_parser(funcs, skip_first=0, description=None):
+    """makes a parser for parsing the cli arguments of all `funcs` at once,
+    an argument shared by several of them is added once.
+
+    :param list funcs: the functions the parser will parse
+    :param int skip_first: skip this many first arguments of each func
+    :param str description: the help message of the parser
+    """
+    parser = ArgumentParser(
+        description=description, conflict_handler='resolve',
+    )
+    for func in funcs:
+        get_cli_parser(func, skip_first=skip_first, parser=parser)
     return parser
 
 
+def get_subcmd(argv=None):
+    """returns the subcommand `argv` invokes, or `''` if none.
+
+    :param list[str] argv: command arguments (default `sys.argv`)
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    for arg in argv:
+        if not arg.startswith('-'):
+            return arg
+    return ''
+
+
 def parse_args(parser, argv=None):
     cmd_kwargs = dict(parser.parse_args(argv).__dict__)
     return cmd_kwargs
 
 
 def _get_func_args(func):
+    try:
+        return _func_args_cache[func]
+    except (KeyError, TypeError):
+        pass
+
     func_args = []
 
     sig = inspect.signature(func)
@@ -72,9 +143,21 @@ def _get_func_args(func):
     for param in sig.parameters.values():
         func_args.append(_param2args(param, doc_params.get(param.name)))
 
+    try:
+        _func_args_cache[func] = help_msg, func_args
+    except TypeError:  # not weak referenceable
+        pass
     return help_msg, func_args
 
 
+def _get_func_help(func):
+    """returns the help message of `func` without parsing its arguments"""
+    try:
+        return _func_args_cache[func][0]
+    except (KeyError, TypeError):
+        return _parse_help_msg(func.__doc__)
+
+
 def _strip_lines(txt):
     lines = []
     for line in txt.splitlines():
@@ -91,11 +174,7 @@ def _parse_docstring(docstring):
     if not docstring:
         return None, params
 
-    try:
-        help_msg = _DOCSTRING_REGEX.search(docstring).group()
-        help_msg = _strip_lines(help_msg)
-    except AttributeError:
-        help_msg = None
+    help_msg = _parse_help_msg(docstring)
 
     for param in _DOCSTRING_PARAM_REGEX.finditer(docstring):
         param_definition = param.group(1).rsplit(' ', 1)
@@ -110,6 +189,17 @@ def _parse_docstring(docstring):
     return help_msg, params
 
 
+def _parse_help_msg(docstring):
+    if not docstring:
+        return None
+
+    try:
+        help_msg = _DOCSTRING_REGEX.search(docstring).group()
+    except AttributeError:
+        return None
+    return _strip_lines(help_msg)
+
+
 def _param2args(param, doc_param=None):
     if param.kind != param.POSITIONAL_OR_KEYWORD:
         raise ValueError('parameter type %s is not yet supported' % param.kind)
@@ -1,13 +1,25 @@
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import heapq
+import math
+import os
+import threading
+import time
+from collections import deque
 from functools import partial
-from itertools import islice
+from itertools import chain, count, islice, repeat
 
-__all__ = ('get_runner', 'SIMPLE', 'THREAD', 'ASYNCIO', )
+from . import utils
+
+__all__ = (
+    'get_runner', 'get_shard_runner', 'get_workers_count',
+    'parse_hedge_after', 'AdaptiveLimit', 'ASYNC_GEN_BUFFER',
+    'SIMPLE', 'THREAD', 'PROCESS', 'ASYNCIO',
+)
 
 ASYNCIO = 'asyncio'
 SIMPLE = 'simple'
 THREAD = 'thread'
+PROCESS = 'process'
 
 
 class Stop(Exception):
@@ -17,39 +29,698 @@ class Stop(Exception):
 
 STOP_EXCEPTIONS = (StopIteration, Stop)
 
+# `asyncio`, `concurrent.futures` and `traceback` are imported only by the
+# runners using them, as they are slow to import and `import cbox` should be
+# fast for running small scripts many times (i.e. from shell loops)
+
+# the function and its kwargs a process worker runs, set by `_process_init`
+_process_func = None
+_process_kwargs = None
+
+_missing = object()
+
+# `inspect.CO_ASYNC_GENERATOR`, checked without importing the slow `inspect`
+_CO_ASYNC_GENERATOR = 0x200
+
+# how many outputs of an async generator call are queued until it waits for
+# them to be written
+ASYNC_GEN_BUFFER = 64
 
-def get_runner(worker_type, max_workers=None, workers_window=None):
+# the queue an async generator call puts its outputs into, set per task
+_outputs_queue = contextvars.ContextVar('cbox_outputs_queue')
+
+
+def get_runner(worker_type, max_workers=None, workers_window=None,
+               ordered=True, batch_size=None, stats=None, profiler=None,
+               error_items=False, adaptive=False, min_workers=None,
+               hedge_after=None, timeout=None, cache=None):
     """returns a runner callable.
 
-    :param str worker_type: one of `simple` or `thread`.
+    :param str worker_type: one of `simple`, `thread`, `process` or `asyncio`.
     :param int max_workers: max workers the runner can spawn in parallel.
+      if `None`, defaults to 1 thread, to the number of CPUs for processes or
+      to `workers_window` coroutines.
     :param in workers_window: max number of jobs waiting to be done by the
       workers at any given time.
+    :param bool ordered: if False, yields the results as soon as they are
+      done instead of in the input order.
+    :param int batch_size: if set, the function is called with lists of up
+      to `batch_size` items and returns a list of results, one per item.
+    :param cbox.stats.StatsCollector stats: if set, records the latency of
+      each function call and the tasks in flight into it.
+    :param profiler: if set, profiles the function calls (see
+      `cbox.profiling.get_profiler`).
+    :param bool error_items: if True, the input item of each failed call is
+      attached to its exception (see `utils.get_error_item`).
+    :param bool adaptive: if True, tunes how many tasks are in flight while
+      running, between `min_workers` and `max_workers` (or `workers_window`
+      if not set) by the function latency and errors. only for `thread` and
+      `asyncio` workers.
+    :param int min_workers: the lowest number of tasks in flight when
+      `adaptive` (default 1).
+    :param hedge_after: if set, starts a second attempt of an item still
+      running after this many seconds, or after the `pNN` percentile of the
+      recent latencies (i.e. `p95`), and takes the first to succeed. only
+      for `thread` and `asyncio` workers, and idempotent functions.
+    :param float timeout: if set, an item not done after `timeout` seconds
+      (since it started running) fails with `TimeoutError`, releasing its
+      place in the window. its coroutine is cancelled, a thread keeps
+      running until it returns. only for `thread` and `asyncio` workers.
+    :param cache: if set, the outputs are memoized by their input items in
+      it (see `cbox.caching.get_cache`) and identical items in flight are
+      collapsed into a single call. not supported with `batch_size`.
     :return:
     """
     worker_func = _runners_mapping[worker_type]
-    return partial(
-        worker_func, max_workers=max_workers, workers_window=workers_window
+    runner_kwargs = {}
+    if adaptive:
+        if worker_type not in (THREAD, ASYNCIO):
+            raise ValueError(
+                'adaptive concurrency is only supported by thread and '
+                'asyncio workers, not %s' % worker_type
+            )
+        runner_kwargs['limit_factory'] = partial(
+            AdaptiveLimit, min_workers or 1, max_workers or workers_window,
+        )
+    if hedge_after is not None:
+        if worker_type not in (THREAD, ASYNCIO):
+            raise ValueError(
+                'hedging is only supported by thread and asyncio workers, '
+                'not %s' % worker_type
+            )
+        runner_kwargs['hedge_factory'] = partial(_HedgeDelay, hedge_after)
+    if timeout is not None:
+        if worker_type not in (THREAD, ASYNCIO):
+            raise ValueError(
+                'timeout is only supported by thread and asyncio workers, '
+                'not %s' % worker_type
+            )
+        if timeout <= 0:
+            raise ValueError('timeout must be positive - %s' % timeout)
+        runner_kwargs['timeout'] = timeout
+    if cache is not None:
+        if batch_size:
+            raise ValueError('cache is not supported with batch_size')
+        runner_kwargs['cache'] = cache
+
+    if worker_type == ASYNCIO:
+        # wrapped by the runner, after turning async generator functions
+        # into coroutine functions. the profiled function is innermost
+        wrappers = []
+        if profiler is not None:
+            wrappers.append(profiler.wrap_async)
+        if error_items:
+            wrappers.append(_async_error_items)
+        runner_kwargs['wrappers'] = wrappers
+
+    runner = partial(
+        worker_func, max_workers=max_workers, workers_window=workers_window,
+        ordered=ordered, stats=stats, **runner_kwargs
     )
+    if batch_size:
+        runner = partial(
+            _batch_runner, runner, batch_size=batch_size,
+            is_async=worker_type == ASYNCIO,
+        )
+    if error_items and worker_type != ASYNCIO:
+        runner = partial(_wrapped_runner, runner, _error_items)
+    if profiler is not None and worker_type != ASYNCIO:
+        # added last so the profiled function is the innermost wrapper
+        runner = partial(_wrapped_runner, runner, profiler.wrap)
+    return runner
 
 
-def _thread_runner(func, items, kwargs, *, max_workers, workers_window):
-    items = iter(items)
+def get_shard_runner(read_shard, max_workers=None, workers_window=None,
+                     ordered=True, profiler=None, tracebacks=True):
+    """returns a runner callable for processing input shards (byte ranges of
+    a file, see `streams.get_input_shards`) on a pool of processes.
 
-    with ThreadPoolExecutor(max_workers=max_workers) as pool:
-        while True:
-            futures = [pool.submit(func, item, **kwargs)
-                       for item in islice(items, workers_window)]
-            if not futures:
+    each worker process reads and parses its shards by itself, so reading
+    the input is not bottlenecked by a single process.
+
+    :param callable read_shard: picklable function returning the input items
+      of a shard.
+    :param int max_workers: how many worker processes to run in parallel.
+      defaults to the number of CPUs.
+    :param int workers_window: max number of shards in flight at any given
+      time. defaults to twice `max_workers`.
+    :param bool ordered: if False, yields the results of each shard as soon
+      as it is done instead of in the input order.
+    :param profiler: if set, profiles the function calls on the workers.
+    :param bool tracebacks: whether the workers send the errors with their
+      formatted traceback, only worth it if the tracebacks are written.
+    """
+    runner = partial(
+        _shard_runner, read_shard=read_shard, max_workers=max_workers,
+        workers_window=workers_window, ordered=ordered,
+        tracebacks=tracebacks,
+    )
+    if profiler is not None:
+        runner = partial(_wrapped_runner, runner, profiler.wrap)
+    return runner
+
+
+def get_workers_count(worker_type, max_workers=None, workers_window=None,
+                      adaptive=False):
+    """returns how many workers the runner of `worker_type` runs"""
+    if worker_type == THREAD:
+        return max_workers or (workers_window if adaptive else 1)
+    elif worker_type == PROCESS:
+        return max_workers or os.cpu_count()
+    elif worker_type == ASYNCIO:
+        return max_workers or workers_window
+    return 1
+
+
+def parse_hedge_after(hedge_after):
+    """parses `hedge_after` into a fixed delay in seconds, or a latencies
+    percentile if it is a `pNN` string.
+
+    :rtype: tuple
+    :return: `(seconds, None)` or `(None, percentile)`.
+    :raises ValueError: on a negative delay or a percentile not in (0, 100).
+    """
+    if isinstance(hedge_after, str) and hedge_after.startswith('p'):
+        percentile = float(hedge_after[1:])
+        if not 0 < percentile < 100:
+            raise ValueError(
+                'hedge percentile must be in (0, 100) - "%s"' % hedge_after
+            )
+        return None, percentile
+
+    seconds = float(hedge_after)
+    if seconds < 0:
+        raise ValueError('hedge delay must not be negative - "%s"' % (
+            hedge_after))
+    return seconds, None
+
+
+def _shard_runner(func, shards, kwargs, *, read_shard, max_workers,
+                  workers_window, ordered, tracebacks=True):
+    from concurrent.futures import ProcessPoolExecutor
+
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_process_init,
+        initargs=(
+            partial(_run_shard, read_shard, func, kwargs, tracebacks), {},
+        ),
+    )
+    workers_window = workers_window or 2 * (max_workers or os.cpu_count())
+
+    with pool:
+        shards_results = _pool_runner(
+            pool, _process_call, shards, {}, workers_window, ordered
+        )
+        for shard_results, err in shards_results:
+            if err is not None:
+                yield None, err
+                continue
+
+            results, stopped = shard_results
+            yield from results
+            if stopped:
+                shards_results.close()
                 break
 
+
+def _run_shard(read_shard, func, kwargs, tracebacks, shard):
+    """runs on the worker process, returns the results of the shard items
+    and whether the stream should stop"""
+    results = []
+    for item in read_shard(shard):
+        try:
+            results.append((func(item, **kwargs), None))
+        except STOP_EXCEPTIONS:
+            return results, True
+        except Exception as e:
+            utils.set_error_item(e, item)
+            if tracebacks:
+                e = _RemoteException(e)
+            results.append((None, e))
+    return results, False
+
+
+class _RemoteTraceback(Exception):
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class _RemoteException(object):
+    """pickles an exception along with its traceback, which is attached as
+    its cause once unpickled (same as `concurrent.futures` does)"""
+    def __init__(self, exc):
+        import traceback
+
+        self.exc = exc
+        self.tb = ''.join(
+            traceback.format_exception(type(exc), exc, exc.__traceback__)
+        )
+
+    def __reduce__(self):
+        return _rebuild_exception, (self.exc, self.tb)
+
+
+def _rebuild_exception(exc, tb):
+    exc.__cause__ = _RemoteTraceback('\n"""\n%s"""' % tb)
+    return exc
+
+
+def _wrapped_runner(runner, wrap, func, items, kwargs):
+    return runner(wrap(func), items, kwargs)
+
+
+def _error_items(func):
+    # a partial and not a closure, so it can be pickled for process workers
+    return partial(_call_with_error_item, func)
+
+
+def _call_with_error_item(func, item, **kwargs):
+    try:
+        return func(item, **kwargs)
+    except STOP_EXCEPTIONS:
+        raise
+    except Exception as e:
+        utils.set_error_item(e, item)
+        raise
+
+
+def _async_error_items(func):
+    async def call_with_error_item(item, **kwargs):
+        try:
+            return await func(item, **kwargs)
+        except STOP_EXCEPTIONS:
+            raise
+        except Exception as e:
+            utils.set_error_item(e, item)
+            raise
+    return call_with_error_item
+
+
+def _batch_runner(runner, func, items, kwargs, *, batch_size,
+                  is_async=False):
+    if _is_async_gen_func(func):
+        raise ValueError(
+            'batch_size is not supported by async generator functions'
+        )
+
+    # checked by the call, so a mismatch fails its own batch in any order
+    func = partial(_call_async_batch if is_async else _call_batch, func)
+    items = iter(items)
+    batches = iter(lambda: list(islice(items, batch_size)), [])
+
+    for outputs, err in runner(func, batches, kwargs):
+        if err is not None:
+            yield None, err
+        elif outputs is not None:
+            yield from zip(outputs, repeat(None))
+
+
+def _call_batch(func, batch, **kwargs):
+    return _batch_outputs(batch, func(batch, **kwargs))
+
+
+async def _call_async_batch(func, batch, **kwargs):
+    return _batch_outputs(batch, await func(batch, **kwargs))
+
+
+def _batch_outputs(batch, outputs):
+    """returns the `outputs` of `batch`, raises `ValueError` if there is
+    not an output for each of its items"""
+    if outputs is None:
+        return None
+    if not hasattr(outputs, '__len__'):
+        outputs = list(outputs)
+    if len(outputs) != len(batch):
+        raise ValueError(
+            'batch function returned %d outputs for %d inputs'
+            % (len(outputs), len(batch))
+        )
+    return outputs
+
+
+class AdaptiveLimit(object):
+    """tunes how many tasks to keep in flight between `min_limit` and
+    `max_limit` by the latency and errors of the done tasks (AIMD).
+
+    starts at `min_limit` and grows by one per done task (slow start) until
+    the first backoff, then by one per `limit` done tasks. backs off by half
+    on errors, and by `LATENCY_BACKOFF` when the smoothed latency is above
+    `tolerance` times the lowest one seen - at most once per `limit` tasks,
+    so a burst of slow tasks counts as a single backoff.
+    """
+    SMOOTHING = 0.2
+    ERROR_BACKOFF = 0.5
+    LATENCY_BACKOFF = 0.8
+
+    def __init__(self, min_limit, max_limit, tolerance=2.0):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.tolerance = tolerance
+        self.limit = float(min_limit)
+        self.latency = None
+        self.baseline = None
+        self._slow_start = True
+        self._hold = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        """how many tasks to keep in flight"""
+        return int(self.limit)
+
+    def update(self, latency, failed=False):
+        """updates the limit with a done task"""
+        with self._lock:
+            if self.latency is None:
+                self.latency = self.baseline = latency
+            else:
+                self.latency += self.SMOOTHING * (latency - self.latency)
+                self.baseline = min(self.baseline, self.latency)
+
+            slow = self.latency > self.baseline * self.tolerance
+            if slow and self.size <= self.min_limit:
+                # slow even with the fewest tasks, the function itself got
+                # slower - so this is its new normal latency
+                self.baseline = self.latency
+                slow = False
+
+            congested = failed or slow
+            if self._hold:
+                self._hold -= 1
+            elif congested:
+                backoff = self.ERROR_BACKOFF if failed else \
+                    self.LATENCY_BACKOFF
+                self.limit *= backoff
+                self._slow_start = False
+                self._hold = self.size
+            elif self._slow_start:
+                self.limit += 1
+            else:
+                self.limit += 1.0 / self.limit
+
+            self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+
+    def timed(self, func):
+        """returns `func` updating the limit with each call"""
+        clock = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            failed = False
             try:
-                yield from _future_iter(futures)
+                return func(*args, **kwargs)
             except STOP_EXCEPTIONS:
-                break
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.update(clock() - start, failed)
+        return timed_func
+
+    def timed_async(self, func):
+        """same as `timed` for coroutine functions"""
+        clock = time.perf_counter
+
+        async def timed_func(*args, **kwargs):
+            start = clock()
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except STOP_EXCEPTIONS:
+                raise
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.update(clock() - start, failed)
+        return timed_func
+
+
+def _thread_runner(func, items, kwargs, *, max_workers, workers_window,
+                   ordered, stats=None, limit_factory=None,
+                   hedge_factory=None, timeout=None, cache=None):
+    from concurrent.futures import ThreadPoolExecutor
+
+    limit = None
+    if limit_factory is not None:
+        # threads for the upper bound, the limit tunes how many are busy
+        limit = limit_factory()
+        max_workers = limit.max_limit
+        func = limit.timed(func)
+    if stats is not None:
+        func = stats.timed(func)
+
+    if hedge_factory is None and timeout is None:
+        with ThreadPoolExecutor(max_workers=max_workers or 1) as pool:
+            yield from _pool_runner(
+                pool, func, items, kwargs, workers_window, ordered, stats,
+                limit, cache=cache,
+            )
+        return
+
+    attempts = _ThreadAttempts(
+        func, kwargs, max_workers or 1,
+        delay=hedge_factory and hedge_factory(), timeout=timeout,
+        stats=stats,
+    )
+    try:
+        yield from _pool_runner(
+            None, func, items, kwargs, workers_window, ordered, stats,
+            limit, submit=attempts.submit, cache=cache,
+        )
+    finally:
+        attempts.close()
+
+
+def _process_runner(func, items, kwargs, *, max_workers, workers_window,
+                    ordered, stats=None, cache=None):
+    # the func is handed to the workers once on startup instead of pickling
+    # it with every item. when processes are forked it is not pickled at all
+    from concurrent.futures import ProcessPoolExecutor
+
+    if stats is not None:
+        # the latency is measured on the workers and sent back with outputs
+        from cbox.stats import timed_call
+        func = partial(timed_call, func)
+
+    pool = ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_process_init,
+        initargs=(func, kwargs),
+    )
+    with pool:
+        output = _pool_runner(
+            pool, _process_call, items, {}, workers_window, ordered, stats,
+            cache=cache,
+        )
+        if stats is not None:
+            output = stats.timed_remote(output)
+        yield from output
+
+
+def _process_init(func, kwargs):
+    global _process_func, _process_kwargs
+    _process_func = func
+    _process_kwargs = kwargs
+
+
+def _process_call(item):
+    return _process_func(item, **_process_kwargs)
+
+
+def _pool_runner(pool, func, items, kwargs, workers_window, ordered,
+                 stats=None, limit=None, submit=None, cache=None):
+    if submit is None:
+        def submit(item):
+            return pool.submit(func, item, **kwargs)
+    if cache is not None:
+        from concurrent.futures import Future
+        submit = _CachedSubmit(submit, cache, Future)
+
+    if ordered:
+        futures = _sliding_window(
+            submit, items, workers_window, stats, limit
+        )
+    else:
+        from concurrent.futures import wait, FIRST_COMPLETED
+
+        futures = _completed_iter(
+            submit, items, workers_window,
+            wait=partial(wait, return_when=FIRST_COMPLETED), stats=stats,
+            limit=limit,
+        )
+    try:
+        yield from _future_iter(futures)
+    except STOP_EXCEPTIONS:
+        futures.close()
+
+
+def _sliding_window(submit, items, workers_window, stats=None, limit=None):
+    """submits `items` and yields their futures in the submission order.
+
+    keeps up to `workers_window` futures in flight (or `limit.size` if
+    `limit` is set), submitting the next item as soon as the oldest future
+    is consumed - so a slow item does not keep the workers idle until a
+    whole window is done.
+    """
+    items = iter(items)
+    size = workers_window if limit is None else limit.size
+    window = deque(submit(item) for item in islice(items, size))
+
+    try:
+        while window:
+            if stats is not None:
+                stats.queue_depth(len(window))
+            yield window[0]
+            window.popleft()
+            if limit is not None:
+                size = limit.size
+            for item in islice(items, max(size - len(window), 0)):
+                window.append(submit(item))
+    finally:
+        for fut in window:
+            fut.cancel()
+
+
+def _completed_iter(submit, items, workers_window, wait, stats=None,
+                    limit=None):
+    """submits `items` and yields their futures as soon as they are done.
+
+    keeps up to `workers_window` futures in flight (or `limit.size` if
+    `limit` is set). `wait` takes the pending futures and returns a
+    `(done, pending)` tuple once any of them is done.
+    """
+    items = iter(items)
+    size = workers_window if limit is None else limit.size
+    pending = {submit(item) for item in islice(items, size)}
+
+    try:
+        while pending:
+            if stats is not None:
+                stats.queue_depth(len(pending))
+            done, pending = wait(pending)
+            if limit is not None:
+                size = limit.size
+            pending.update(
+                submit(item)
+                for item in islice(items, max(size - len(pending), 0))
+            )
+            yield from done
+    finally:
+        for fut in pending:
+            fut.cancel()
+
+
+def _cached_call(cache, func, item, **kwargs):
+    key = cache.key(item)
+    if key is None:
+        return func(item, **kwargs)
+
+    output = cache.get(key, _missing)
+    if output is _missing:
+        output = _cacheable(func(item, **kwargs))
+        cache.set(key, output)
+    return output
+
+
+def _cacheable(output):
+    """returns `output`, consumed into a list if it is an iterator (i.e. a
+    generator) - else only its first use would get the items"""
+    if hasattr(output, '__next__'):
+        return list(output)
+    return output
+
+
+class _CachedSubmit(object):
+    """submits only the items missing from `cache`. an item identical to
+    one in flight gets a future following the one in flight instead of
+    another call. the outputs are cached once done (see `_cacheable`),
+    errors are not.
+
+    :param callable submit: submits an item, returning its future.
+    :param callable new_future: returns a new pending future.
+    """
+    def __init__(self, submit, cache, new_future):
+        self.submit = submit
+        self.cache = cache
+        self.new_future = new_future
+        self.in_flight = {}
+
+    def __call__(self, item):
+        key = self.cache.key(item)
+        if key is None:
+            return self.submit(item)
+
+        output = self.cache.get(key, _missing)
+        if output is not _missing:
+            fut = self.new_future()
+            fut.set_result(output)
+            return fut
+
+        in_flight = self.in_flight.get(key)
+        if in_flight is not None:
+            fut = self.new_future()
+            in_flight.add_done_callback(partial(_copy_future, fut))
+            return fut
+
+        # resolved by the cacheable output of the submitted one
+        submitted = self.submit(item)
+        fut = self.in_flight[key] = self.new_future()
+        fut.add_done_callback(partial(_cancel_submitted, submitted))
+        submitted.add_done_callback(partial(self._done, key, fut))
+        return fut
+
+    def _done(self, key, fut, submitted):
+        if self.in_flight.get(key) is fut:
+            del self.in_flight[key]
+        if submitted.cancelled():
+            fut.cancel()
+            return
+
+        err = submitted.exception()
+        if err is None:
+            try:
+                output = _cacheable(submitted.result())
+            except Exception as e:
+                err = e
+            else:
+                self.cache.set(key, output)
+        if fut.done():  # cancelled
+            return
+        if err is None:
+            fut.set_result(output)
+        else:
+            fut.set_exception(err)
 
 
-def _simple_runner(func, items, kwargs, *, max_workers, workers_window):
+def _cancel_submitted(submitted, fut):
+    if fut.cancelled():
+        submitted.cancel()
+
+
+def _copy_future(dest, fut):
+    if dest.done():  # cancelled
+        return
+    if fut.cancelled():
+        dest.cancel()
+    elif fut.exception() is not None:
+        dest.set_exception(fut.exception())
+    else:
+        dest.set_result(fut.result())
+
+
+def _simple_runner(func, items, kwargs, *, max_workers, workers_window,
+                   ordered, stats=None, cache=None):
+    if stats is not None:
+        func = stats.timed(func)
+    if cache is not None:
+        func = partial(_cached_call, cache, func)
+
     for item in items:
         try:
             yield func(item, **kwargs), None
@@ -59,43 +730,614 @@ def _simple_runner(func, items, kwargs, *, max_workers, workers_window):
             yield None, e
 
 
-def _asyncio_runner(func, items, kwargs, *, max_workers, workers_window):
+def _asyncio_runner(func, items, kwargs, *, max_workers, workers_window,
+                    ordered, stats=None, limit_factory=None,
+                    hedge_factory=None, timeout=None, cache=None,
+                    wrappers=()):
+    import asyncio
+
+    streamed = _is_async_gen_func(func)
+    if streamed:
+        if hedge_factory is not None or cache is not None:
+            raise ValueError(
+                'hedge_after and cache are not supported by async generator '
+                'functions'
+            )
+        func = _async_gen_call(func)
+    for wrap in wrappers:
+        func = wrap(func)
+
+    limit = None
+    if limit_factory is not None:
+        # the limit bounds the tasks in flight instead of a semaphore
+        limit = limit_factory()
+        max_workers = None
+        func = limit.timed_async(func)
+    if stats is not None:
+        func = stats.timed_async(func)
+
     loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    semaphore = None
+    if max_workers:
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def bounded_func(item):
+            async with semaphore:
+                return await func(item, **kwargs)
+    else:
+        def bounded_func(item):
+            return func(item, **kwargs)
+
+    if hedge_factory is None and timeout is None:
+        def submit(item):
+            return loop.create_task(bounded_func(item))
+    else:
+        submit = _AsyncioAttempts(
+            loop, func, kwargs, semaphore,
+            delay=hedge_factory and hedge_factory(), timeout=timeout,
+            stats=stats,
+        ).submit
+    if cache is not None:
+        submit = _CachedSubmit(submit, cache, loop.create_future)
+
+    def wait_first(pending):
+        return loop.run_until_complete(
+            asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        )
+
+    if streamed and ordered:
+        # a queue per item, the head item outputs are written as they come
+        submit = _QueuedSubmit(
+            submit, partial(asyncio.Queue, ASYNC_GEN_BUFFER),
+        )
+        futures = _sliding_window(
+            submit, items, workers_window, stats, limit
+        )
+        done = chain.from_iterable(
+            _stream_outputs(loop, fut, submit.queues.pop(fut))
+            for fut in futures
+        )
+    elif streamed:
+        # a single queue, the outputs of any item are written as they come
+        queue = asyncio.Queue(ASYNC_GEN_BUFFER)
+        submit = _QueuedSubmit(submit, lambda: queue)
+        futures = done = _completed_iter(
+            submit, items, workers_window,
+            partial(_wait_outputs, loop, queue), stats, limit,
+        )
+    elif ordered:
+        futures = _sliding_window(
+            submit, items, workers_window, stats, limit
+        )
+        done = (_asyncio_wait_done(loop, fut) for fut in futures)
+    else:
+        futures = done = _completed_iter(
+            submit, items, workers_window, wait_first, stats, limit
+        )
 
     try:
-        while True:
-            window = list(islice(items, workers_window))
-            if not window:
-                break
+        yield from _future_iter(done)
+    except STOP_EXCEPTIONS:
+        pass
+    finally:
+        futures.close()
+        _asyncio_close_loop(loop)
 
-            tasks = [func(item, **kwargs) for item in window]
-            futures = [asyncio.ensure_future(t, loop=loop) for t in tasks]
-            gathered = asyncio.gather(
-                *futures, loop=loop, return_exceptions=True
-            )
-            loop.run_until_complete(gathered)
 
-            try:
-                yield from _future_iter(futures)
-            except STOP_EXCEPTIONS:
-                break
+def _is_async_gen_func(func):
+    """same as `inspect.isasyncgenfunction`"""
+    while isinstance(func, partial):
+        func = func.func
+    func = getattr(func, '__func__', func)
+    code = getattr(func, '__code__', None)
+    return code is not None and bool(code.co_flags & _CO_ASYNC_GENERATOR)
+
+
+def _async_gen_call(func):
+    """returns a coroutine function running the async generator function
+    `func`, putting its outputs into the queue of the running task - so it
+    waits while the queue is full (backpressure)"""
+    async def call(item, **kwargs):
+        queue = _outputs_queue.get()
+        outputs = func(item, **kwargs)
+        try:
+            async for output in outputs:
+                if output is not None:
+                    await queue.put(output)
+        finally:
+            await outputs.aclose()
+    return call
+
+
+class _QueuedSubmit(object):
+    """submits each item with the queue returned by `new_queue` for its
+    async generator call outputs, kept by its future in `queues`"""
+    def __init__(self, submit, new_queue):
+        self.submit = submit
+        self.new_queue = new_queue
+        self.queues = {}
+
+    def __call__(self, item):
+        queue = self.new_queue()
+        # the task of the call is created by `submit`, copying the context
+        token = _outputs_queue.set(queue)
+        try:
+            fut = self.submit(item)
+        finally:
+            _outputs_queue.reset(token)
+        self.queues[fut] = queue
+        return fut
+
+
+def _stream_outputs(loop, fut, queue):
+    """yields done futures of the outputs `queue` gets as they come, until
+    `fut` of the async generator call is done - then `fut` itself if it
+    failed"""
+    while True:
+        while not queue.empty():
+            yield _done_future(loop, queue.get_nowait())
+        if fut.done():
+            break
+
+        output = loop.run_until_complete(_next_output(loop, queue, [fut]))
+        if output is not _missing:
+            yield _done_future(loop, output)
+
+    if _failed(fut):
+        yield fut
+
+
+def _wait_outputs(loop, queue, pending):
+    """same as `wait_first` of the asyncio runner, returning done futures of
+    the outputs `queue` got meanwhile too (before the failed items). returns
+    as soon as there is an output, even if no item is done"""
+    outputs = []
+    if queue.empty():
+        output = loop.run_until_complete(_next_output(loop, queue, pending))
+        if output is not _missing:
+            outputs.append(output)
+    while not queue.empty():
+        outputs.append(queue.get_nowait())
+
+    done = {fut for fut in pending if fut.done()}
+    outputs = [_done_future(loop, output) for output in outputs]
+    return outputs + list(filter(_failed, done)), pending - done
+
+
+async def _next_output(loop, queue, futures):
+    """returns the next output of `queue`, or `_missing` if any of `futures`
+    is done first"""
+    import asyncio
+
+    getter = loop.create_task(queue.get())
+    await asyncio.wait(
+        set(futures) | {getter}, return_when=asyncio.FIRST_COMPLETED,
+    )
+    getter.cancel()
+    try:
+        return await getter
+    except asyncio.CancelledError:
+        # the output stays in the queue if it got one meanwhile
+        return _missing
+
+
+def _failed(fut):
+    return fut.cancelled() or fut.exception() is not None
+
+
+def _done_future(loop, result):
+    fut = loop.create_future()
+    fut.set_result(result)
+    return fut
+
+
+def _asyncio_wait_done(loop, fut):
+    """runs the event loop until `fut` is done, returns `fut`"""
+    import asyncio
+
+    if not fut.done():
+        loop.run_until_complete(asyncio.wait([fut]))
+    return fut
+
+
+def _asyncio_close_loop(loop):
+    """cancels all the loop tasks still running and closes it"""
+    import asyncio
+
+    try:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(
+            asyncio.gather(*pending, return_exceptions=True)
+        )
+        loop.run_until_complete(loop.shutdown_asyncgens())
     finally:
+        asyncio.set_event_loop(None)
         loop.close()
 
 
+class _HedgeDelay(object):
+    """the delay before hedging an item - either fixed, or the percentile of
+    the last `SAMPLES` latencies once `MIN_SAMPLES` of them were seen"""
+    SAMPLES = 1000
+    MIN_SAMPLES = 20
+    REFRESH = 20
+
+    def __init__(self, hedge_after):
+        self.seconds, self.percentile = parse_hedge_after(hedge_after)
+        self._latencies = deque(maxlen=self.SAMPLES)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        """records the latency of a successful attempt"""
+        if self.percentile is None:
+            return
+
+        with self._lock:
+            self._latencies.append(latency)
+            self._count += 1
+            if self._count < self.MIN_SAMPLES or self._count % self.REFRESH:
+                return
+            latencies = sorted(self._latencies)
+
+        rank = math.ceil(len(latencies) * self.percentile / 100.0)
+        self.seconds = latencies[max(rank - 1, 0)]
+
+
+class _Item(object):
+    __slots__ = ('item', 'outer', 'attempts', 'pending', 'resolved')
+
+    def __init__(self, item, outer):
+        self.item = item
+        self.outer = outer
+        self.attempts = []
+        self.pending = 0
+        self.resolved = False
+
+
+class _AttemptsMixin(object):
+    """submits each item as a future resolved by its attempts, for hedging
+    and timing out items. the timers start once the first attempt of an
+    item started running, so items queued in the window are not counted.
+
+    with a hedge `delay`, a second attempt (a hedge) is started if the item
+    is not done after the delay, and the first attempt to succeed wins. an
+    attempt error resolves the item only if the other attempt is done.
+
+    with a `timeout`, the item fails with `TimeoutError` if not done after
+    `timeout` seconds.
+
+    once resolved, the other attempts are cancelled when possible (running
+    threads are not).
+
+    the classes using it run the attempts, and provide:
+
+    - `_new_future()` returning the future of an item.
+    - `_start(tracked, first)` starting an attempt of the `_Item` `tracked`,
+      added by `_add_attempt`. the attempt calls `_attempt_started` once
+      running if `first`, and `_add_latency` with its run time.
+    - `_call_later(delay, callback, *args)` calling back after `delay`
+      seconds.
+    """
+    def __init__(self, delay=None, timeout=None, stats=None):
+        self.delay = delay
+        self.timeout = timeout
+        self.stats = stats
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        tracked = _Item(item, self._new_future())
+        tracked.outer.add_done_callback(
+            partial(self._cancel_attempts, tracked)
+        )
+        self._start(tracked, first=True)
+        return tracked.outer
+
+    def _attempt_started(self, tracked):
+        if self.delay is not None and self.delay.seconds is not None:
+            self._call_later(self.delay.seconds, self._hedge, tracked)
+        if self.timeout is not None:
+            self._call_later(self.timeout, self._expire, tracked)
+
+    def _add_latency(self, seconds):
+        if self.delay is not None:
+            self.delay.add(seconds)
+
+    def _hedge(self, tracked):
+        if tracked.outer.done():
+            return
+
+        with self._lock:
+            self.hedges += 1
+            if self.stats is not None:
+                self.stats.hedges += 1
+        self._start(tracked, first=False)
+
+    def _expire(self, tracked):
+        """fails `tracked` with a `TimeoutError`, returns False if it was
+        already resolved"""
+        with self._lock:
+            if tracked.resolved:
+                return False
+            tracked.resolved = True
+
+        err = TimeoutError('timed out after %s seconds' % self.timeout)
+        utils.set_error_item(err, tracked.item)
+        self._resolve(tracked, err=err)
+        return True
+
+    def _add_attempt(self, tracked, attempt):
+        with self._lock:
+            tracked.pending += 1
+            tracked.attempts.append(attempt)
+        attempt.add_done_callback(partial(self._attempt_done, tracked))
+
+    def _attempt_done(self, tracked, attempt):
+        with self._lock:
+            tracked.pending -= 1
+            if tracked.resolved or attempt.cancelled():
+                return
+
+            err = attempt.exception()
+            if err is not None and tracked.pending and \
+                    not isinstance(err, STOP_EXCEPTIONS):
+                return  # the other attempt may still succeed
+            tracked.resolved = True
+
+        if err is None:
+            self._resolve(tracked, result=attempt.result())
+        else:
+            self._resolve(tracked, err=err)
+
+    def _resolve(self, tracked, result=None, err=None):
+        try:
+            if err is None:
+                tracked.outer.set_result(result)
+            else:
+                tracked.outer.set_exception(err)
+        except Exception:
+            # cancelled meanwhile (`InvalidStateError` on python 3.8+)
+            pass
+
+    def _cancel_attempts(self, tracked, outer):
+        with self._lock:
+            attempts = list(tracked.attempts)
+        for attempt in attempts:
+            attempt.cancel()
+
+
+class _ThreadAttempts(_AttemptsMixin):
+    """hedges run on their own threads, so they start right away instead of
+    waiting behind the items queued on the workers. running threads cannot
+    be stopped, so the threads of timed out calls are abandoned and replaced
+    - a hung call does not hold a worker, nor the exit"""
+    def __init__(self, func, kwargs, max_workers, delay=None, timeout=None,
+                 stats=None):
+        super().__init__(delay, timeout, stats)
+        self.workers = _Workers(max_workers)
+        self.hedge_workers = None
+        if delay is not None:
+            self.hedge_workers = _Workers(max_workers)
+        self.func = func
+        self.kwargs = kwargs
+        self.timers = _Timers()
+
+    def close(self):
+        self.timers.close()
+        self.workers.shutdown()
+        if self.hedge_workers is not None:
+            self.hedge_workers.shutdown()
+
+    def _new_future(self):
+        from concurrent.futures import Future
+        return Future()
+
+    def _start(self, tracked, first):
+        workers = self.workers if first else self.hedge_workers
+        self._add_attempt(tracked, workers.submit(self._run, tracked, first))
+
+    def _run(self, tracked, first):
+        if first:
+            self._attempt_started(tracked)
+        start = time.perf_counter()
+        output = self.func(tracked.item, **self.kwargs)
+        self._add_latency(time.perf_counter() - start)
+        return output
+
+    def _expire(self, tracked):
+        if not super()._expire(tracked):
+            return False
+
+        with self._lock:
+            attempts = list(tracked.attempts)
+        for attempt in attempts:
+            self.workers.abandon(attempt)
+            if self.hedge_workers is not None:
+                self.hedge_workers.abandon(attempt)
+        return True
+
+    def _call_later(self, delay, callback, *args):
+        self.timers.call_later(delay, callback, *args)
+
+
+class _Workers(object):
+    """runs the submitted calls on up to `size` daemon threads.
+
+    the thread of a call can be abandoned while it runs (i.e. hung), another
+    thread takes its place and it exits once the call returns. abandoned
+    threads are not waited for on `shutdown()`.
+    """
+    def __init__(self, size):
+        import queue
+
+        self.size = size
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = set()
+        self._abandoned = set()
+        self._running = {}
+
+    def submit(self, fn, *args):
+        """returns the `concurrent.futures.Future` of `fn(*args)`"""
+        from concurrent.futures import Future
+
+        fut = Future()
+        self._queue.put((fut, fn, args))
+        with self._lock:
+            if len(self._threads) < self.size:
+                self._start_thread()
+        return fut
+
+    def abandon(self, fut):
+        """replaces the thread running `fut`, if it is still running"""
+        with self._lock:
+            thread = self._running.get(fut)
+            if thread is None or thread in self._abandoned:
+                return
+            self._threads.discard(thread)
+            self._abandoned.add(thread)
+            self._start_thread()
+
+    def shutdown(self):
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start_thread(self):
+        thread = threading.Thread(target=self._work, daemon=True)
+        self._threads.add(thread)
+        thread.start()
+
+    def _work(self):
+        thread = threading.current_thread()
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            fut, fn, args = task
+            if not fut.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._running[fut] = thread
+
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+
+            with self._lock:
+                del self._running[fut]
+                if thread in self._abandoned:
+                    self._abandoned.discard(thread)
+                    return
+
+
+class _AsyncioAttempts(_AttemptsMixin):
+    """hedges do not wait for the `semaphore` bounding the first attempts.
+    timed out attempts are cancelled"""
+    def __init__(self, loop, func, kwargs, semaphore=None, delay=None,
+                 timeout=None, stats=None):
+        super().__init__(delay, timeout, stats)
+        self.loop = loop
+        self.func = func
+        self.kwargs = kwargs
+        self.semaphore = semaphore
+
+    def _new_future(self):
+        return self.loop.create_future()
+
+    def _start(self, tracked, first):
+        if first and self.semaphore is not None:
+            coro = self._bounded_run(tracked)
+        else:
+            coro = self._run(tracked, first)
+        self._add_attempt(tracked, self.loop.create_task(coro))
+
+    async def _bounded_run(self, tracked):
+        async with self.semaphore:
+            return await self._run(tracked, first=True)
+
+    async def _run(self, tracked, first):
+        if first:
+            self._attempt_started(tracked)
+        start = time.perf_counter()
+        output = await self.func(tracked.item, **self.kwargs)
+        self._add_latency(time.perf_counter() - start)
+        return output
+
+    def _call_later(self, delay, callback, *args):
+        self.loop.call_later(delay, callback, *args)
+
+
+class _Timers(object):
+    """calls callbacks after a delay from a single background thread"""
+    def __init__(self):
+        self._timers = []
+        self._counter = count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def call_later(self, delay, callback, *args):
+        deadline = time.monotonic() + delay
+        with self._cond:
+            heapq.heappush(
+                self._timers, (deadline, next(self._counter), callback, args)
+            )
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        with self._cond:
+            while not self._closed:
+                if not self._timers:
+                    self._cond.wait()
+                    continue
+
+                timeout = self._timers[0][0] - time.monotonic()
+                if timeout > 0:
+                    self._cond.wait(timeout)
+                    continue
+
+                _, _, callback, args = heapq.heappop(self._timers)
+                self._cond.release()
+                try:
+                    callback(*args)
+                finally:
+                    self._cond.acquire()
+
+
 def _future_iter(futures):
     for fut in futures:
         try:
             yield fut.result(), None
         except STOP_EXCEPTIONS:
-            raise
+            # a `StopIteration` cannot propagate out of a generator (PEP 479)
+            raise Stop()
         except Exception as e:
             yield None, e
 
 
-# TODO: add subprocess
 _runners_mapping = {
     SIMPLE: _simple_runner,
     THREAD: _thread_runner,
+    PROCESS: _process_runner,
     ASYNCIO: _asyncio_runner,
 }
@@ -1,14 +1,18 @@
-from cbox import cliparser
-
 EXECUTOR_ATTR = '_executor_type'
+STREAM_OPTIONS_ATTR = '_stream_options'
+PIPELINE_FUNCS_ATTR = '_pipeline_funcs'
 
 CMD = 'cmd'
 MULTI_CMD = 'multi-cmd'
 STREAM = 'STREAM'
+PIPELINE = 'pipeline'
 
 ERR_EXIT_CODE = 2
 
-__all__ = ('get_func_executor', 'EXECUTOR_ATTR', 'CMD', 'MULTI_CMD', 'STREAM',)
+__all__ = (
+    'get_func_executor', 'EXECUTOR_ATTR', 'STREAM_OPTIONS_ATTR',
+    'PIPELINE_FUNCS_ATTR', 'CMD', 'MULTI_CMD', 'STREAM', 'PIPELINE',
+)
 
 
 def get_func_executor(func):
@@ -26,19 +30,56 @@ def get_func_executor(func):
 
 
 def _execute_stream(func, argv, input_stream, output_stream, error_stream):
+    from cbox import cliparser
+
     parser = cliparser.get_cli_parser(func, skip_first=1)
+    cliparser.add_stream_arguments(parser)
+    func_kwargs = cliparser.parse_args(parser, argv=argv)
+
+    profile = func_kwargs.pop(cliparser.PROFILE_DEST, None)
+    profile_path = func_kwargs.pop(cliparser.PROFILE_PATH_DEST, None)
+    if profile:
+        func = _with_stream_options(
+            func, profile=profile, profile_path=profile_path,
+        )
+    return func(input_stream, output_stream, error_stream, **func_kwargs)
+
+
+def _execute_pipeline(func, argv, input_stream, output_stream,
+                      error_stream):
+    from cbox import cliparser
+
+    parser = cliparser.get_cli_pipeline_parser(
+        getattr(func, PIPELINE_FUNCS_ATTR), skip_first=1,
+        description=func.__doc__,
+    )
     func_kwargs = cliparser.parse_args(parser, argv=argv)
     return func(input_stream, output_stream, error_stream, **func_kwargs)
 
 
+def _with_stream_options(func, **options):
+    """returns the `cbox.stream` func decorated again with `options`"""
+    from cbox.cli import stream
+
+    options = dict(getattr(func, STREAM_OPTIONS_ATTR), **options)
+    return stream(**options)(func.__wrapped__)
+
+
 def _execute_cmd(func, argv, input_stream, output_stream, error_stream):
+    from cbox import cliparser
+
     parser = cliparser.get_cli_parser(func, skip_first=0)
     func_kwargs = cliparser.parse_args(parser, argv=argv)
     return func(**func_kwargs)
 
 
 def _execute_multi_cmd(funcs, argv, input_stream, output_stream, error_stream):
-    parser = cliparser.get_cli_multi_parser(funcs, skip_first=0)
+    from cbox import cliparser
+
+    # only the invoked subcommand is parsed, the rest only need a help line
+    parser = cliparser.get_cli_multi_parser(
+        funcs, skip_first=0, subcmd=cliparser.get_subcmd(argv),
+    )
     func_kwargs = cliparser.parse_args(parser, argv=argv)
     subcmd = func_kwargs.get('subcmd', None)
     if not subcmd:
@@ -54,4 +95,5 @@ _executors_mapping = {
     CMD: _execute_cmd,
     MULTI_CMD: _execute_multi_cmd,
     STREAM: _execute_stream,
+    PIPELINE: _execute_pipeline,
 }
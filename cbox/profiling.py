@@ -0,0 +1,270 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+__all__ = ('get_profiler', 'CPROFILE', 'SAMPLING', )
+
+CPROFILE = 'cprofile'
+SAMPLING = 'sampling'
+
+DEFAULT_PATHS = {
+    CPROFILE: 'cbox.prof',
+    SAMPLING: 'cbox.collapsed',
+}
+
+DEFAULT_SAMPLING_INTERVAL = 0.005
+
+
+def get_profiler(mode, path=None):
+    """returns a profiler for the calls of the user function only.
+
+    the runners wrap the function with `profiler.wrap()` (or `wrap_async()`)
+    so cbox itself is not profiled. calls on threads and worker processes
+    are aggregated and written into `path` on `profiler.close()`.
+
+    :param str mode: `cprofile` writes a `pstats` file (i.e. for
+      `python -m pstats` or snakeviz), `sampling` samples the stacks of the
+      function calls every few ms and writes them as collapsed stacks
+      (i.e. for `flamegraph.pl` or speedscope).
+    :param str path: the output file, defaults to `cbox.prof` for `cprofile`
+      and `cbox.collapsed` for `sampling`.
+    """
+    return _profilers_mapping[mode](path or DEFAULT_PATHS[mode])
+
+
+class _ProfilerMixin(object):
+    """the profilers state - per process state is (re)created on the first
+    call in each process, and dumped into `workers_dir` when worker processes
+    exit.
+
+    the classes using it profile the calls, and provide:
+
+    - `_reset()` creating the state of a new process.
+    - `_enter()` starting to profile a call on this thread, returning a
+      callable to stop.
+    - `_stop()` stopping the profiling of this process.
+    - `_write(path, workers_paths)` writing the profile of this process,
+      along with the profiles dumped by the workers, into `path`.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.workers_dir = tempfile.mkdtemp(prefix='cbox-profile-')
+        self.main_pid = os.getpid()
+        self._pid = None
+
+    def wrap(self, func):
+        """returns `func` profiling each of its calls. picklable if `func`
+        is, so it can run on process workers"""
+        return _ProfiledFunc(func, self)
+
+    def wrap_async(self, func):
+        """same as `wrap` for coroutine functions, profiling each step of
+        the coroutine but not the other tasks running while it awaits"""
+        async def profiled_func(*args, **kwargs):
+            return await _ProfiledCoroutine(func(*args, **kwargs), self)
+        return profiled_func
+
+    def enter(self):
+        """starts profiling a call on this thread, returns a callable to stop
+        (kept trivial, as it shows on the profile)"""
+        if self._pid != os.getpid():
+            self._start_process()
+        return self._enter()
+
+    def close(self):
+        """stops profiling and writes the profile of this process and the
+        worker processes into `path`"""
+        try:
+            self._stop()
+            workers_paths = [
+                os.path.join(self.workers_dir, name)
+                for name in sorted(os.listdir(self.workers_dir))
+            ]
+            self._write(self.path, workers_paths)
+        finally:
+            shutil.rmtree(self.workers_dir, ignore_errors=True)
+
+    def __getstate__(self):
+        return self.path, self.workers_dir, self.main_pid
+
+    def __setstate__(self, state):
+        self.path, self.workers_dir, self.main_pid = state
+        self._pid = None
+
+    def _start_process(self):
+        self._pid = os.getpid()
+        self._reset()
+
+        if self._pid != self.main_pid:
+            # process pool workers run the multiprocessing finalizers on exit
+            from multiprocessing.util import Finalize
+            Finalize(None, self._dump_worker, exitpriority=10)
+
+    def _dump_worker(self):
+        self._stop()
+        self._write(
+            os.path.join(self.workers_dir, '%d.out' % os.getpid()), []
+        )
+
+
+class _CProfiler(_ProfilerMixin):
+    """profiles with `cProfile`, one profile per thread running the
+    function as `cProfile` only profiles the thread enabling it"""
+    def _reset(self):
+        self._local = threading.local()
+        self._profiles = []
+
+    def _enter(self):
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            import cProfile
+            profile = self._local.profile = cProfile.Profile()
+            self._profiles.append(profile)
+
+        try:
+            profile.enable()
+        except ValueError:
+            # python 3.12+ allows a single active profiler across threads,
+            # calls overlapping the profiled one on other threads are skipped
+            pass
+        return profile.disable
+
+    def _stop(self):
+        pass
+
+    def _write(self, path, workers_paths):
+        import pstats
+
+        profiles = getattr(self, '_profiles', []) + workers_paths
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:  # nothing was profiled
+                continue
+
+        if stats is None:
+            stats = pstats.Stats()
+        stats.dump_stats(path)
+
+
+class _SamplingProfiler(_ProfilerMixin):
+    """samples the stacks of the threads running the function from a
+    background thread, counting each stack (up to the function) seen"""
+    interval = DEFAULT_SAMPLING_INTERVAL
+
+    def _reset(self):
+        self._active = {}
+        self._counts = {}
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+
+    def _enter(self):
+        ident = threading.get_ident()
+        self._active[ident] = self._active.get(ident, 0) + 1
+        return self._exit
+
+    def _exit(self):
+        ident = threading.get_ident()
+        depth = self._active.pop(ident) - 1
+        if depth:
+            self._active[ident] = depth
+
+    def _stop(self):
+        if self._pid is not None:
+            self._stopped.set()
+            self._sampler.join()
+
+    def _sample_loop(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self._active):
+                frame = frames.get(ident)
+                stack = _collapse_stack(frame)
+                if stack:
+                    self._counts[stack] = self._counts.get(stack, 0) + 1
+
+    def _write(self, path, workers_paths):
+        counts = dict(getattr(self, '_counts', {}))
+        for worker_path in workers_paths:
+            with open(worker_path) as fp:
+                for line in fp:
+                    stack, count = line.rsplit(' ', 1)
+                    counts[stack] = counts.get(stack, 0) + int(count)
+
+        with open(path, 'w') as fp:
+            for stack, count in sorted(counts.items()):
+                fp.write('%s %d\n' % (stack, count))
+
+
+class _ProfiledFunc(object):
+    def __init__(self, func, profiler):
+        self.func = func
+        self.profiler = profiler
+
+    def __call__(self, *args, **kwargs):
+        exit_call = self.profiler.enter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            exit_call()
+
+
+class _ProfiledCoroutine(object):
+    def __init__(self, coro, profiler):
+        self.coro = coro
+        self.profiler = profiler
+
+    def __await__(self):
+        return _profiled_steps(self.coro, self.profiler)
+
+
+def _profiled_steps(coro, profiler):
+    """drives `coro` profiling each of its steps"""
+    value = exc = None
+    while True:
+        exit_step = profiler.enter()
+        try:
+            if exc is None:
+                yielded = coro.send(value)
+            else:
+                yielded = coro.throw(exc)
+        except StopIteration as e:
+            return e.value
+        finally:
+            exit_step()
+
+        try:
+            value, exc = (yield yielded), None
+        except GeneratorExit:
+            coro.close()
+            raise
+        except BaseException as e:
+            value, exc = None, e
+
+
+# the stacks are collapsed up to the frames running the function
+_PROFILED_CODES = (_ProfiledFunc.__call__.__code__, _profiled_steps.__code__)
+
+
+def _collapse_stack(frame):
+    stack = []
+    while frame is not None and frame.f_code not in _PROFILED_CODES:
+        code = frame.f_code
+        stack.append('%s (%s:%d)' % (
+            code.co_name, code.co_filename, code.co_firstlineno,
+        ))
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+_profilers_mapping = {
+    CPROFILE: _CProfiler,
+    SAMPLING: _SamplingProfiler,
+}
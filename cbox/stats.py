@@ -0,0 +1,279 @@
+import json
+import math
+import threading
+import time
+from os import linesep
+
+__all__ = ('StatsCollector', 'DEFAULT_STATS_INTERVAL', )
+
+DEFAULT_STATS_INTERVAL = 1.0
+
+# latencies are counted into log scale buckets, each about 5% wider than the
+# previous one - so percentiles are kept in constant memory for any input size
+_BUCKETS_SCALE = 20
+_MIN_BUCKET = -20 * _BUCKETS_SCALE
+_PERCENTILES = (50, 90, 99)
+
+
+class StatsCollector(object):
+    """collects the runtime metrics of a stream run - items in and out,
+    errors, hedged items, per item latency, workers busy time, tasks in
+    flight and time blocked on reading the input and writing the output.
+
+    the runners, input and output hooks are only installed when collecting,
+    so there is no cost when stats are disabled.
+
+    :param int workers: how many workers run the function in parallel, for
+      telling their busy and idle time.
+    """
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.started = time.perf_counter()
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.hedges = 0
+        self.bytes_out = 0
+        self.read_time = 0.0
+        self.write_time = 0.0
+        self.calls = 0
+        self.busy_time = 0.0
+        self.max_latency = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._in_flight_total = 0
+        self._in_flight_samples = 0
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._reporter = None
+        self._stopped = threading.Event()
+
+    def read_items(self, items):
+        """iterates `items` counting them and the time blocked on reading"""
+        items = iter(items)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.read_time += clock() - start
+                return
+            self.read_time += clock() - start
+            self.items_in += 1
+            yield item
+
+    def count_outputs(self, output):
+        """iterates the runner `output` counting the outputs and errors"""
+        for outlines, err in output:
+            if err is None:
+                self.items_out += 1
+            else:
+                self.errors += 1
+            yield outlines, err
+
+    def timed(self, func):
+        """returns `func` recording the latency of each call"""
+        clock = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add_latency(clock() - start)
+        return timed_func
+
+    def timed_async(self, func):
+        """same as `timed` for coroutine functions"""
+        clock = time.perf_counter
+
+        async def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add_latency(clock() - start)
+        return timed_func
+
+    def timed_remote(self, output):
+        """records the latencies `timed_call` returned along the outputs of
+        process workers"""
+        for timed_output, err in output:
+            if err is not None:
+                yield None, err
+                continue
+
+            outlines, seconds = timed_output
+            self.add_latency(seconds)
+            yield outlines, None
+
+    def timed_writes(self, stream):
+        """returns `stream` counting the time blocked on writing into it"""
+        return _TimedWriter(stream, self)
+
+    def add_latency(self, seconds):
+        if seconds > 0:
+            bucket = max(
+                math.floor(math.log(seconds) * _BUCKETS_SCALE), _MIN_BUCKET
+            )
+        else:
+            bucket = _MIN_BUCKET
+
+        # called from the worker threads too
+        with self._lock:
+            self.calls += 1
+            self.busy_time += seconds
+            self.max_latency = max(self.max_latency, seconds)
+            self._latencies[bucket] = self._latencies.get(bucket, 0) + 1
+
+    def queue_depth(self, depth):
+        """samples how many tasks are in flight"""
+        self.in_flight = depth
+        self.max_in_flight = max(self.max_in_flight, depth)
+        self._in_flight_total += depth
+        self._in_flight_samples += 1
+
+    def percentile(self, percent):
+        """returns the approximate `percent` percentile of the latencies"""
+        with self._lock:
+            latencies = sorted(self._latencies.items())
+            calls = self.calls
+
+        rank = math.ceil(calls * percent / 100.0)
+        seen = 0
+        for bucket, count in latencies:
+            seen += count
+            if seen >= rank:
+                latency = math.exp((bucket + 0.5) / _BUCKETS_SCALE)
+                return min(latency, self.max_latency)
+        return 0.0
+
+    def snapshot(self):
+        """returns the stats collected so far as a dict"""
+        elapsed = time.perf_counter() - self.started
+        worker_time = elapsed * self.workers
+        avg_in_flight = self._in_flight_total / self._in_flight_samples \
+            if self._in_flight_samples else 0.0
+
+        return {
+            'elapsed': elapsed,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'errors': self.errors,
+            'hedges': self.hedges,
+            'bytes_out': self.bytes_out,
+            'items_in_per_sec': _rate(self.items_in, elapsed),
+            'items_out_per_sec': _rate(self.items_out, elapsed),
+            'latency': dict(
+                [('p%d' % p, self.percentile(p)) for p in _PERCENTILES],
+                max=self.max_latency,
+                mean=self.busy_time / self.calls if self.calls else 0.0,
+            ),
+            'workers': self.workers,
+            'workers_busy': self.busy_time,
+            'workers_idle': max(worker_time - self.busy_time, 0.0),
+            'workers_utilization': min(
+                self.busy_time / worker_time if worker_time else 0.0, 1.0
+            ),
+            'in_flight': self.in_flight,
+            'in_flight_avg': avg_in_flight,
+            'in_flight_max': self.max_in_flight,
+            'read_blocked': self.read_time,
+            'write_blocked': self.write_time,
+        }
+
+    def summary(self):
+        """returns a human readable summary of the stats"""
+        stats = self.snapshot()
+        latency = ' '.join(
+            '%s %s' % (name, _format_seconds(stats['latency'][name]))
+            for name in ['p%d' % p for p in _PERCENTILES] + ['max']
+        )
+        lines = [
+            'cbox stats:',
+            '  elapsed        %s' % _format_seconds(stats['elapsed']),
+            '  items in       %d (%.1f/s)' % (
+                stats['items_in'], stats['items_in_per_sec']),
+            '  items out      %d (%.1f/s)' % (
+                stats['items_out'], stats['items_out_per_sec']),
+            '  errors         %d' % stats['errors'],
+            '  hedges         %d' % stats['hedges'],
+            '  latency        %s' % latency,
+            '  workers        %d, %.1f%% busy (%s busy, %s idle)' % (
+                stats['workers'], stats['workers_utilization'] * 100,
+                _format_seconds(stats['workers_busy']),
+                _format_seconds(stats['workers_idle'])),
+            '  in flight      avg %.1f, max %d' % (
+                stats['in_flight_avg'], stats['in_flight_max']),
+            '  read blocked   %s' % _format_seconds(stats['read_blocked']),
+            '  write blocked  %s' % _format_seconds(stats['write_blocked']),
+        ]
+        return linesep.join(lines) + linesep
+
+    def report_periodically(self, stream, interval=DEFAULT_STATS_INTERVAL):
+        """writes a json line of the stats into `stream` every `interval`
+        seconds until `stop()` is called"""
+        self._reporter = threading.Thread(
+            target=self._report_loop, args=(stream, interval), daemon=True,
+        )
+        self._reporter.start()
+
+    def stop(self):
+        """stops the periodic reports"""
+        self._stopped.set()
+        if self._reporter is not None:
+            self._reporter.join()
+
+    def write_json(self, stream):
+        stream.write(json.dumps(self.snapshot(), sort_keys=True) + '\n')
+        stream.flush()
+
+    def _report_loop(self, stream, interval):
+        while not self._stopped.wait(interval):
+            self.write_json(stream)
+
+
+class _TimedWriter(object):
+    """wraps a writable stream counting the time blocked on its writes"""
+    def __init__(self, stream, stats):
+        self._stream = stream
+        self._stats = stats
+
+    def write(self, data):
+        start = time.perf_counter()
+        try:
+            return self._stream.write(data)
+        finally:
+            self._stats.write_time += time.perf_counter() - start
+            self._stats.bytes_out += len(data)
+
+    def flush(self):
+        start = time.perf_counter()
+        try:
+            return self._stream.flush()
+        finally:
+            self._stats.write_time += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def timed_call(func, item, **kwargs):
+    """calls `func` returning its output along the time it took, for
+    process workers where the latency is recorded back on the main process"""
+    start = time.perf_counter()
+    output = func(item, **kwargs)
+    return output, time.perf_counter() - start
+
+
+def _rate(count, elapsed):
+    return count / elapsed if elapsed else 0.0
+
+
+def _format_seconds(seconds):
+    if seconds >= 1:
+        return '%.3fs' % seconds
+    if seconds >= 1e-3:
+        return '%.3fms' % (seconds * 1e3)
+    return '%.3fus' % (seconds * 1e6)
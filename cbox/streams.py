@@ -1,3 +1,12 @@
+import codecs
+import io
+import mmap
+import os
+import stat
+import threading
+from functools import partial
+from itertools import chain
+from operator import itemgetter
 from os import linesep
 
 from . import utils
@@ -5,78 +14,816 @@ from . import utils
 LINES = 'lines'
 CHARS = 'chars'
 RAW = 'raw'
+BYTES_LINES = 'bytes_lines'
+RECORDS = 'records'
+JSONL = 'jsonl'
+FIELDS = 'fields'
 
 EXIT_OK = 0
 EXIT_ERROR = 2
 
+DEFAULT_BLOCK_SIZE = 64 * 1024
+DEFAULT_BUFFER_SIZE = 64 * 1024
+SHARD_MAX_SIZE = 16 * 1024 * 1024
+DEFAULT_DELIMITER = '\t'
+
+_BINARY_LINESEP = linesep.encode()
+_SINGLE_OUTPUT_TYPES = (str, bytes, bytearray, memoryview)
+
 __all__ = (
-    'get_input_parser', 'get_output_parser', 'LINES', 'CHARS', 'EXIT_OK',
-    'EXIT_ERROR',
+    'get_input_parser', 'get_output_parser', 'get_input_shards',
+    'iter_output_items', 'parse_fields', 'LINES', 'CHARS', 'RAW',
+    'BYTES_LINES', 'RECORDS', 'JSONL', 'FIELDS', 'EXIT_OK', 'EXIT_ERROR',
 )
 
+# the json functions picked by `_json_backend` on first use
+_json = None
+_json_scan = None
+
+
+def get_input_parser(input_type, **options):
+    """returns the input parser for `input_type`.
+
+    :param str input_type: how to split the input stream.
+    :param options: extra options for the parser (i.e. `record_size`),
+      options set to `None` are ignored.
+    :raises ValueError: if an option is not one of the parser's.
+    """
+    parser = _input_mapping[input_type]
+    options = {k: v for k, v in options.items() if v is not None}
+    # the options are keyword-only arguments of the parsers
+    unknown = sorted(set(options) - set(parser.__kwdefaults__ or ()))
+    if unknown:
+        raise ValueError('%s input does not take %s' % (
+            input_type or LINES, ', '.join(unknown),
+        ))
+    if options:
+        parser = partial(parser, **options)
+    return parser
+
+
+def get_input_shards(input_stream, input_type, shards, record_size=None,
+                     block_size=None):
+    """splits a regular file input into byte ranges to be read in parallel.
+
+    ranges are aligned to lines (or records) and are no bigger than
+    `SHARD_MAX_SIZE`, so results can be sent back range by range.
+
+    :param input_stream: the input stream, must be backed by a regular file.
+    :param str input_type: one of `lines`, `bytes_lines`, `records` or
+      `jsonl`.
+    :param int shards: how many parallel readers the ranges are split for.
+    :param int record_size: the size of each record for `records` input.
+    :param int block_size: the size of the blocks ranges are read by.
+    :return: tuple of a picklable `read_shard(shard)` function returning the
+      input items of a range and a list of the ranges (shards). `None` if
+      the input cannot be sharded (i.e. a pipe or `chars` input type).
+    """
+    if input_type not in (None, LINES, BYTES_LINES, RECORDS, JSONL):
+        return None
+
+    encoding = getattr(input_stream, 'encoding', None) or 'utf-8'
+    if input_type in (None, LINES) and not _is_ascii_newline(encoding):
+        return None
+
+    path = _input_path(input_stream)
+    mapped = _mmap_input(input_stream) if path else None
+    if mapped is None:
+        return None
+
+    mm, start = mapped
+    if input_type == RECORDS:
+        if not record_size:
+            raise ValueError('record_size is required for %s input' % RECORDS)
+        align = partial(_align_record, start, record_size)
+    else:
+        align = partial(_align_line, mm)
+
+    read_shard = partial(
+        _read_shard,
+        input_type=input_type,
+        encoding=encoding,
+        errors=getattr(input_stream, 'errors', None) or 'strict',
+        record_size=record_size,
+        block_size=block_size or DEFAULT_BLOCK_SIZE,
+    )
+    ranges = _shard_ranges(start, len(mm), shards, align)
+    return read_shard, [(path, begin, end) for begin, end in ranges]
+
+
+def iter_output_items(output, output_type, errors):
+    """yields the outputs of a runner as python objects, to pass them as the
+    input items of another function. like the writer of `output_type` -
+    `None`s are skipped and lists, tuples and generators are flattened into
+    their items, except for `jsonl` values and `fields` rows (tuples).
+
+    :param output: the runner output, `(output, error)` tuples.
+    :param str output_type: the output type whose writer is followed.
+    :param errors: the errors of `output` are appended into it.
+    """
+    for out, err in output:
+        if err is not None:
+            errors.append(err)
+        if out is None:
+            continue
+
+        multiple = hasattr(out, '__next__')
+        if isinstance(out, (list, tuple)):
+            multiple = output_type != FIELDS
+        if multiple and output_type != JSONL:
+            yield from (item for item in out if item is not None)
+        else:
+            yield out
 
-def get_input_parser(input_type):
-    return _input_mapping[input_type]
 
+def parse_fields(fields):
+    """parses the 1-based numbers of the `fields` to select (like `cut -f`).
 
-def get_output_parser(output_type, input_type=None):
+    :param fields: an iterable of `int`, or a `str` of comma separated
+      numbers and ranges (i.e. `1,4,7` or `2-5`).
+    :rtype: tuple
+    :raises ValueError: on numbers that are not positive or invalid ranges.
+    """
+    if isinstance(fields, str):
+        numbers = []
+        for part in fields.split(','):
+            first, dash, last = part.partition('-')
+            if dash:
+                if int(first) > int(last):
+                    raise ValueError('invalid fields range - "%s"' % part)
+                numbers.extend(range(int(first), int(last) + 1))
+            else:
+                numbers.append(int(part))
+        fields = numbers
+
+    fields = tuple(int(field) for field in fields)
+    if not fields or min(fields) < 1:
+        raise ValueError('fields are numbered from 1 - "%s"' % (fields, ))
+    return fields
+
+
+def get_output_parser(output_type, input_type=None, line_buffered=None,
+                      flush_interval=None, stats=None, errors=None,
+                      delimiter=None, dialect=None):
+    """returns the output writer for `output_type`.
+
+    :param str output_type: how to write into the output stream.
+    :param str input_type: used as the output type when `output_type` is
+      not specified.
+    :param bool line_buffered: write and flush every output instead of
+      buffering them into large writes. if `None`, only when writing to a tty.
+    :param float flush_interval: if set, flush the buffered output at least
+      once every `flush_interval` seconds.
+    :param cbox.stats.StatsCollector stats: if set, counts the outputs,
+      errors and the time blocked on writing into it.
+    :param str errors: how to report errors into the error stream, see
+      `utils.get_error_reporter` (default `full` tracebacks).
+    :param str delimiter: the delimiter `fields` outputs are joined by.
+    :param str dialect: the csv dialect `fields` outputs are written in.
+    """
     # set output type same as input type when not specified
     output_type = output_type or input_type
-    return _output_mapping[output_type]
+    writer = _output_mapping[output_type]
+    if output_type == FIELDS:
+        writer = partial(writer, delimiter=delimiter, dialect=dialect)
+    return partial(
+        writer,
+        line_buffered=line_buffered,
+        flush_interval=flush_interval,
+        stats=stats,
+        errors=errors,
+    )
+
+
+def _input_lines(input_stream, *, block_size=DEFAULT_BLOCK_SIZE,
+                 use_mmap=None):
+    blocks = _read_blocks(input_stream, block_size, use_mmap)
+    return _split_blocks(blocks, '\n')
+
+
+def _input_chars(input_stream, *, block_size=DEFAULT_BLOCK_SIZE,
+                 use_mmap=None):
+    blocks = _read_blocks(input_stream, block_size, use_mmap)
+    return chain.from_iterable(blocks)
+
+
+def _input_raw(input_stream, *, block_size=None, use_mmap=None):
+    # `block_size` is accepted but unused, the function reads the stream
+    # unlike the other input types, only when explicitly asked for since the
+    # function gets a single buffer of the whole file instead of the stream
+    mapped = _mmap_input(input_stream) if use_mmap else None
+    if mapped is None:
+        return input_stream
+
+    mm, start = mapped
+    return iter([memoryview(mm)[start:]])
+
+
+def _input_bytes_lines(input_stream, *, block_size=DEFAULT_BLOCK_SIZE,
+                       use_mmap=None):
+    blocks = _read_binary_blocks(input_stream, block_size, use_mmap)
+    lines = _split_blocks(blocks, b'\n')
+    if _BINARY_LINESEP != b'\n':
+        lines = (line.rstrip(b'\r') for line in lines)
+    return lines
+
+
+def _input_records(input_stream, *, record_size=None,
+                   block_size=DEFAULT_BLOCK_SIZE, use_mmap=None):
+    if not record_size:
+        raise ValueError('record_size is required for %s input' % RECORDS)
+
+    mapped = _mmap_input(input_stream) if use_mmap is not False else None
+    if mapped is not None:
+        mm, start = mapped
+        return _mmap_records(mm, start, len(mm), record_size)
+
+    blocks = _read_binary_blocks(
+        input_stream, max(block_size, record_size), use_mmap=False,
+    )
+    return _split_records(blocks, record_size)
+
+
+def _input_jsonl(input_stream, *, block_size=DEFAULT_BLOCK_SIZE,
+                 use_mmap=None):
+    if _binary_stream(input_stream) is input_stream and \
+            isinstance(input_stream, io.TextIOBase):
+        # not backed by a binary stream (i.e. `StringIO`), or read from
+        blocks = _read_blocks(input_stream, block_size, use_mmap)
+        return _decode_json_blocks(blocks, text=True)
+
+    blocks = _read_binary_blocks(input_stream, block_size, use_mmap)
+    return _decode_json_blocks(blocks)
+
+
+def _decode_json_blocks(blocks, text=False):
+    """yields the json values of the lines of `blocks` (utf-8 if bytes),
+    skipping blank lines. the lines are split and decoded block by block"""
+    loads, _, binary = _json_backend()
+    sep = b'\n'
+    if text or not binary:
+        sep = '\n'
+    if not text and not binary:
+        # the stdlib decodes `str` only, so whole blocks are decoded at once
+        blocks = _decode_utf8_blocks(blocks)
+
+    for lines in _split_blocks_lines(blocks, sep):
+        for line in lines:
+            if line and not line.isspace():
+                yield loads(line)
+
+
+def _decode_utf8_blocks(blocks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for block in blocks:
+        yield decoder.decode(block)
+    yield decoder.decode(b'', final=True)
+
+
+def _json_backend():
+    """returns the `(loads, dumps, binary)` json functions - of `orjson` if
+    installed as it is several times faster, else of the stdlib `json`.
+    `binary` is True if they work on `bytes` (`orjson`) rather than `str`"""
+    global _json, _json_scan
+
+    if _json is None:
+        try:
+            import orjson
+            _json = orjson.loads, orjson.dumps, True
+        except ImportError:
+            import json
+            from json.scanner import make_scanner
+
+            _json_scan = make_scanner(json.JSONDecoder())
+            dumps = partial(
+                json.dumps, ensure_ascii=False, separators=(',', ':'),
+            )
+            _json = _stdlib_loads, dumps, False
+    return _json
+
+
+def _stdlib_loads(line):
+    """`json.loads` skipping its per call overhead for lines holding just a
+    json value (the usual case), using the C scanner it runs on"""
+    try:
+        value, end = _json_scan(line, 0)
+    except StopIteration:
+        end = None
+    if end != len(line):
+        # surrounding whitespace, or invalid for the error message
+        import json
+        return json.loads(line)
+    return value
+
+
+def _input_fields(input_stream, *, delimiter=None, fields=None,
+                  dialect=None, block_size=DEFAULT_BLOCK_SIZE, use_mmap=None):
+    lines = _input_lines(input_stream, block_size=block_size,
+                         use_mmap=use_mmap)
+    columns = None
+    if fields is not None:
+        columns = [field - 1 for field in parse_fields(fields)]
+
+    if dialect is not None:
+        # quoted fields, so every column is parsed (by the C csv reader)
+        import csv
+        fmt = {} if delimiter is None else {'delimiter': delimiter}
+        rows = csv.reader(lines, dialect, **fmt)
+    else:
+        delimiter = delimiter or DEFAULT_DELIMITER
+        if columns is None:
+            return (tuple(line.split(delimiter)) for line in lines)
+        # split no further than the last selected column
+        rows = (line.split(delimiter, max(columns) + 1) for line in lines)
+
+    if columns is None:
+        return map(tuple, rows)
+    return _select_fields(rows, columns)
+
+
+def _select_fields(rows, columns):
+    """yields a tuple of the `columns` of each row, missing columns of short
+    rows are empty (like awk)"""
+    width = max(columns) + 1
+    select = itemgetter(*columns)
+    if len(columns) == 1:
+        # `itemgetter` of a single column returns it rather than a tuple
+        select = _single_field(select)
+
+    for row in rows:
+        if len(row) < width:
+            row = row + [''] * (width - len(row))
+        yield select(row)
+
+
+def _single_field(select):
+    def select_tuple(row):
+        return select(row),
+    return select_tuple
+
+
+def _read_blocks(input_stream, block_size, use_mmap=None):
+    """yields decoded blocks of text of up to `block_size` chars.
+
+    reads whatever is available (up to `block_size`) from the underlying
+    binary stream, so interactive input is not held until a block is full.
+    regular files are memory mapped instead (unless `use_mmap` is False).
+    """
+    encoding = getattr(input_stream, 'encoding', None)
+    if use_mmap is not False and encoding and _is_ascii_newline(encoding):
+        mapped = _mmap_input(input_stream)
+        if mapped is not None:
+            mm, start = mapped
+            return _decode_mapped_blocks(
+                mm, start, len(mm), block_size, encoding, input_stream.errors,
+            )
+
+    read1 = getattr(_binary_stream(input_stream), 'read1', None)
+    if read1 is None:
+        # not backed by a binary stream (i.e. `StringIO`), or read from
+        return iter(partial(input_stream.read, block_size), '')
+
+    decoder = codecs.getincrementaldecoder(input_stream.encoding)
+    decoder = io.IncrementalNewlineDecoder(
+        decoder(input_stream.errors), translate=True,
+    )
+    return _decode_blocks(read1, decoder, block_size)
+
+
+def _decode_blocks(read1, decoder, block_size):
+    while True:
+        data = read1(block_size)
+        block = decoder.decode(data, final=not data)
+        if block:
+            yield block
+        if not data:
+            return
+
+
+def _read_binary_blocks(input_stream, block_size, use_mmap=None):
+    """yields blocks of up to `block_size` bytes as soon as available"""
+    mapped = _mmap_input(input_stream) if use_mmap is not False else None
+    if mapped is not None:
+        mm, start = mapped
+        return _mmap_blocks(mm, start, len(mm), block_size)
+
+    input_stream = _binary_stream(input_stream)
+    if isinstance(input_stream, io.TextIOBase):
+        # its text is encoded back, as the bytes it was decoded from are gone
+        encoding = input_stream.encoding or 'utf8'
+        blocks = iter(partial(input_stream.read, block_size), '')
+        return (block.encode(encoding, input_stream.errors or 'strict')
+                for block in blocks)
+
+    read = getattr(input_stream, 'read1', input_stream.read)
+    return iter(partial(read, block_size), b'')
+
 
+def _mmap_input(input_stream):
+    """memory maps `input_stream` if it is a regular file.
 
-def _input_lines(input_stream):
-    for line in input_stream:
-        yield line.rstrip(linesep)
+    :return: tuple of the read-only mmap and the current position of the
+      stream in it, or `None` if the stream cannot be mapped.
+    """
+    try:
+        fd = input_stream.fileno()
+        file_stat = os.fstat(fd)
+    except (AttributeError, OSError, ValueError):
+        return None
 
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
 
-def _input_chars(input_stream):
-    char = input_stream.read(1)
-    while char != '':
-        yield char
-        char = input_stream.read(1)
+    try:
+        # the logical position, the file descriptor is ahead of it by what
+        # the stream buffered
+        start = input_stream.tell()
+    except (AttributeError, OSError):
+        # i.e. while iterating a text stream
+        return None
+    if start >> 64:
+        # a text stream position along with its decoder state
+        return None
+    if start >= file_stat.st_size:
+        return None
 
+    mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    return mm, start
 
-def _input_raw(input_stream):
-    return input_stream
 
+def _mmap_blocks(mm, start, end, block_size):
+    """yields blocks of about `block_size` bytes out of `mm[start:end]`.
 
-def _output_lines(output_stream, err_stream, output):
-    return _output_writer(output_stream, err_stream, output, sep=linesep)
+    blocks end right after a newline (except the last one), so no line
+    spans over two blocks.
+    """
+    while start < end:
+        stop = start + block_size
+        if stop < end:
+            newline = mm.rfind(b'\n', start, stop)
+            if newline == -1:
+                newline = mm.find(b'\n', stop, end)
+            stop = end if newline == -1 else newline + 1
+        else:
+            stop = end
 
+        yield mm[start:stop]
+        start = stop
 
-def _output_chars(output_stream, err_stream, output):
-    return _output_writer(output_stream, err_stream, output, sep=None)
 
+def _mmap_records(mm, start, end, record_size):
+    """returns the records of `mm[start:end]`, sliced straight out of it"""
+    slices = map(
+        slice,
+        range(start, end, record_size),
+        range(start + record_size, end + record_size, record_size),
+    )
+    return map(mm.__getitem__, slices)
+
+
+def _decode_mapped_blocks(mm, start, end, block_size, encoding, errors):
+    for block in _mmap_blocks(mm, start, end, block_size):
+        block = block.decode(encoding, errors)
+        if '\r' in block:
+            # universal newlines - same as text streams
+            block = block.replace('\r\n', '\n').replace('\r', '\n')
+        yield block
+
+
+def _input_path(input_stream):
+    """returns the path of the regular file `input_stream` reads, or None"""
+    try:
+        file_stat = os.fstat(input_stream.fileno())
+    except (AttributeError, OSError, ValueError):
+        return None
+
+    fd_path = '/proc/self/fd/%d' % input_stream.fileno()
+    for path in (getattr(input_stream, 'name', None), fd_path):
+        if not isinstance(path, str):
+            continue
+        path = os.path.realpath(path)
+        try:
+            if os.path.samestat(os.stat(path), file_stat):
+                return path
+        except OSError:
+            continue
+    return None
+
+
+def _shard_ranges(start, end, shards, align):
+    size = -(-(end - start) // shards)
+    size = max(min(size, SHARD_MAX_SIZE), 1)
+
+    ranges = []
+    while start < end:
+        stop = start + size
+        stop = end if stop >= end else min(align(stop), end)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _align_line(mm, pos):
+    newline = mm.find(b'\n', pos)
+    return len(mm) if newline == -1 else newline + 1
+
+
+def _align_record(start, record_size, pos):
+    return pos + (start - pos) % record_size
+
+
+def _read_shard(shard, *, input_type, encoding, errors, record_size,
+                block_size):
+    path, start, end = shard
+    with open(path, 'rb') as fp:
+        mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if input_type == RECORDS:
+        return _mmap_records(mm, start, end, record_size)
+
+    if input_type == JSONL:
+        return _decode_json_blocks(_mmap_blocks(mm, start, end, block_size))
+
+    if input_type == BYTES_LINES:
+        lines = _split_blocks(_mmap_blocks(mm, start, end, block_size), b'\n')
+        if _BINARY_LINESEP != b'\n':
+            lines = (line.rstrip(b'\r') for line in lines)
+        return lines
+
+    blocks = _decode_mapped_blocks(
+        mm, start, end, block_size, encoding, errors,
+    )
+    return _split_blocks(blocks, '\n')
+
+
+def _is_ascii_newline(encoding):
+    """True if a newline is encoded as a single newline byte in `encoding`
+    (i.e. not utf-16), so the encoded text can be split by it"""
+    return '\n'.encode(encoding) == b'\n'
+
+
+def _split_blocks(blocks, sep):
+    """splits `blocks` by `sep`, joining pieces spanning over blocks"""
+    return chain.from_iterable(_split_blocks_lines(blocks, sep))
+
+
+def _split_blocks_lines(blocks, sep):
+    """same as `_split_blocks`, yielding a list of the pieces per block"""
+    rest = None
+    for block in blocks:
+        pieces = block.split(sep)
+        if rest:
+            pieces[0] = rest + pieces[0]
+        rest = pieces.pop()
+        yield pieces
+
+    if rest:
+        yield [rest]
+
+
+def _split_records(blocks, record_size):
+    """splits `blocks` into records of `record_size` (last may be shorter)"""
+    rest = b''
+    for block in blocks:
+        if rest:
+            block = rest + block
+        end = len(block) - len(block) % record_size
+        slices = map(
+            slice,
+            range(0, end, record_size),
+            range(record_size, end + 1, record_size),
+        )
+        yield from map(block.__getitem__, slices)
+        rest = block[end:]
+
+    if rest:
+        yield rest
+
+
+def _binary_stream(stream):
+    """returns the underlying binary stream of a text stream (i.e. stdin), or
+    `stream` itself if it has none or was read from already - the text
+    stream buffers ahead, so reading the binary stream would skip that"""
+    buffer = getattr(stream, 'buffer', None)
+    if buffer is None or not _unread(stream):
+        return stream
+    return buffer
+
+
+def _unread(text_stream):
+    """returns whether nothing was read from `text_stream` yet"""
+    try:
+        # only allowed before the first read (or once all of it was read)
+        text_stream.reconfigure(errors=text_stream.errors)
+    except (AttributeError, io.UnsupportedOperation):
+        return False
+    return True
+
+
+def _output_lines(output_stream, err_stream, output, **options):
+    return _output_writer(
+        output_stream, err_stream, output, sep=linesep, **options
+    )
+
+
+def _output_chars(output_stream, err_stream, output, **options):
+    return _output_writer(
+        output_stream, err_stream, output, sep=None, **options
+    )
+
+
+def _output_bytes_lines(output_stream, err_stream, output, **options):
+    return _output_binary(
+        output_stream, err_stream, output, sep=_BINARY_LINESEP, **options
+    )
+
+
+def _output_records(output_stream, err_stream, output, **options):
+    return _output_binary(
+        output_stream, err_stream, output, sep=None, **options
+    )
+
+
+def _output_jsonl(output_stream, err_stream, output, **options):
+    _, dumps, binary = _json_backend()
+    output = _dump_outputs(output, dumps)
+    if not binary:
+        return _output_writer(
+            output_stream, err_stream, output, sep=linesep, **options
+        )
+
+    if not hasattr(output_stream, 'buffer') and \
+            isinstance(output_stream, io.TextIOBase):
+        # not backed by a binary stream (i.e. `StringIO`)
+        output = ((_decode_output(out), err) for out, err in output)
+        return _output_writer(
+            output_stream, err_stream, output, sep=linesep, **options
+        )
+    return _output_binary(
+        output_stream, err_stream, output, sep=_BINARY_LINESEP, **options
+    )
+
+
+def _output_fields(output_stream, err_stream, output, *, delimiter=None,
+                   dialect=None, **options):
+    output = _join_fields(output, delimiter, dialect)
+    return _output_writer(
+        output_stream, err_stream, output, sep=linesep, **options
+    )
+
+
+def _join_fields(output, delimiter, dialect):
+    """joins each `tuple` (or `list`) output into a line of its fields"""
+    if dialect is None:
+        delimiter = delimiter or DEFAULT_DELIMITER
+
+        def join(row):
+            return delimiter.join(map(str, row))
+    else:
+        import csv
+        fmt = {} if delimiter is None else {'delimiter': delimiter}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, dialect, lineterminator='', **fmt)
+
+        def join(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue()
+
+    for out, err in output:
+        if isinstance(out, (tuple, list)):
+            out = join(out)
+        yield out, err
+
+
+def _dump_outputs(output, dumps):
+    """serializes each output of the runner into a json line, serializing
+    errors are reported as the output errors"""
+    for out, err in output:
+        if out is not None:
+            try:
+                out = dumps(out)
+            except (TypeError, ValueError) as e:
+                out, err = None, err or e
+        yield out, err
+
+
+def _decode_output(out):
+    return out if out is None else out.decode('utf8')
+
+
+def _output_binary(output_stream, err_stream, output, sep, **options):
+    if hasattr(output_stream, 'buffer'):
+        # text written so far must come before our bytes
+        output_stream.flush()
+        output_stream = output_stream.buffer
+    return _output_writer(
+        output_stream, err_stream, output, sep=sep, empty=b'', **options
+    )
+
+
+def _output_writer(output_stream, err_stream, output, sep, empty='', *,
+                   line_buffered=None, flush_interval=None, stats=None,
+                   errors=None):
+    """writes the runner `output` into `output_stream` and its errors into
+    `err_stream`. returns the exitcode.
+
+    outputs are joined into writes of about `DEFAULT_BUFFER_SIZE`, or written
+    and flushed one by one if `line_buffered`.
+    """
+    if line_buffered is None:
+        line_buffered = _isatty(output_stream)
+    buffer_size = 0 if line_buffered else DEFAULT_BUFFER_SIZE
+
+    if stats is not None:
+        output_stream = stats.timed_writes(output_stream)
+        output = stats.count_outputs(output)
+
+    # full tracebacks are followed by a line separator, only for line outputs
+    report_error = utils.get_error_reporter(
+        errors, err_stream, linesep if sep is not None else None,
+    )
+
+    pieces = []
+    append = pieces.append
+    lock = threading.Lock()
+
+    def flush(flush_stream):
+        # called from the interval thread too, hence the lock
+        with lock:
+            chunk = pieces[:]
+            del pieces[:len(chunk)]
+            if chunk:
+                output_stream.write(empty.join(chunk))
+            if flush_stream:
+                output_stream.flush()
+
+    if flush_interval:
+        stopped = threading.Event()
+        flusher = threading.Thread(
+            target=_flush_periodically,
+            args=(flush, flush_interval, stopped),
+            daemon=True,
+        )
+        flusher.start()
 
-def _output_writer(output_stream, err_stream, output, sep):
     exitcode = EXIT_OK
+    size = 0
 
-    for outlines, err in output:
-        # outlines can be iterable, str or None
-        if outlines is None or isinstance(outlines, str):
-            outlines = (outlines, )
+    try:
+        for outlines, err in output:
+            # outlines can be iterable, str, bytes or None
+            if outlines is None or isinstance(outlines, _SINGLE_OUTPUT_TYPES):
+                outlines = (outlines, )
 
-        for outline in outlines:
-            if outline is not None:
-                output_stream.write(outline)
-                if sep is not None:
-                    output_stream.write(sep)
+            for outline in outlines:
+                if outline is not None:
+                    append(outline)
+                    if sep is not None:
+                        append(sep)
+                    size += len(outline) + 1
 
-        if err is not None:
-            err_stream.write(utils.error2str(err))
-            if sep is not None:
-                err_stream.write(linesep)
-            exitcode = EXIT_ERROR
+            if err is not None:
+                report_error(err)
+                exitcode = EXIT_ERROR
+
+            if size > buffer_size:
+                flush(line_buffered)
+                size = 0
+    finally:
+        if flush_interval:
+            stopped.set()
+            flusher.join()
+        flush(line_buffered)
+        report_error.close()
 
     return exitcode
 
 
+def _flush_periodically(flush, flush_interval, stopped):
+    while not stopped.wait(flush_interval):
+        flush(True)
+
+
+def _isatty(stream):
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
 _output_mapping = {
     None: _output_lines,
     LINES: _output_lines,
     CHARS: _output_chars,
     RAW: _output_chars,
+    BYTES_LINES: _output_bytes_lines,
+    RECORDS: _output_records,
+    JSONL: _output_jsonl,
+    FIELDS: _output_fields,
 }
 
 _input_mapping = {
@@ -84,4 +831,8 @@ _input_mapping = {
     LINES: _input_lines,
     CHARS: _input_chars,
     RAW: _input_raw,
+    BYTES_LINES: _input_bytes_lines,
+    RECORDS: _input_records,
+    JSONL: _input_jsonl,
+    FIELDS: _input_fields,
 }
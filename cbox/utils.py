@@ -1,7 +1,19 @@
-import traceback
-from io import StringIO
+from os import linesep
 
-__all__ = ('error2str', )
+__all__ = (
+    'error2str', 'error2line', 'get_error_reporter', 'parse_errors_mode',
+    'set_error_item', 'get_error_item', 'FULL_ERRORS', 'SHORT_ERRORS',
+    'COUNT_ERRORS', 'FIRST_ERRORS', 'SAMPLE_ERRORS',
+)
+
+FULL_ERRORS = 'full'
+SHORT_ERRORS = 'short'
+COUNT_ERRORS = 'count'
+FIRST_ERRORS = 'first'
+SAMPLE_ERRORS = 'sample'
+
+ERROR_ITEM_ATTR = 'cbox_item'
+_MAX_ITEM_REPR = 80
 
 
 def error2str(e):
@@ -10,7 +22,171 @@ def error2str(e):
     :param BaseException e: an exception to format into str
     :rtype: str
     """
-    out = StringIO()
-    traceback.print_exception(None, e, e.__traceback__, file=out)
-    out.seek(0)
-    return out.read()
+    import traceback  # slow to import, only needed once there are errors
+
+    return ''.join(traceback.format_exception(type(e), e, e.__traceback__))
+
+
+def error2line(e):
+    """returns a single line `ExcType: message` of the exception `e`, with
+    the input item that raised it if known (see `set_error_item`).
+
+    :param BaseException e: an exception to format into str
+    :rtype: str
+    """
+    line = '%s: %s' % (type(e).__name__, e)
+    item = get_error_item(e, _missing)
+    if item is not _missing:
+        item = repr(item)
+        if len(item) > _MAX_ITEM_REPR:
+            item = item[:_MAX_ITEM_REPR] + '...'
+        line = '%s (input: %s)' % (line, item)
+    return ' '.join(line.splitlines())
+
+
+def set_error_item(e, item):
+    """attaches the input `item` to the exception `e` it raised. kept when
+    the exception is pickled from a worker process"""
+    try:
+        setattr(e, ERROR_ITEM_ATTR, item)
+    except AttributeError:
+        pass
+
+
+def get_error_item(e, default=None):
+    """returns the input item attached to the exception `e`, or `default`"""
+    return getattr(e, ERROR_ITEM_ATTR, default)
+
+
+def parse_errors_mode(mode):
+    """parses an errors reporting `mode` into its name and argument.
+
+    :param str mode: one of `full`, `short`, `count`, `first:N` or
+      `sample:RATE`.
+    :rtype: tuple
+    :raises ValueError: on an unknown mode or bad argument.
+    """
+    name, _, arg = (mode or FULL_ERRORS).partition(':')
+    if name not in _error_reporters_mapping:
+        raise ValueError('unknown errors mode - "%s"' % mode)
+
+    if name == FIRST_ERRORS:
+        arg = int(arg)
+        if arg < 0:
+            raise ValueError('first:N must not be negative - "%s"' % mode)
+    elif name == SAMPLE_ERRORS:
+        arg = float(arg)
+        if not 0 <= arg <= 1:
+            raise ValueError('sample:RATE must be in [0, 1] - "%s"' % mode)
+    elif arg:
+        raise ValueError('errors mode %s takes no argument - "%s"' % (
+            name, mode))
+    else:
+        arg = None
+    return name, arg
+
+
+def get_error_reporter(mode, err_stream, sep=linesep):
+    """returns the reporter writing the errors of a stream into `err_stream`
+    according to `mode` (see `parse_errors_mode`).
+
+    the reporter is called with each error, and closed when the stream ends
+    to write what the mode aggregates. errors are only formatted when
+    written.
+
+    :param str mode: how to report the errors, `full` if `None`.
+    :param err_stream: writable file-like object.
+    :param str sep: written after each full traceback, if not `None`.
+    """
+    name, arg = parse_errors_mode(mode)
+    return _error_reporters_mapping[name](err_stream, sep, arg)
+
+
+class _missing(object):
+    pass
+
+
+class _FullErrors(object):
+    """writes the full traceback of each error"""
+    def __init__(self, err_stream, sep, arg=None):
+        self.err_stream = err_stream
+        self.sep = sep
+        self.errors = 0
+
+    def __call__(self, err):
+        self.errors += 1
+        self.err_stream.write(error2str(err))
+        if self.sep is not None:
+            self.err_stream.write(self.sep)
+
+    def close(self):
+        pass
+
+
+class _ShortErrors(_FullErrors):
+    """writes a single line of each error"""
+    def __call__(self, err):
+        self.errors += 1
+        self.err_stream.write(error2line(err) + linesep)
+
+
+class _CountErrors(_FullErrors):
+    """writes how many errors of each type there were when closed"""
+    def __init__(self, err_stream, sep, arg=None):
+        super().__init__(err_stream, sep)
+        self.counts = {}
+
+    def __call__(self, err):
+        name = type(err).__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def close(self):
+        counts = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        for name, count in counts:
+            self.err_stream.write('%s: %d errors%s' % (name, count, linesep))
+
+
+class _FirstErrors(_FullErrors):
+    """writes the full traceback of the first `limit` errors only"""
+    def __init__(self, err_stream, sep, arg):
+        super().__init__(err_stream, sep)
+        self.limit = arg
+        self.skipped = 0
+
+    def __call__(self, err):
+        if self.errors < self.limit:
+            super().__call__(err)
+        else:
+            self.skipped += 1
+
+    def close(self):
+        if self.skipped:
+            self.err_stream.write('... %d more errors not shown%s' % (
+                self.skipped, linesep))
+
+
+class _SampledErrors(_FullErrors):
+    """writes the full traceback of an evenly spread `rate` of the errors"""
+    def __init__(self, err_stream, sep, arg):
+        super().__init__(err_stream, sep)
+        self.rate = arg
+        self.seen = 0
+
+    def __call__(self, err):
+        self.seen += 1
+        if int(self.seen * self.rate) > self.errors:
+            super().__call__(err)
+
+    def close(self):
+        if self.seen > self.errors:
+            self.err_stream.write('sampled %d of %d errors%s' % (
+                self.errors, self.seen, linesep))
+
+
+_error_reporters_mapping = {
+    FULL_ERRORS: _FullErrors,
+    SHORT_ERRORS: _ShortErrors,
+    COUNT_ERRORS: _CountErrors,
+    FIRST_ERRORS: _FirstErrors,
+    SAMPLE_ERRORS: _SampledErrors,
+}
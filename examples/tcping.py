@@ -5,10 +5,8 @@ import cbox
 
 
 @cbox.stream(worker_type='asyncio', workers_window=30)
-async def tcping(domain, timeout: int=3):
-    loop = asyncio.get_event_loop()
-
-    fut = asyncio.open_connection(domain, 80, loop=loop)
+async def tcping(domain, timeout: int = 3):
+    fut = asyncio.open_connection(domain, 80)
     try:
         reader, writer = await asyncio.wait_for(fut, timeout=timeout)
         writer.close()
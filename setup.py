@@ -8,6 +8,10 @@ NAME = 'cbox'
 META_FILE_PATH = join(HERE, NAME, '__init__.py')
 
 REQUIREMENTS = []
+EXTRAS_REQUIREMENTS = {
+    # faster `jsonl` input and output types
+    'json': ['orjson'],
+}
 CLASSIFIERS = [
     'Development Status :: 4 - Beta',
     'License :: OSI Approved :: MIT License',
@@ -55,6 +59,7 @@ setup(
     license=find_meta('license'),
     packages=[NAME],
     install_requires=REQUIREMENTS,
+    extras_require=EXTRAS_REQUIREMENTS,
     entry_points={
         'console_scripts': ['cbox=cbox.__main__:main']
     },
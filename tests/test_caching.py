@@ -0,0 +1,85 @@
+import pytest
+
+from cbox import caching
+from cbox.caching import DiskCache, LRUCache
+
+
+def upper(s):
+    return s.upper()
+
+
+def lower(s):
+    return s.lower()
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)  # evicts the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_cache_key():
+    cache = LRUCache()
+    assert cache.key('abc') == 'abc'
+    assert cache.key(b'abc') == b'abc'
+    assert cache.key(['abc']) is None
+
+
+def test_disk_cache(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = DiskCache(path, b'ns')
+    key = cache.key('abc')
+    assert cache.get(key) is None
+    cache.set(key, 'ABC')
+    cache.set(cache.key(b'x'), None)
+    cache.close()
+
+    cache = DiskCache(path, b'ns')
+    assert cache.get(key) == 'ABC'
+    assert cache.get(cache.key(b'x'), 'missing') is None
+    assert cache.get(cache.key('x'), 'missing') == 'missing'
+    cache.close()
+
+    cache = DiskCache(path, b'other')
+    assert cache.get(cache.key('abc')) is None
+    cache.close()
+
+
+def test_disk_cache_key():
+    cache = DiskCache(':memory:')
+    assert cache.key('abc') != cache.key(b'abc')
+    assert cache.key(b'abc') == cache.key(memoryview(b'abc'))
+    assert cache.key(['abc']) == cache.key(['abc'])
+    assert cache.key(lambda: None) is None
+
+
+def test_get_cache(tmp_path):
+    assert caching.get_cache(True, upper).size == caching.DEFAULT_CACHE_SIZE
+    assert caching.get_cache(10, upper).size == 10
+    assert caching.get_cache('10', upper).size == 10
+
+    path = str(tmp_path / 'cache.db')
+    caches = [
+        caching.get_cache(path, upper),
+        caching.get_cache(path, upper),
+        caching.get_cache(path, lower),
+        caching.get_cache(path, upper, {'n': 1}),
+    ]
+    namespaces = [cache.namespace for cache in caches]
+    assert namespaces[0] == namespaces[1]
+    assert len(set(namespaces)) == 3
+    for cache in caches:
+        cache.close()
+
+
+@pytest.mark.parametrize('cache', [0, -1, '0', False])
+def test_parse_cache_invalid(cache):
+    with pytest.raises(ValueError):
+        caching.parse_cache(cache)
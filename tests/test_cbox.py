@@ -1,9 +1,12 @@
 import asyncio
+import json
+import multiprocessing
 import os
 from os import linesep
 import re
 import threading
-from io import StringIO
+import time
+from io import BytesIO, StringIO, TextIOWrapper
 from itertools import product
 from string import ascii_letters
 
@@ -39,6 +42,19 @@ def run_cli(func, in_data, argv=(), expected_exitcode=0, return_stderr=False):
     return outstream.read()
 
 
+def run_cli_bytes(func, in_data, argv=()):
+    """runs `func` with binary streams and returns its output stream bytes"""
+    outstream = BytesIO()
+    errstream = StringIO()
+
+    exitcode = cbox.main(
+        func, argv, BytesIO(in_data), outstream, errstream, exit=False
+    )
+    assert exitcode == 0
+    assert not errstream.getvalue()
+    return outstream.getvalue()
+
+
 def test_run_cli_helper():
     @cbox.stream()
     def identity(line, x: int, y=2):
@@ -133,6 +149,27 @@ def test_cli_threads():
     assert len(lines) == len(set(lines)) == 4
 
 
+def test_cli_processes():
+    @cbox.stream(worker_type='process', max_workers=2)
+    def pids(line):
+        return '%s %d' % (line, os.getpid())
+
+    lines = run_cli(pids, NUMBERS).splitlines()
+    assert [line.split()[0] for line in lines] == NUMBERS.splitlines()
+    assert str(os.getpid()) not in {line.split()[1] for line in lines}
+
+
+def test_cli_processes_stop():
+    @cbox.stream(worker_type='process', max_workers=2, workers_window=1)
+    def until_three(line):
+        if line == 'three':
+            raise cbox.Stop()
+        return line
+
+    lines = run_cli(until_three, 'one\ntwo\nthree\nfour\n').splitlines()
+    assert lines == ['one', 'two']
+
+
 def test_cli_arg():
     @cbox.stream()
     def firstn(line, n: int):
@@ -177,6 +214,19 @@ def test_cli_raw():
     assert run_cli(sum_numbers, '1234') == '10'
 
 
+@pytest.mark.parametrize('mmap', [None, True])
+def test_cli_raw_block_size(tmp_path, mmap):
+    @cbox.stream(input_type='raw', block_size=2, mmap=mmap)
+    def sum_numbers(data):
+        # a line of the stream, or a memory map of the whole file
+        text = data if isinstance(data, str) else bytes(data).decode()
+        return str(sum(int(ch) for ch in text))
+
+    path = tmp_path / 'numbers'
+    path.write_text('1234')
+    assert run_cli_file(sum_numbers, path) == ('10', '')
+
+
 def test_cbox_list_output():
     @cbox.stream()
     def get_domains(line):
@@ -242,6 +292,36 @@ def test_cbox_threads_ordered():
     assert lines == NUMBERS.splitlines()
 
 
+def test_cbox_threads_sliding_window():
+    events = []
+
+    @cbox.stream(worker_type='thread', max_workers=3, workers_window=3)
+    def slow_second(line):
+        events.append(('start', line))
+        if line == '1':
+            time.sleep(0.2)
+        events.append(('end', line))
+        return line
+
+    lines = run_cli(slow_second, NUMBERS).splitlines()
+    assert lines == NUMBERS.splitlines()
+    # the fourth item starts once the first is done, not the whole window
+    assert events.index(('start', '3')) < events.index(('end', '1'))
+
+
+@pytest.mark.parametrize('worker_type', ['thread', 'process'])
+def test_cbox_pool_unordered(worker_type):
+    @cbox.stream(worker_type=worker_type, max_workers=4, ordered=False)
+    def slow_first(line):
+        if line == '0':
+            time.sleep(0.2)
+        return line
+
+    lines = run_cli(slow_first, NUMBERS).splitlines()
+    assert sorted(lines) == sorted(NUMBERS.splitlines())
+    assert lines[0] != '0'
+
+
 def test_cbox_exitcode_0_no_error():
     @cbox.stream()
     def identity(line):
@@ -262,7 +342,7 @@ def test_cbox_exitcode_2_on_error():
         assert err.status == 2
 
 
-@pytest.mark.parametrize('worker_type', ['simple', 'thread'])
+@pytest.mark.parametrize('worker_type', ['simple', 'thread', 'process'])
 def test_cbox_stderr(worker_type):
     @cbox.stream(worker_type=worker_type)
     def digitsonly(line):
@@ -275,6 +355,7 @@ def test_cbox_stderr(worker_type):
     )
     assert out.splitlines() == ['1', '2']
     assert 'ignoring - not digit' in errout
+    assert 'in digitsonly' in errout
 
 
 def test_cbox_asyncio_stop_iteration():
@@ -306,6 +387,18 @@ def test_cbox_asyncio_ordered():
     assert lines == NUMBERS.splitlines()
 
 
+def test_cbox_asyncio_async_gen():
+    @cbox.stream(worker_type='asyncio', workers_window=10)
+    async def crawl(line, depth: int = 2):
+        for i in range(depth):
+            await asyncio.sleep(0.001)
+            yield '%s/%d' % (line, i)
+
+    lines = run_cli(crawl, DATA2, ['--depth', '3']).splitlines()
+    assert lines == ['hello/0', 'hello/1', 'hello/2',
+                     'world/0', 'world/1', 'world/2']
+
+
 def test_cbox_asyncio_uses_event_loop():
     async def sleepy(x):
         await asyncio.sleep(0.01)
@@ -321,3 +414,576 @@ def test_cbox_asyncio_uses_event_loop():
     lines = run_cli(asleep, NUMBERS).splitlines()
     assert len(lines) == 1000
     assert lines == NUMBERS.splitlines()
+
+
+def test_cbox_asyncio_unordered():
+    @cbox.stream(worker_type='asyncio', workers_window=100, ordered=False)
+    async def asleep(line):
+        await asyncio.sleep(0.01 * (10 - int(line)))
+        return line
+
+    numbers = linesep.join(str(i) for i in range(10))
+    lines = run_cli(asleep, numbers).splitlines()
+    assert lines == numbers.splitlines()[::-1]
+
+
+def test_cbox_asyncio_max_workers():
+    running = 0
+    max_running = 0
+
+    @cbox.stream(worker_type='asyncio', max_workers=3, workers_window=10)
+    async def asleep(line):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.001)
+        running -= 1
+        return line
+
+    lines = run_cli(asleep, NUMBERS).splitlines()
+    assert lines == NUMBERS.splitlines()
+    assert max_running == 3
+
+
+def test_cbox_asyncio_sliding_window():
+    started = []
+
+    @cbox.stream(worker_type='asyncio', workers_window=3)
+    async def slow_second(line):
+        started.append(line)
+        await asyncio.sleep(0.2 if line == '1' else 0)
+        return '%s %d' % (line, len(started))
+
+    lines = run_cli(slow_second, NUMBERS).splitlines()
+    assert [line.split()[0] for line in lines] == NUMBERS.splitlines()
+    # the fourth item started while the slow second item was still running
+    assert lines[1] == '1 4'
+
+
+@cbox.stream(worker_type='process', max_workers=2)
+def spawned_upper(line):
+    return line.upper()
+
+
+@cbox.stream(shards=2)
+def spawned_pid(line):
+    return '%s %d' % (line, os.getpid())
+
+
+@pytest.fixture
+def spawn():
+    start_method = multiprocessing.get_start_method(allow_none=True)
+    multiprocessing.set_start_method('spawn', force=True)
+    yield
+    multiprocessing.set_start_method(start_method, force=True)
+
+
+def test_cbox_process_spawn(spawn):
+    assert run_cli(spawned_upper, DATA2) == 'HELLO\nWORLD\n'.replace(
+        '\n', linesep)
+
+
+def test_cbox_shards_spawn(spawn, numbers_file):
+    out, err = run_cli_file(spawned_pid, numbers_file)
+    assert not err
+    lines = out.splitlines()
+    assert [line.split()[0] for line in lines] == NUMBERS.splitlines()
+    assert str(os.getpid()) not in {line.split()[1] for line in lines}
+
+
+@pytest.mark.parametrize('worker_type', ['simple', 'thread', 'process'])
+def test_cbox_batch_size(worker_type):
+    @cbox.stream(worker_type=worker_type, batch_size=7)
+    def batch_digits(lines):
+        assert 0 < len(lines) <= 7
+        return [line if line.isnumeric() else None for line in lines]
+
+    lines = run_cli(batch_digits, 'a\n' + NUMBERS).splitlines()
+    assert lines == NUMBERS.splitlines()
+
+
+def test_cbox_batch_size_asyncio():
+    @cbox.stream(worker_type='asyncio', batch_size=10)
+    async def batch_pairs(lines):
+        await asyncio.sleep(0.001)
+        return [[line, line] for line in lines]
+
+    lines = run_cli(batch_pairs, NUMBERS).splitlines()
+    assert lines == [n for n in NUMBERS.splitlines() for _ in range(2)]
+
+
+def test_cbox_batch_size_error():
+    @cbox.stream(batch_size=2)
+    def batch_ints(lines):
+        return [str(int(line)) for line in lines]
+
+    out, err = run_cli(
+        batch_ints, '1\n2\na\n3\n4\n', return_stderr=True,
+        expected_exitcode=2,
+    )
+    assert out.splitlines() == ['1', '2', '4']
+    assert 'ValueError' in err
+
+
+@pytest.mark.parametrize('worker_type', [
+    'simple', 'thread', 'process', 'asyncio',
+])
+def test_cbox_batch_size_outputs_mismatch(worker_type):
+    def upper_first(lines):
+        if 'e' in lines:
+            return [line.upper() for line in lines] + ['X']
+        return [line.upper() for line in lines][:1]
+
+    async def async_upper_first(lines):
+        return upper_first(lines)
+
+    func = async_upper_first if worker_type == 'asyncio' else upper_first
+    stream = cbox.stream(worker_type=worker_type, batch_size=3,
+                         errors='short')
+    out, err = run_cli(stream(func), 'a\nb\nc\nd\ne\nf\n',
+                       return_stderr=True, expected_exitcode=2)
+    assert not out
+    assert err.count('ValueError: batch function returned 1 outputs for '
+                     '3 inputs') == 1
+    assert err.count('ValueError: batch function returned 4 outputs for '
+                     '3 inputs') == 1
+
+
+def test_cli_bytes_lines():
+    @cbox.stream(input_type='bytes_lines')
+    def first(line):
+        assert isinstance(line, bytes)
+        return line.split(b' ', 1)[0]
+
+    out = run_cli_bytes(first, DATA1.encode() + b'\xff\xfe x\n')
+    assert out.splitlines() == [b'hello', b'my', b'bye', b'hi', b'\xff\xfe']
+
+
+def test_cli_bytes_lines_text_streams():
+    @cbox.stream(input_type='bytes_lines')
+    def upper(line):
+        return line.upper()
+
+    instream = TextIOWrapper(BytesIO(DATA2.encode()))
+    outstream = TextIOWrapper(BytesIO())
+    outstream.write('start')
+    exitcode = cbox.main(upper, [], instream, outstream, StringIO(), False)
+    assert exitcode == 0
+    outstream.flush()
+    assert outstream.buffer.getvalue().splitlines() == \
+        [b'startHELLO', b'WORLD']
+
+
+def test_cli_records():
+    @cbox.stream(input_type='records', record_size=4)
+    def reverse(record):
+        return record[::-1]
+
+    assert run_cli_bytes(reverse, b'abcd1234xyz') == b'dcba4321zyx'
+
+
+def test_cli_record_size_not_records():
+    @cbox.stream(record_size=4)
+    def identity(line):
+        return line
+
+    with pytest.raises(ValueError):
+        run_cli(identity, 'abcd')
+
+
+def test_cli_records_requires_record_size():
+    @cbox.stream(input_type='records')
+    def identity(record):
+        return record
+
+    with pytest.raises(ValueError):
+        run_cli_bytes(identity, b'abcd')
+
+
+@pytest.fixture
+def numbers_file(tmp_path, monkeypatch):
+    # many small shards
+    monkeypatch.setattr(cbox.streams, 'SHARD_MAX_SIZE', 100)
+    path = tmp_path / 'numbers.txt'
+    path.write_text(NUMBERS)
+    return path
+
+
+def run_cli_file(func, path, expected_exitcode=0):
+    outstream = StringIO()
+    errstream = StringIO()
+    with open(str(path)) as instream:
+        exitcode = cbox.main(
+            func, [], instream, outstream, errstream, exit=False
+        )
+    assert exitcode == expected_exitcode
+    return outstream.getvalue(), errstream.getvalue()
+
+
+def test_cbox_shards(numbers_file):
+    @cbox.stream(shards=3)
+    def pids(line):
+        return '%s %d' % (line, os.getpid())
+
+    out, err = run_cli_file(pids, numbers_file)
+    lines = out.splitlines()
+    assert not err
+    assert [line.split()[0] for line in lines] == NUMBERS.splitlines()
+    assert str(os.getpid()) not in {line.split()[1] for line in lines}
+
+
+def test_cbox_shards_unordered(numbers_file):
+    @cbox.stream(shards='auto', ordered=False)
+    def identity(line):
+        return line
+
+    out, err = run_cli_file(identity, numbers_file)
+    assert not err
+    assert sorted(out.splitlines()) == sorted(NUMBERS.splitlines())
+
+
+def test_cbox_shards_errors_and_stop(numbers_file):
+    @cbox.stream(shards=2)
+    def until_500(line):
+        if line == '500':
+            raise cbox.Stop()
+        if line.endswith('7'):
+            raise ValueError('bad number %s' % line)
+        return line
+
+    out, err = run_cli_file(until_500, numbers_file, expected_exitcode=2)
+    assert out.splitlines() == \
+        [str(i) for i in range(500) if not str(i).endswith('7')]
+    assert 'bad number 497' in err
+    assert 'in until_500' in err
+
+
+@pytest.mark.parametrize('errors', ['count', 'first:1'])
+def test_cbox_shards_errors_without_tracebacks(numbers_file, errors):
+    @cbox.stream(shards=2, errors=errors)
+    def fails(line):
+        raise ValueError('bad number %s' % line)
+
+    out, err = run_cli_file(fails, numbers_file, expected_exitcode=2)
+    assert not out
+    # the tracebacks are not formatted on the workers
+    assert 'in fails' not in err
+    if errors == 'count':
+        assert err.splitlines() == ['ValueError: 1000 errors']
+    else:
+        assert 'ValueError: bad number 0' in err
+        assert '999 more errors not shown' in err
+
+
+def test_cbox_shards_not_a_file():
+    @cbox.stream(shards=2)
+    def pid(line):
+        return str(os.getpid())
+
+    assert set(run_cli(pid, NUMBERS).splitlines()) == {str(os.getpid())}
+
+
+@pytest.mark.parametrize('options', [
+    {'batch_size': 3},
+    {'worker_type': 'thread', 'adaptive': True},
+    {'worker_type': 'thread', 'hedge_after': 0},
+    {'worker_type': 'thread', 'timeout': 1},
+    {'cache': True},
+])
+def test_cbox_shards_unsupported(options):
+    with pytest.raises(ValueError):
+        @cbox.stream(shards=2, **options)
+        def identity(line):
+            return line
+
+
+@pytest.mark.parametrize('worker_type', [
+    'simple', 'thread', 'process', 'asyncio',
+])
+def test_cbox_stats(worker_type):
+    if worker_type == 'asyncio':
+        async def func(line):
+            return line.upper()
+    else:
+        func = str.upper
+
+    runner = cbox.stream(worker_type=worker_type, stats=True)(func)
+    outstream, errstream = StringIO(), StringIO()
+
+    assert runner(StringIO(DATA2), outstream, errstream) == 0
+    assert outstream.getvalue() == DATA2.upper()
+
+    summary = errstream.getvalue()
+    assert summary.startswith('cbox stats:')
+    assert 'items in       2 ' in summary
+    assert 'items out      2 ' in summary
+
+
+def test_cbox_stats_fd(tmp_path):
+    def slow(line):
+        time.sleep(0.01)
+        if line == 'world':
+            raise ValueError(line)
+        return line
+
+    stats_path = str(tmp_path / 'stats.jsonl')
+    with open(stats_path, 'w') as stats_file:
+        stream = cbox.stream(stats=stats_file.fileno(), stats_interval=0.01)
+        out, err = run_cli(stream(slow), DATA2 * 3, expected_exitcode=2,
+                           return_stderr=True)
+
+    assert out.splitlines() == ['hello'] * 3
+    assert err.count('ValueError: world') == 3
+
+    with open(stats_path) as fp:
+        lines = [json.loads(line) for line in fp]
+
+    assert len(lines) > 1
+    assert lines[-1]['items_in'] == 6
+    assert lines[-1]['items_out'] == 3
+    assert lines[-1]['errors'] == 3
+    assert lines[-1]['latency']['max'] >= 0.01
+
+
+@pytest.mark.parametrize('worker_type', [
+    'simple', 'thread', 'process', 'asyncio',
+])
+def test_cbox_errors_short(worker_type):
+    if worker_type == 'asyncio':
+        async def func(line):
+            return str(int(line))
+    else:
+        func = _to_int_str
+
+    runner = cbox.stream(worker_type=worker_type, errors='short')(func)
+    out, err = run_cli(runner, DATA2 + '3', expected_exitcode=2,
+                       return_stderr=True)
+    assert out == '3' + linesep
+    assert err.splitlines() == [
+        "ValueError: invalid literal for int() with base 10: '%s' "
+        "(input: '%s')" % (line, line) for line in ['hello', 'world']
+    ]
+
+
+def _to_int_str(line):
+    return str(int(line))
+
+
+def test_cbox_errors_count():
+    runner = cbox.stream(errors='count')(_to_int_str)
+    out, err = run_cli(runner, NUMBERS + linesep + 'x', expected_exitcode=2,
+                       return_stderr=True)
+    assert out.splitlines() == [str(i) for i in range(1000)]
+    assert err == 'ValueError: 1 errors' + linesep
+
+
+def test_cbox_errors_invalid_mode():
+    with pytest.raises(ValueError):
+        cbox.stream(errors='bad')
+
+
+def test_cbox_hedge_after():
+    seen = set()
+
+    def func(line):
+        if line not in seen:
+            seen.add(line)
+            time.sleep(0.2 if line == '5' else 0)
+        return line
+
+    stream = cbox.stream(worker_type='thread', max_workers=2, stats=True,
+                         hedge_after=0.01)
+    out, err = run_cli(stream(func), NUMBERS, return_stderr=True)
+    assert out == NUMBERS + linesep
+    assert re.search(r'  hedges +[1-9]', err)
+
+
+def test_cbox_hedge_after_invalid():
+    with pytest.raises(ValueError):
+        cbox.stream(worker_type='thread', hedge_after='p100')
+
+
+def test_cbox_timeout():
+    async def func(line):
+        await asyncio.sleep(10 if line == 'world' else 0)
+        return line
+
+    stream = cbox.stream(worker_type='asyncio', timeout=0.05, errors='short')
+    out, err = run_cli(stream(func), DATA2, expected_exitcode=2,
+                       return_stderr=True)
+    assert out == 'hello' + linesep
+    assert err == "TimeoutError: timed out after 0.05 seconds " \
+                  "(input: 'world')" + linesep
+
+
+def test_cbox_cache():
+    calls = []
+
+    def func(line):
+        calls.append(line)
+        return line.upper()
+
+    stream = cbox.stream(worker_type='thread', max_workers=4, cache=True)
+    assert run_cli(stream(func), DATA2 * 100) == DATA2.upper() * 100
+    assert sorted(calls) == ['hello', 'world']
+
+
+@pytest.mark.parametrize('worker_type', ['simple', 'thread', 'asyncio'])
+def test_cbox_cache_iterator_outputs(worker_type):
+    calls = []
+
+    def func(line):
+        calls.append(line)
+        return (char for char in line)
+
+    async def async_func(line):
+        return func(line)
+
+    stream = cbox.stream(
+        worker_type=worker_type, workers_window=4, cache=True,
+    )(async_func if worker_type == 'asyncio' else func)
+    # repeated, and identical inputs in flight
+    lines = run_cli(stream, 'ab\ncd\nab\nab\n').splitlines()
+    assert lines == list('abcdabab')
+    assert sorted(calls) == ['ab', 'cd']
+
+
+def test_cbox_cache_disk(tmp_path):
+    calls = []
+
+    def func(line, suffix='!'):
+        calls.append(line)
+        return line + suffix
+
+    stream = cbox.stream(cache=str(tmp_path / 'cache.db'))(func)
+    expected = 'hello!' + linesep + 'world!' + linesep
+    assert run_cli(stream, DATA2) == expected
+    assert run_cli(stream, DATA2) == expected
+    assert len(calls) == 2
+
+    # other arguments are cached apart
+    assert run_cli(stream, DATA2, ['--suffix', '?']) == expected.replace(
+        '!', '?')
+    assert len(calls) == 4
+
+
+def test_cbox_cache_invalid():
+    with pytest.raises(ValueError):
+        cbox.stream(cache=-1)
+
+
+def test_cbox_jsonl():
+    @cbox.stream(input_type='jsonl')
+    def total(d):
+        if d['items']:
+            return dict(d, total=sum(d['items']))
+
+    data = linesep.join(json.dumps({'id': i, 'items': list(range(i))})
+                        for i in range(4))
+    assert [json.loads(line) for line in run_cli(total, data).splitlines()] \
+        == [{'id': i, 'items': list(range(i)), 'total': sum(range(i))}
+            for i in range(1, 4)]
+
+
+def test_cbox_fields():
+    @cbox.stream(input_type='fields', delimiter=',', fields='3,1')
+    def swap(row):
+        price, name = row
+        return name, '%.1f' % (float(price) * 2)
+
+    data = linesep.join(['a,x,1.5,y', 'b,x,2', 'c'])
+    out, err = run_cli(swap, data, expected_exitcode=2, return_stderr=True)
+    assert out.splitlines() == ['a,3.0', 'b,4.0']
+    assert 'ValueError' in err
+
+
+def test_cbox_fields_invalid():
+    with pytest.raises(ValueError):
+        cbox.stream(input_type='fields', fields='0')
+
+
+@pytest.mark.parametrize('worker_type', [
+    'simple', 'thread', 'process', 'asyncio',
+])
+def test_cbox_pipeline(worker_type):
+    @cbox.stream()
+    def words(line):
+        return line.split() or None
+
+    if worker_type == 'asyncio':
+        @cbox.stream(worker_type=worker_type)
+        async def upper(word):
+            return word.upper() if word != '123' else None
+    else:
+        @cbox.stream(worker_type=worker_type)
+        def upper(word):
+            return word.upper() if word != '123' else None
+
+    @cbox.stream(worker_type='thread', max_workers=2)
+    def exclaim(word, suffix: str = '!'):
+        return word + suffix
+
+    pipeline = cbox.pipeline(words, upper, exclaim)
+    data = linesep.join(['hello world', '123 abc', '', 'zzz'])
+    assert run_cli(pipeline, data) == \
+        'HELLO!\nWORLD!\nABC!\nZZZ!\n'.replace('\n', linesep)
+    assert run_cli(pipeline, 'a b', ['--suffix', '?']) == \
+        'A?\nB?\n'.replace('\n', linesep)
+
+
+def test_cbox_pipeline_errors():
+    @cbox.stream()
+    def parse(line):
+        return int(line)
+
+    @cbox.stream(input_type='jsonl', errors='short')
+    def wrap(n):
+        return {'n': n * 2}
+
+    out, err = run_cli(cbox.pipeline(parse, wrap), '1\nx\n3',
+                       expected_exitcode=2, return_stderr=True)
+    assert out.splitlines() == ['{"n":2}', '{"n":6}']
+    assert err == "ValueError: invalid literal for int() with base 10: 'x' " \
+                  "(input: 'x')" + linesep
+
+
+def test_cbox_pipeline_stop():
+    seen = []
+
+    @cbox.stream()
+    def record(line):
+        seen.append(line)
+        return line
+
+    @cbox.stream()
+    def head(line):
+        if line == '3':
+            raise cbox.Stop()
+        return line
+
+    out = run_cli(cbox.pipeline(record, head), NUMBERS)
+    assert out.splitlines() == ['0', '1', '2']
+    assert seen == ['0', '1', '2', '3']
+
+
+def test_cbox_pipeline_invalid():
+    @cbox.stream(stats=True)
+    def stats(line):
+        return line
+
+    with pytest.raises(ValueError):
+        cbox.pipeline()
+    with pytest.raises(ValueError):
+        cbox.pipeline(lambda s: s)
+    with pytest.raises(ValueError):
+        cbox.pipeline(stats)
+
+
+def test_cbox_jsonl_shards(numbers_file):
+    @cbox.stream(input_type='jsonl', output_type='lines', shards=3)
+    def double(n):
+        return str(n * 2)
+
+    out, err = run_cli_file(double, numbers_file)
+    assert not err
+    assert out.splitlines() == [str(i * 2) for i in range(1000)]
@@ -1,8 +1,14 @@
+import sys
+
 import pytest
 
 import cbox
 from cbox import cliparser
 
+# argparse renamed the "optional arguments" help section on python 3.10
+OPTIONS_TITLE = 'options' if sys.version_info >= (3, 10) else \
+    'optional arguments'
+
 
 @pytest.mark.parametrize('docstring,help_msg, params', [
     (
@@ -52,9 +58,10 @@ def test_cli_docstring_help():
     output = parser.format_help()
 
     expected = 'usage: %s [-h] [-n N]\n\nreturns the nth item from each ' \
-               'line.\n\noptional arguments:\n  -h, --help  ' \
+               'line.\n\n%s:\n  -h, --help  ' \
                'show this help message and exit\n  -n N        ' \
-               'the number of item position starting from 0\n' % parser.prog
+               'the number of item position starting from 0\n' % (
+                   parser.prog, OPTIONS_TITLE)
 
     assert output == expected
 
@@ -93,7 +100,7 @@ def test_get_cli_multi_func():
 
 which subcommand do you want?
 
-optional arguments:
+%s:
   -h, --help     show this help message and exit
 
 subcommands:
@@ -102,4 +109,60 @@ subcommands:
     func2        description of func2
 """
     output = parser.format_help()
-    assert output == expected % parser.prog
+    assert output == expected % (parser.prog, OPTIONS_TITLE)
+
+
+def test_get_cli_multi_parser_lazy_subcmd(monkeypatch):
+    @cbox.cmd
+    def func1(arg1):
+        """description of func1"""
+        return arg1
+
+    @cbox.cmd
+    def func2(arg1: int):
+        pass
+
+    parsed = []
+    get_func_args = cliparser._get_func_args
+    monkeypatch.setattr(
+        cliparser, '_get_func_args',
+        lambda func: parsed.append(func) or get_func_args(func),
+    )
+
+    argv = ['func1', '--arg1', 'x']
+    subcmd = cliparser.get_subcmd(argv)
+    assert subcmd == 'func1'
+
+    parser = cliparser.get_cli_multi_parser([func1, func2], subcmd=subcmd)
+    assert parsed == [func1]
+    assert cliparser.parse_args(parser, argv) == {
+        'subcmd': 'func1', 'arg1': 'x',
+    }
+    assert 'description of func1' in parser.format_help()
+
+
+@pytest.mark.parametrize('argv,subcmd', [
+    (['-h'], ''),
+    ([], ''),
+    (['--help', 'func1', '-a', '1'], 'func1'),
+])
+def test_get_subcmd(argv, subcmd):
+    assert cliparser.get_subcmd(argv) == subcmd
+
+
+def test_get_func_args_cached(monkeypatch):
+    @cbox.cmd
+    def func(arg1: int):
+        """description of func
+
+        :param arg1: desc1
+        """
+        pass
+
+    help_msg, func_args = cliparser._get_func_args(func)
+    assert help_msg == 'description of func'
+
+    monkeypatch.setattr(cliparser.inspect, 'signature', None)
+    assert cliparser._get_func_args(func) == (help_msg, func_args)
+    parser = cliparser.get_cli_parser(func)
+    assert cliparser.parse_args(parser, ['--arg1', '5']) == {'arg1': 5}
@@ -0,0 +1,486 @@
+import asyncio
+import threading
+import time
+from functools import partial
+from itertools import islice
+
+import pytest
+
+from cbox import concurrency, utils
+from cbox.caching import LRUCache
+from cbox.concurrency import AdaptiveLimit
+from cbox.stats import StatsCollector
+
+
+def test_adaptive_limit_slow_start():
+    limit = AdaptiveLimit(2, 10)
+    assert limit.size == 2
+
+    for _ in range(5):
+        limit.update(0.01)
+    assert limit.size == 7
+
+    for _ in range(10):
+        limit.update(0.01)
+    assert limit.size == 10
+
+
+def test_adaptive_limit_backoff_on_errors():
+    limit = AdaptiveLimit(1, 100)
+    for _ in range(39):
+        limit.update(0.01)
+    assert limit.size == 40
+
+    limit.update(0.01, failed=True)
+    assert limit.size == 20
+
+    # a burst of errors backs off once per window
+    for _ in range(20):
+        limit.update(0.01, failed=True)
+    assert limit.size == 20
+    limit.update(0.01, failed=True)
+    assert limit.size == 10
+
+    # then grows by about one per window
+    for _ in range(10):
+        limit.update(0.01)
+    for _ in range(15):
+        limit.update(0.01)
+    assert limit.size == 11
+
+
+def test_adaptive_limit_backoff_on_latency():
+    limit = AdaptiveLimit(1, 100)
+    for _ in range(49):
+        limit.update(0.01)
+    assert limit.size == 50
+
+    while limit.latency < 0.02:
+        limit.update(1)
+    assert limit.size == 40
+
+
+def test_adaptive_limit_new_baseline_at_min_limit():
+    limit = AdaptiveLimit(1, 100)
+    limit.update(0.01)
+    limit.update(0.01, failed=True)
+    assert limit.size == 1
+
+    for _ in range(20):
+        limit.update(1)
+    assert limit.baseline > 0.5
+    assert limit.size > 1
+
+
+def _congested_backend():
+    """a backend whose latency grows with more than 5 concurrent calls"""
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'seen': []}
+
+    def backend(x):
+        with lock:
+            state['in_flight'] += 1
+            state['seen'].append(state['in_flight'])
+        time.sleep(0.002 * max(1, state['in_flight'] / 5.0))
+        with lock:
+            state['in_flight'] -= 1
+        return x
+    return backend, state['seen']
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_thread_runner_adaptive(ordered):
+    backend, in_flight = _congested_backend()
+    runner = concurrency.get_runner(
+        'thread', max_workers=50, ordered=ordered, adaptive=True,
+    )
+
+    results = [out for out, err in runner(backend, range(1000), {})]
+    if ordered:
+        assert results == list(range(1000))
+    else:
+        assert sorted(results) == list(range(1000))
+
+    # ramped up from 1, backed off from 50
+    assert in_flight[0] == 1
+    assert 5 < max(in_flight)
+    assert sum(in_flight[-200:]) / 200 < 25
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_asyncio_runner_adaptive(ordered):
+    calls = []
+
+    async def func(x):
+        calls.append(x)
+        await asyncio.sleep(0.001)
+        if x % 10 == 0:
+            raise ValueError(x)
+        return x
+
+    runner = concurrency.get_runner(
+        'asyncio', workers_window=20, min_workers=2, ordered=ordered,
+        adaptive=True,
+    )
+    outputs = list(runner(func, range(200), {}))
+
+    results = [out for out, err in outputs if err is None]
+    errors = [err for out, err in outputs if err is not None]
+    assert sorted(results) == [x for x in range(200) if x % 10]
+    assert len(errors) == 20
+    assert sorted(calls) == list(range(200))
+
+
+@pytest.mark.parametrize('worker_type', ['simple', 'process'])
+def test_adaptive_unsupported_worker_type(worker_type):
+    with pytest.raises(ValueError):
+        concurrency.get_runner(worker_type, adaptive=True)
+
+
+def _straggler(delay=0.5):
+    """the first call with each multiple of 10 is slow"""
+    seen = set()
+    lock = threading.Lock()
+
+    def func(x):
+        with lock:
+            slow = x % 10 == 0 and x not in seen
+            seen.add(x)
+        time.sleep(delay if slow else 0.001)
+        return x
+    return func
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_thread_runner_hedge(ordered):
+    stats = StatsCollector()
+    runner = concurrency.get_runner(
+        'thread', max_workers=4, workers_window=10, ordered=ordered,
+        stats=stats,
+        hedge_after=0.02,
+    )
+
+    start = time.perf_counter()
+    output = runner(_straggler(), range(30), {})
+    results = [out for out, err in islice(output, 30)]
+    # the slow attempts are left running, but not waited for
+    assert time.perf_counter() - start < 0.4
+    output.close()
+    if ordered:
+        assert results == list(range(30))
+    else:
+        assert sorted(results) == list(range(30))
+    assert stats.hedges >= 3
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_asyncio_runner_hedge(ordered):
+    seen = set()
+    cancelled = []
+
+    async def func(x):
+        slow = x % 10 == 0 and x not in seen
+        seen.add(x)
+        try:
+            await asyncio.sleep(10 if slow else 0.001)
+        except asyncio.CancelledError:
+            cancelled.append(x)
+            raise
+        return x
+
+    stats = StatsCollector()
+    runner = concurrency.get_runner(
+        'asyncio', max_workers=5, workers_window=10, ordered=ordered,
+        stats=stats, hedge_after=0.05,
+    )
+
+    results = [out for out, err in runner(func, range(100), {})]
+    if ordered:
+        assert results == list(range(100))
+    else:
+        assert sorted(results) == list(range(100))
+    assert set(cancelled) >= set(range(0, 100, 10))
+    assert stats.hedges >= 10
+
+
+def test_hedge_delay_percentile():
+    delay = concurrency._HedgeDelay('p90')
+    assert delay.seconds is None
+
+    for i in range(19):
+        delay.add(i / 100.0)
+    assert delay.seconds is None
+    delay.add(0.19)
+    assert delay.seconds == 0.17
+
+    for _ in range(20):
+        delay.add(1.0)
+    assert delay.seconds == 1.0
+
+
+def test_hedge_errors():
+    calls = []
+
+    def func(x):
+        calls.append(x)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            raise ValueError(x)
+        return x
+
+    runner = concurrency.get_runner(
+        'thread', workers_window=10, hedge_after=0.01,
+    )
+    assert list(runner(func, [1], {})) == [(1, None)]
+
+    def fails(x):
+        raise KeyError(x)
+
+    [(out, err)] = list(runner(fails, [1], {}))
+    assert isinstance(err, KeyError)
+
+
+@pytest.mark.parametrize('hedge_after,expected', [
+    (0.5, (0.5, None)),
+    ('0', (0.0, None)),
+    ('p95', (None, 95.0)),
+    ('p99.9', (None, 99.9)),
+])
+def test_parse_hedge_after(hedge_after, expected):
+    assert concurrency.parse_hedge_after(hedge_after) == expected
+
+
+@pytest.mark.parametrize('hedge_after', ['-1', 'p0', 'p100', 'px', 'x'])
+def test_parse_hedge_after_invalid(hedge_after):
+    with pytest.raises(ValueError):
+        concurrency.parse_hedge_after(hedge_after)
+
+
+@pytest.mark.parametrize('worker_type', ['simple', 'process'])
+def test_hedge_unsupported_worker_type(worker_type):
+    with pytest.raises(ValueError):
+        concurrency.get_runner(worker_type, hedge_after=1)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+@pytest.mark.parametrize('ordered', [True, False])
+def test_thread_runner_timeout(ordered, max_workers):
+    hang = threading.Event()
+
+    def func(x):
+        if x == 3:
+            hang.wait(5)
+        return x
+
+    runner = concurrency.get_runner(
+        'thread', max_workers=max_workers, workers_window=4, ordered=ordered,
+        timeout=0.05,
+    )
+    start = time.perf_counter()
+    output = runner(func, range(20), {})
+    outputs = list(islice(output, 20))
+    # the hung thread is replaced, and not waited for on exit
+    output.close()
+    assert time.perf_counter() - start < 1
+    hang.set()
+
+    results = [out for out, err in outputs if err is None]
+    [err] = [err for out, err in outputs if err is not None]
+    assert sorted(results) == [x for x in range(20) if x != 3]
+    assert isinstance(err, TimeoutError)
+    assert utils.get_error_item(err) == 3
+    if ordered:
+        assert outputs[3] == (None, err)
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_asyncio_runner_timeout(ordered):
+    cancelled = []
+
+    async def func(x):
+        try:
+            await asyncio.sleep(10 if x % 7 == 0 else 0.001)
+        except asyncio.CancelledError:
+            cancelled.append(x)
+            raise
+        return x
+
+    runner = concurrency.get_runner(
+        'asyncio', max_workers=3, workers_window=10, ordered=ordered,
+        timeout=0.05,
+    )
+    outputs = list(runner(func, range(30), {}))
+
+    results = [out for out, err in outputs if err is None]
+    errors = [err for out, err in outputs if err is not None]
+    assert sorted(results) == [x for x in range(30) if x % 7]
+    assert all(isinstance(err, TimeoutError) for err in errors)
+    assert sorted(utils.get_error_item(err) for err in errors) == \
+        [0, 7, 14, 21, 28]
+    assert sorted(cancelled) == [0, 7, 14, 21, 28]
+
+
+def test_timeout_with_hedge():
+    async def func(x):
+        await asyncio.sleep(10)
+
+    runner = concurrency.get_runner(
+        'asyncio', workers_window=10, hedge_after=0.01, timeout=0.05,
+    )
+    [(out, err)] = list(runner(func, [1], {}))
+    assert isinstance(err, TimeoutError)
+
+
+@pytest.mark.parametrize('worker_type,timeout', [
+    ('simple', 1), ('process', 1), ('thread', 0), ('asyncio', -1),
+])
+def test_timeout_invalid(worker_type, timeout):
+    with pytest.raises(ValueError):
+        concurrency.get_runner(worker_type, timeout=timeout)
+
+
+@pytest.mark.parametrize('worker_type,ordered', [
+    ('thread', True), ('thread', False), ('asyncio', True),
+    ('asyncio', False), ('simple', True), ('process', True),
+])
+def test_runner_cache(worker_type, ordered):
+    if worker_type == 'asyncio':
+        calls = []
+
+        async def func(x):
+            calls.append(x)
+            await asyncio.sleep(0.01)
+            return x * 2
+    else:
+        calls = [] if worker_type != 'process' else None
+        func = partial(_double, calls)
+
+    cache = LRUCache(100)
+    runner = concurrency.get_runner(
+        worker_type, max_workers=4, workers_window=10, ordered=ordered,
+        cache=cache,
+    )
+    items = [i % 5 for i in range(50)]
+    results = [out for out, err in runner(func, items, {})]
+    if ordered:
+        assert results == [x * 2 for x in items]
+    else:
+        assert sorted(results) == sorted(x * 2 for x in items)
+
+    # identical items in flight are collapsed into a single call
+    assert cache.misses + cache.hits <= 50
+    if calls is not None:
+        assert sorted(calls) == [0, 1, 2, 3, 4]
+
+
+def _double(calls, x):
+    if calls is not None:
+        calls.append(x)
+        time.sleep(0.01)
+    return x * 2
+
+
+def test_runner_cache_errors():
+    calls = []
+
+    def func(x):
+        calls.append(x)
+        time.sleep(0.01)
+        raise ValueError(x)
+
+    runner = concurrency.get_runner(
+        'thread', max_workers=2, workers_window=10, cache=LRUCache(),
+    )
+    outputs = list(runner(func, [1, 1, 1, 2], {}))
+    assert [type(err) for out, err in outputs] == [ValueError] * 4
+    assert sorted(calls) == [1, 2]
+
+    # errors are not cached
+    list(runner(func, [1], {}))
+    assert sorted(calls) == [1, 1, 2]
+
+
+def test_runner_cache_batch_size():
+    with pytest.raises(ValueError):
+        concurrency.get_runner('simple', batch_size=2, cache=LRUCache())
+
+
+async def _fan_out(produced, n):
+    if n == 3:
+        raise ValueError(n)
+    for i in range(n):
+        await asyncio.sleep(0)
+        produced.append((n, i))
+        yield '%d-%d' % (n, i)
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_asyncio_runner_async_gen(ordered):
+    produced = []
+    runner = concurrency.get_runner(
+        'asyncio', max_workers=2, workers_window=4, ordered=ordered,
+        error_items=True,
+    )
+    outputs = list(runner(partial(_fan_out, produced), [1, 2, 3, 4], {}))
+
+    outs = [out for out, err in outputs if err is None]
+    errors = [err for out, err in outputs if err is not None]
+    expected = ['1-0', '2-0', '2-1', '4-0', '4-1', '4-2', '4-3']
+    if ordered:
+        assert outs == expected
+    else:
+        assert sorted(outs) == expected
+        # each item outputs stay in order
+        assert [o for o in outs if o[0] == '4'] == expected[3:]
+    assert [type(err) for err in errors] == [ValueError]
+    assert utils.get_error_item(errors[0]) == 3
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_asyncio_runner_async_gen_backpressure(ordered):
+    produced = []
+    runner = concurrency.get_runner(
+        'asyncio', max_workers=2, workers_window=2, ordered=ordered,
+    )
+    size = concurrency.ASYNC_GEN_BUFFER * 10
+    outputs = runner(partial(_fan_out, produced), [size, size], {})
+
+    # the outputs are streamed while the generators are running, which wait
+    # for their buffered outputs to be written
+    assert next(outputs) == ('%d-0' % size, None)
+    assert len(produced) <= 2 * (concurrency.ASYNC_GEN_BUFFER + 1)
+    assert len(list(outputs)) == 2 * size - 1
+
+
+def test_asyncio_runner_async_gen_stop():
+    async def head(n):
+        for i in range(n):
+            if i == 2:
+                raise concurrency.Stop()
+            yield str(i)
+
+    runner = concurrency.get_runner('asyncio', workers_window=1)
+    assert list(runner(head, [5, 5], {})) == [('0', None), ('1', None)]
+
+
+def test_asyncio_runner_async_gen_timeout():
+    async def slow(n):
+        yield 'first'
+        await asyncio.sleep(n)
+        yield 'last'
+
+    runner = concurrency.get_runner(
+        'asyncio', workers_window=2, timeout=0.05,
+    )
+    outputs = list(runner(slow, [0, 10], {}))
+    assert outputs[:3] == [('first', None), ('last', None), ('first', None)]
+    assert isinstance(outputs[3][1], TimeoutError)
+
+
+@pytest.mark.parametrize('options', [
+    {'hedge_after': 0.1}, {'cache': LRUCache()}, {'batch_size': 2},
+])
+def test_asyncio_runner_async_gen_unsupported(options):
+    runner = concurrency.get_runner('asyncio', workers_window=2, **options)
+    with pytest.raises(ValueError):
+        list(runner(partial(_fan_out, []), [1, 2], {}))
@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+# slow to import modules that are loaded only by the features using them
+LAZY_MODULES = (
+    'asyncio', 'concurrent.futures', 'inspect', 'traceback', 'cbox.cliparser',
+    'cbox.caching',
+)
+# generous, a cold start is under 0.1s over the bare interpreter start
+STARTUP_BUDGET = 0.5
+
+
+def _imported_modules(code):
+    code += '; import sys; print("\\n".join(sys.modules))'
+    out = subprocess.check_output([sys.executable, '-c', code])
+    return set(out.decode().splitlines())
+
+
+@pytest.mark.parametrize('code', [
+    'import cbox',
+    'import io; from cbox.__main__ import main; '
+    'main(["s"], input_stream=io.StringIO("a"))',
+])
+def test_lazy_imports(code):
+    modules = _imported_modules(code)
+    assert 'cbox' in modules
+    assert not modules.intersection(LAZY_MODULES)
+
+
+def test_lazy_imports_on_use():
+    modules = _imported_modules(
+        'import io; from cbox.__main__ import main; '
+        'main(["-w", "thread", "s"], input_stream=io.StringIO("a"))'
+    )
+    assert 'concurrent.futures' in modules
+    assert 'asyncio' not in modules
+
+
+def _wall_time(args, runs=3):
+    """returns the best wall time of running python with `args`"""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + args, input=b'a\n', stdout=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def test_cold_start_time():
+    # over the interpreter start, so a slow machine does not fail it
+    startup = _wall_time(['-c', 'pass'])
+    assert _wall_time(['-m', 'cbox', 's']) - startup < STARTUP_BUDGET
@@ -1,9 +1,10 @@
-from io import StringIO
+import pickle
+from io import BytesIO, StringIO
 from os import linesep
 
 import pytest
 
-from cbox.__main__ import main
+from cbox.__main__ import main, get_inline_func
 
 DATA1 = linesep.join(['hello world', '123 456', 'zzz xxx'])
 DATA2 = linesep.join(['abc.py', 'def.pyc'])
@@ -58,3 +59,184 @@ def test_main_inline_asyncio():
     assert code == 0
     assert not err
     assert out.splitlines() == ['hello', '123', 'zzz']
+
+
+def test_main_inline_process():
+    argv = ['-w', 'process', '-c', '2', '-m', 're', 're.sub(r"[0-9]", "#", s)']
+    out, err, code = run_inline(DATA1, argv)
+
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['hello world', '### ###', 'zzz xxx']
+
+
+def test_inline_func_picklable():
+    func = get_inline_func('os.path.basename(s)', 'os')
+    inline = pickle.loads(pickle.dumps(func.__wrapped__))
+    assert inline('/tmp/abc.py') == 'abc.py'
+
+
+def test_main_inline_unordered():
+    argv = ['-w', 'thread', '-c', '4', '--unordered', 's.split()[0]']
+    out, err, code = run_inline(DATA1, argv)
+
+    assert code == 0
+    assert not err
+    assert sorted(out.splitlines()) == ['123', 'hello', 'zzz']
+
+
+def test_main_inline_batch_size():
+    argv = ['--batch-size', '2', '[x.upper() for x in s]']
+    out, err, code = run_inline(DATA1, argv)
+
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['HELLO WORLD', '123 456', 'ZZZ XXX']
+
+
+def test_main_inline_records():
+    instream = BytesIO(b'aaabbbccc')
+    outstream = BytesIO()
+    argv = ['-t', 'records', '--record-size', '3', 's[:1]']
+
+    assert main(argv, instream, outstream, StringIO()) == 0
+    assert outstream.getvalue() == b'abc'
+
+
+def test_main_inline_input_file(tmp_path):
+    path = tmp_path / 'data.txt'
+    path.write_text(DATA1)
+
+    out, err, code = run_inline(None, ['-i', str(path), 's.split()[-1]'])
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['world', '456', 'xxx']
+
+
+def test_main_inline_shards(tmp_path):
+    path = tmp_path / 'data.txt'
+    path.write_text(DATA1)
+
+    argv = ['-i', str(path), '--shards', 'auto', 's.split()[-1]']
+    out, err, code = run_inline(None, argv)
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['world', '456', 'xxx']
+
+
+def test_main_inline_asyncio_await():
+    argv = ['-w', 'asyncio', '-m', 'asyncio', '(await asyncio.sleep(0, s))[0]']
+    out, err, code = run_inline(DATA1, argv)
+
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['h', '1', 'z']
+
+
+def test_main_inline_comment():
+    out, err, code = run_inline(DATA1, ['s[0]  # first char'])
+
+    assert code == 0
+    assert not err
+    assert out.splitlines() == ['h', '1', 'z']
+
+
+@pytest.mark.parametrize('inline_str', ['x = s', 'await s', 's.split('])
+def test_get_inline_func_not_an_expression(inline_str):
+    with pytest.raises(ValueError):
+        get_inline_func(inline_str)
+
+
+def test_main_inline_stats():
+    out, err, code = run_inline(DATA1, ['--stats', 's.split()[0]'])
+    assert code == 0
+    assert out == 'hello\n123\nzzz\n'.replace('\n', linesep)
+    assert err.startswith('cbox stats:')
+
+
+def test_main_inline_adaptive():
+    argv = ['-w', 'thread', '--adaptive', '--min-workers', '2',
+            's.split()[0]']
+    out, err, code = run_inline(DATA1, argv)
+    assert (out, err, code) == ('hello\n123\nzzz\n'.replace('\n', linesep),
+                                '', 0)
+
+
+def test_main_inline_hedge_after():
+    argv = ['-w', 'asyncio', '--hedge-after', 'p95', 's.split()[0]']
+    out, err, code = run_inline(DATA1, argv)
+    assert (out, err, code) == ('hello\n123\nzzz\n'.replace('\n', linesep),
+                                '', 0)
+
+
+def test_main_inline_timeout():
+    argv = ['-w', 'thread', '--timeout', '0.05', '--errors', 'count',
+            'time.sleep(0.2 if s[0] == "z" else 0) or s.split()[0]']
+    out, err, code = run_inline(DATA1, ['-m', 'time'] + argv)
+    assert out == 'hello\n123\n'.replace('\n', linesep)
+    assert err == 'TimeoutError: 1 errors' + linesep
+    assert code == 2
+
+
+def test_main_inline_cache(tmp_path):
+    argv = ['--cache', str(tmp_path / 'cache.db'), 's.split()[0]']
+    for _ in range(2):
+        out, err, code = run_inline(DATA1, argv)
+        assert (out, err, code) == (
+            'hello\n123\nzzz\n'.replace('\n', linesep), '', 0)
+    assert (tmp_path / 'cache.db').exists()
+
+
+def test_main_inline_jsonl():
+    data = linesep.join(['{"a": 1, "b": [2]}', '{"a": 3, "b": []}'])
+    out, err, code = run_inline(data, ['-t', 'jsonl', 's["b"] or None'])
+    assert (out, err, code) == ('[2]' + linesep, '', 0)
+
+    out, err, code = run_inline(data, ['-t', 'jsonl', '-o', 'lines',
+                                       'str(s["a"])'])
+    assert (out, err, code) == ('1\n3\n'.replace('\n', linesep), '', 0)
+
+
+def test_main_inline_fields():
+    data = linesep.join(['a\tb\tc', '1\t2\t3'])
+    out, err, code = run_inline(data, ['-t', 'fields', '-f', '3,1', 's'])
+    assert (out, err, code) == ('c\ta\n3\t1\n'.replace('\n', linesep),
+                                '', 0)
+
+    data = linesep.join(['x,"y, z"', '1,2'])
+    out, err, code = run_inline(data, ['-t', 'fields', '--dialect', 'excel',
+                                       '-o', 'lines', '-f', '2', 's[0]'])
+    assert (out, err, code) == ('y, z\n2\n'.replace('\n', linesep), '', 0)
+
+
+def test_main_inline_pipeline():
+    argv = ['-w', 'thread', 's.split()', 's.upper() if s != "123" else None']
+    out, err, code = run_inline(DATA1, argv)
+    assert (out, err, code) == (
+        'HELLO\nWORLD\n456\nZZZ\nXXX\n'.replace('\n', linesep), '', 0,
+    )
+
+    data = linesep.join(['{"a": 1}', '{"a": 2}'])
+    out, err, code = run_inline(data, ['-t', 'jsonl', '-o', 'lines',
+                                       's["a"]', 'str(s * 10)'])
+    assert (out, err, code) == ('10\n20\n'.replace('\n', linesep), '', 0)
+
+
+def test_main_inline_profile(tmp_path):
+    prof_path = tmp_path / 'out.collapsed'
+    argv = ['--profile', 'sampling', '--profile-path', str(prof_path),
+            's.split()[0]']
+    out, err, code = run_inline(DATA1, argv)
+    assert (out, err, code) == ('hello\n123\nzzz\n'.replace('\n', linesep),
+                                '', 0)
+    assert prof_path.exists()
+
+
+def test_main_inline_errors():
+    out, err, code = run_inline(DATA1, ['--errors', 'short', 'str(int(s))'])
+    assert code == 2
+    assert out == ''
+    assert err.splitlines() == [
+        "ValueError: invalid literal for int() with base 10: '%s' "
+        "(input: '%s')" % (line, line) for line in DATA1.splitlines()
+    ]
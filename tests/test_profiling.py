@@ -0,0 +1,92 @@
+import pstats
+import time
+from io import StringIO
+from os import linesep
+
+import pytest
+
+import cbox
+
+
+def busy_upper(line):
+    deadline = time.perf_counter() + 0.02
+    while time.perf_counter() < deadline:
+        pass
+    return line.upper()
+
+
+async def async_busy_upper(line):
+    return busy_upper(line)
+
+
+def _func_names(prof_path):
+    stats = pstats.Stats(str(prof_path))
+    return {func_name for _, _, func_name in stats.stats}
+
+
+def _run(func, **stream_kwargs):
+    runner = cbox.stream(**stream_kwargs)(func)
+    outstream = StringIO()
+    assert runner(StringIO('a\nb\nc\n'), outstream, StringIO()) == 0
+    assert outstream.getvalue().split(linesep) == ['A', 'B', 'C', '']
+
+
+@pytest.mark.parametrize('worker_type', [
+    'simple', 'thread', 'process', 'asyncio',
+])
+def test_profile_cprofile(tmp_path, worker_type):
+    func = async_busy_upper if worker_type == 'asyncio' else busy_upper
+    prof_path = tmp_path / 'out.prof'
+
+    _run(func, worker_type=worker_type, max_workers=2, profile='cprofile',
+         profile_path=str(prof_path))
+
+    func_names = _func_names(prof_path)
+    assert func.__name__ in func_names
+    # only the function calls are profiled, not the runners
+    assert not any(name.endswith('_runner') for name in func_names)
+
+
+@pytest.mark.parametrize('worker_type', ['simple', 'thread', 'process'])
+def test_profile_sampling(tmp_path, worker_type):
+    prof_path = tmp_path / 'out.collapsed'
+
+    _run(busy_upper, worker_type=worker_type, max_workers=2,
+         profile='sampling', profile_path=str(prof_path))
+
+    lines = prof_path.read_text().splitlines()
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(' ', 1)
+        assert stack.startswith('busy_upper (')
+        assert int(count) > 0
+
+
+def test_profile_cbox_main(tmp_path):
+    prof_path = tmp_path / 'out.prof'
+
+    @cbox.stream()
+    def nth_item(line, n: int = 0):
+        return busy_upper(line.split()[n])
+
+    outstream = StringIO()
+    argv = ['-n', '1', '--profile', 'cprofile', '--profile-path',
+            str(prof_path)]
+    exitcode = cbox.main(nth_item, argv, StringIO('a b\nc d\n'), outstream,
+                         StringIO(), exit=False)
+
+    assert exitcode == 0
+    assert outstream.getvalue().split(linesep) == ['B', 'D', '']
+    assert {'nth_item', 'busy_upper'} <= _func_names(prof_path)
+
+
+def test_profile_cbox_main_func_arg():
+    @cbox.stream()
+    def tag(line, profile='x'):
+        return '%s:%s' % (profile, line)
+
+    outstream = StringIO()
+    exitcode = cbox.main(tag, ['--profile', 'y'], StringIO('a\n'), outstream,
+                         StringIO(), exit=False)
+    assert exitcode == 0
+    assert outstream.getvalue() == 'y:a' + linesep
@@ -0,0 +1,97 @@
+import json
+import time
+from io import StringIO
+
+import pytest
+
+from cbox.stats import StatsCollector, timed_call
+
+
+def test_stats_counts():
+    stats = StatsCollector()
+
+    items = list(stats.read_items(['a', 'b', 'c']))
+    output = [('A', None), (None, ValueError()), ('C', None)]
+    assert list(stats.count_outputs(output)) == output
+
+    outstream = StringIO()
+    writer = stats.timed_writes(outstream)
+    writer.write('hello')
+    writer.flush()
+
+    snapshot = stats.snapshot()
+    assert items == ['a', 'b', 'c']
+    assert snapshot['items_in'] == 3
+    assert snapshot['items_out'] == 2
+    assert snapshot['errors'] == 1
+    assert snapshot['bytes_out'] == 5
+    assert outstream.getvalue() == 'hello'
+
+
+def test_stats_latency_percentiles():
+    stats = StatsCollector(workers=2)
+    for ms in range(1, 101):
+        stats.add_latency(ms / 1000.0)
+
+    latency = stats.snapshot()['latency']
+    assert latency['max'] == 0.1
+    assert latency['mean'] == pytest.approx(0.0505)
+    for name, expected in [('p50', 0.05), ('p90', 0.09), ('p99', 0.099)]:
+        assert latency[name] == pytest.approx(expected, rel=0.05)
+
+
+def test_stats_timed():
+    stats = StatsCollector()
+
+    func = stats.timed(lambda s, n: time.sleep(0.01) or s * n)
+    assert func('a', n=3) == 'aaa'
+
+    with pytest.raises(ValueError):
+        stats.timed(int)('x')
+
+    assert stats.calls == 2
+    assert 0.01 <= stats.max_latency < 1
+    assert stats.snapshot()['workers_busy'] >= 0.01
+
+
+def test_stats_timed_remote():
+    stats = StatsCollector()
+    err = ValueError()
+
+    results = stats.timed_remote([(timed_call(str.upper, 'a'), None),
+                                  (None, err)])
+    assert list(results) == [('A', None), (None, err)]
+    assert stats.calls == 1
+
+
+def test_stats_queue_depth():
+    stats = StatsCollector()
+    for depth in [4, 2, 0]:
+        stats.queue_depth(depth)
+
+    snapshot = stats.snapshot()
+    assert snapshot['in_flight'] == 0
+    assert snapshot['in_flight_max'] == 4
+    assert snapshot['in_flight_avg'] == 2
+
+
+def test_stats_report_periodically():
+    stats = StatsCollector()
+    outstream = StringIO()
+
+    stats.report_periodically(outstream, interval=0.01)
+    time.sleep(0.1)
+    stats.stop()
+
+    lines = outstream.getvalue().splitlines()
+    assert len(lines) >= 2
+    assert json.loads(lines[-1])['items_in'] == 0
+
+
+def test_stats_summary():
+    stats = StatsCollector()
+    list(stats.read_items(range(10)))
+
+    summary = stats.summary()
+    assert summary.startswith('cbox stats:')
+    assert 'items in       10 ' in summary
@@ -0,0 +1,345 @@
+import sys
+import threading
+import time
+from io import BytesIO, StringIO, TextIOWrapper
+from os import linesep
+
+import pytest
+
+from cbox import streams
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 3, 1024])
+@pytest.mark.parametrize('data,expected', [
+    ('hello world\n\nbye', ['hello world', '', 'bye']),
+    ('a\nb\n', ['a', 'b']),
+    ('\n\n', ['', '']),
+    ('', []),
+    ('single', ['single']),
+])
+def test_input_lines_blocks(data, expected, block_size):
+    parser = streams.get_input_parser('lines', block_size=block_size)
+    assert list(parser(StringIO(data))) == expected
+
+
+@pytest.mark.parametrize('block_size', [1, 2, 1024])
+def test_input_lines_text_wrapper(block_size):
+    data = 'שלום\r\nעולם\nbye'.encode('utf8')
+    instream = TextIOWrapper(BytesIO(data), encoding='utf8')
+
+    parser = streams.get_input_parser('lines', block_size=block_size)
+    assert list(parser(instream)) == ['שלום', 'עולם', 'bye']
+
+
+@pytest.mark.parametrize('input_type,expected', [
+    ('lines', ['1', '2', '3']),
+    ('chars', list('1\n2\n3\n')),
+    ('bytes_lines', [b'1', b'2', b'3']),
+    ('records', [b'1\n', b'2\n', b'3\n']),
+    ('jsonl', [1, 2, 3]),
+])
+def test_input_text_wrapper_read_from(input_type, expected):
+    instream = TextIOWrapper(BytesIO(b'header\n1\n2\n3\n'), encoding='utf8')
+    assert instream.readline() == 'header\n'
+
+    # the rest is buffered by the text wrapper, not read again from BytesIO
+    options = {'record_size': 2} if input_type == 'records' else {}
+    parser = streams.get_input_parser(input_type, **options)
+    assert list(parser(instream)) == expected
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1024])
+def test_input_chars_blocks(block_size):
+    parser = streams.get_input_parser('chars', block_size=block_size)
+    assert ''.join(parser(StringIO('hello\nworld'))) == 'hello\nworld'
+
+
+@pytest.mark.parametrize('block_size', [1, 5, 1024])
+def test_input_bytes_lines_blocks(block_size):
+    parser = streams.get_input_parser('bytes_lines', block_size=block_size)
+    lines = parser(BytesIO(b'hello world\n\xff\n\nbye'))
+    assert list(lines) == [b'hello world', b'\xff', b'', b'bye']
+
+
+@pytest.mark.parametrize('block_size', [1, 4, 7, 1024])
+def test_input_records_blocks(block_size):
+    parser = streams.get_input_parser(
+        'records', record_size=3, block_size=block_size,
+    )
+    records = parser(BytesIO(b'abcdefghij'))
+    assert list(records) == [b'abc', b'def', b'ghi', b'j']
+
+
+class WritesRecorder(StringIO):
+    """a `StringIO` recording the `write()` and `flush()` calls"""
+    def __init__(self, tty=False):
+        super().__init__()
+        self.tty = tty
+        self.calls = []
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, s):
+        self.calls.append(('write', s))
+        return super().write(s)
+
+    def flush(self):
+        self.calls.append(('flush', ))
+        return super().flush()
+
+
+def _outputs(n):
+    return ((str(i), None) for i in range(n))
+
+
+def test_output_buffered_writes():
+    outstream = WritesRecorder()
+    writer = streams.get_output_parser('lines')
+
+    assert writer(outstream, StringIO(), _outputs(1000)) == 0
+    assert outstream.getvalue().splitlines() == [str(i) for i in range(1000)]
+    assert outstream.calls == [('write', outstream.getvalue())]
+
+
+@pytest.mark.parametrize('tty,line_buffered', [(True, None), (False, True)])
+def test_output_line_buffered(tty, line_buffered):
+    outstream = WritesRecorder(tty=tty)
+    writer = streams.get_output_parser('chars', line_buffered=line_buffered)
+
+    assert writer(outstream, StringIO(), _outputs(3)) == 0
+    assert outstream.calls == [
+        ('write', '0'), ('flush', ), ('write', '1'), ('flush', ),
+        ('write', '2'), ('flush', ), ('flush', ),
+    ]
+
+
+def test_output_flush_interval():
+    outstream = WritesRecorder()
+    flushed = threading.Event()
+
+    def slow_outputs():
+        yield 'first', None
+        flushed.wait(timeout=5)
+        yield 'second', None
+
+    def wait_flushed():
+        while ('write', 'first' + linesep) not in outstream.calls:
+            time.sleep(0.01)
+        flushed.set()
+
+    threading.Thread(target=wait_flushed, daemon=True).start()
+    writer = streams.get_output_parser('lines', flush_interval=0.05)
+
+    assert writer(outstream, StringIO(), slow_outputs()) == 0
+    assert flushed.is_set()
+    assert outstream.getvalue().splitlines() == ['first', 'second']
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / 'data.txt'
+    path.write_bytes('שלום\r\nworld\n\nbye'.encode('utf8') + b'!' * 100)
+    return path
+
+
+@pytest.mark.parametrize('input_type,options,expected', [
+    ('lines', {}, ['שלום', 'world', '', 'bye' + '!' * 100]),
+    ('bytes_lines', {}, [
+        'שלום\r'.encode('utf8'), b'world', b'', b'bye' + b'!' * 100,
+    ]),
+    ('records', {'record_size': 50}, [
+        'שלום\r\nworld\n\nbye'.encode('utf8') + b'!' * 30, b'!' * 50,
+        b'!' * 20,
+    ]),
+])
+@pytest.mark.parametrize('block_size', [1, 7, 1024])
+def test_input_mmap(data_file, input_type, options, expected, block_size):
+    parser = streams.get_input_parser(
+        input_type, block_size=block_size, **options
+    )
+    with open(str(data_file), encoding='utf8') as fp:
+        assert list(parser(fp)) == expected
+        # the file is read through the mmap, not the stream
+        assert fp.buffer.raw.tell() == 0
+
+    parser = streams.get_input_parser(
+        input_type, block_size=block_size, use_mmap=False, **options
+    )
+    with open(str(data_file), encoding='utf8') as fp:
+        assert list(parser(fp)) == expected
+
+
+@pytest.mark.parametrize('input_type,options,expected', [
+    ('lines', {}, ['%04d' % i for i in range(10000)]),
+    ('bytes_lines', {}, [b'%04d' % i for i in range(10000)]),
+    ('records', {'record_size': 5}, [b'%04d\n' % i for i in range(10000)]),
+])
+@pytest.mark.parametrize('consume', ['readline', '__next__'])
+@pytest.mark.parametrize('use_mmap', [None, False])
+def test_input_mmap_partially_read(tmp_path, input_type, options, expected,
+                                   consume, use_mmap):
+    path = tmp_path / 'data.txt'
+    lines = (b'%04d\n' % i for i in range(10000))
+    path.write_bytes(b'header\n' + b''.join(lines))
+
+    parser = streams.get_input_parser(
+        input_type, use_mmap=use_mmap, **options
+    )
+    with open(str(path), encoding='utf8') as fp:
+        assert getattr(fp, consume)() == 'header\n'
+        # the file descriptor is ahead of the stream position
+        assert 0 < fp.buffer.raw.tell() < path.stat().st_size
+        assert list(parser(fp)) == expected
+
+
+def test_input_mmap_raw(data_file):
+    with open(str(data_file), encoding='utf8') as fp:
+        parser = streams.get_input_parser('raw', use_mmap=True)
+        buffers = list(parser(fp))
+
+    assert len(buffers) == 1
+    assert isinstance(buffers[0], memoryview)
+    assert buffers[0] == data_file.read_bytes()
+
+    with open(str(data_file), encoding='utf8') as fp:
+        assert streams.get_input_parser('raw')(fp) is fp
+
+
+@pytest.mark.parametrize('input_type,options', [
+    ('lines', {'record_size': 4}),
+    ('jsonl', {'delimiter': ','}),
+    ('raw', {'record_size': 4}),
+])
+def test_get_input_parser_unknown_option(input_type, options):
+    with pytest.raises(ValueError) as err:
+        streams.get_input_parser(input_type, **options)
+    assert str(err.value) == '%s input does not take %s' % (
+        input_type, ''.join(options),
+    )
+    # unset options are ignored
+    streams.get_input_parser(input_type, **{k: None for k in options})
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def json_backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setitem(sys.modules, 'orjson', None)
+    monkeypatch.setattr(streams, '_json', None)
+    yield request.param
+
+
+JSONL_DATA = '{"a": 1}\n\n [2, "שלום"] \r\n"s"\nnull\n{"b": {"c": 1.5}}'
+JSONL_VALUES = [{'a': 1}, [2, 'שלום'], 's', None, {'b': {'c': 1.5}}]
+
+
+@pytest.mark.parametrize('block_size', [1, 5, 1024])
+def test_input_jsonl(json_backend, block_size):
+    parser = streams.get_input_parser('jsonl', block_size=block_size)
+    assert list(parser(StringIO(JSONL_DATA))) == JSONL_VALUES
+
+    instream = TextIOWrapper(BytesIO(JSONL_DATA.encode('utf8')))
+    assert list(parser(instream)) == JSONL_VALUES
+
+
+def test_input_jsonl_mmap(json_backend, tmp_path):
+    path = tmp_path / 'data.jsonl'
+    path.write_bytes(JSONL_DATA.encode('utf8'))
+
+    parser = streams.get_input_parser('jsonl', block_size=3)
+    with open(str(path), encoding='utf8') as fp:
+        assert list(parser(fp)) == JSONL_VALUES
+        assert fp.buffer.raw.tell() == 0
+
+
+def test_input_jsonl_invalid(json_backend):
+    parser = streams.get_input_parser('jsonl')
+    with pytest.raises(ValueError):
+        list(parser(StringIO('{"a": 1}\n{"a": \n')))
+
+
+def test_output_jsonl(json_backend):
+    output = [
+        ({'a': 1, 'u': 'שלום'}, None), (None, None), ([1, None], None),
+        ('s', None), (None, ValueError('x')), ({1j}, None),
+    ]
+    expected = ['{"a":1,"u":"שלום"}', '[1,null]', '"s"']
+
+    outstream, errstream = StringIO(), StringIO()
+    writer = streams.get_output_parser('jsonl')
+    assert writer(outstream, errstream, output) == 2
+    assert outstream.getvalue().splitlines() == expected
+    assert errstream.getvalue().count('Error: ') == 2
+
+    stream = BytesIO()
+    outstream = TextIOWrapper(stream, encoding='utf8')
+    assert writer(outstream, StringIO(), output) == 2
+    outstream.flush()
+    assert stream.getvalue().decode('utf8').splitlines() == expected
+
+
+FIELDS_DATA = 'a\tb\tc\td\n1\t2\n\nx\ty\tz'
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1024])
+@pytest.mark.parametrize('options,expected', [
+    ({}, [('a', 'b', 'c', 'd'), ('1', '2'), ('', ), ('x', 'y', 'z')]),
+    ({'fields': '3,1'}, [('c', 'a'), ('', '1'), ('', ''), ('z', 'x')]),
+    ({'fields': [2]}, [('b', ), ('2', ), ('', ), ('y', )]),
+    ({'fields': '2-3'}, [('b', 'c'), ('2', ''), ('', ''), ('y', 'z')]),
+])
+def test_input_fields(options, expected, block_size):
+    parser = streams.get_input_parser(
+        'fields', block_size=block_size, **options
+    )
+    assert list(parser(StringIO(FIELDS_DATA))) == expected
+
+
+def test_input_fields_delimiter():
+    parser = streams.get_input_parser('fields', delimiter=',', fields='1,3')
+    assert list(parser(StringIO('a,b,c,d\n1,2,3'))) == \
+        [('a', 'c'), ('1', '3')]
+
+
+def test_input_fields_dialect():
+    data = 'id,name,note\n1,"smith, john","said ""hi"""\n2,,x'
+    parser = streams.get_input_parser('fields', dialect='excel', fields='2')
+    assert list(parser(StringIO(data))) == \
+        [('name', ), ('smith, john', ), ('', )]
+
+
+@pytest.mark.parametrize('fields', ['0', '1,-2', '3-1', 'a', []])
+def test_parse_fields_invalid(fields):
+    with pytest.raises(ValueError):
+        streams.parse_fields(fields)
+
+
+@pytest.mark.parametrize('options,expected', [
+    ({}, ['a\tb', 'c', '1\t2']),
+    ({'delimiter': ','}, ['a,b', 'c', '1,2']),
+    ({'dialect': 'unix'}, ['"a","b"', 'c', '"1","2"']),
+])
+def test_output_fields(options, expected):
+    output = [(('a', 'b'), None), ('c', None), ([1, 2], None)]
+    outstream = StringIO()
+    writer = streams.get_output_parser('fields', **options)
+    assert writer(outstream, StringIO(), output) == 0
+    assert outstream.getvalue().splitlines() == expected
+
+
+@pytest.mark.parametrize('output_type,expected', [
+    ('lines', ['a', 'b', 'c', 'd', {'e': 1}, 'f']),
+    ('jsonl', ['a', ['b', None, 'c'], ('d', ), {'e': 1}, 'f']),
+    ('fields', ['a', ['b', None, 'c'], ('d', ), {'e': 1}, 'f']),
+])
+def test_iter_output_items(output_type, expected):
+    output = [
+        ('a', None), (['b', None, 'c'], None), (('d', ), None),
+        ({'e': 1}, None), (None, ValueError('x')), ('f', None),
+    ]
+    errors = []
+    items = streams.iter_output_items(output, output_type, errors)
+    assert list(items) == expected
+    assert [str(e) for e in errors] == ['x']
@@ -1,3 +1,8 @@
+from io import StringIO
+from os import linesep
+
+import pytest
+
 from cbox import utils
 
 
@@ -10,3 +15,80 @@ def test_error2str():
     strerror = utils.error2str(err)
     assert 'ValueError' in strerror
     assert 'abcd' in strerror
+
+
+def _errors(*items):
+    errors = []
+    for item in items:
+        try:
+            int(item)
+        except ValueError as e:
+            utils.set_error_item(e, item)
+            errors.append(e)
+    try:
+        {}['k']
+    except KeyError as e:
+        errors.append(e)
+    return errors
+
+
+def test_error2line():
+    err, key_err = _errors('x' * 100)
+    assert utils.error2line(err) == (
+        "ValueError: invalid literal for int() with base 10: '%s' "
+        "(input: '%s...)" % ('x' * 100, 'x' * 79)
+    )
+    assert utils.get_error_item(err) == 'x' * 100
+    assert utils.error2line(key_err) == "KeyError: 'k'"
+    assert utils.error2line(ValueError('a\nb')) == 'ValueError: a b'
+
+
+@pytest.mark.parametrize('mode,expected', [
+    ('count', 'ValueError: 3 errors\nKeyError: 1 errors\n'),
+    ('first:0', '... 4 more errors not shown\n'),
+    ('sample:0', 'sampled 0 of 4 errors\n'),
+    ('short', "ValueError: invalid literal for int() with base 10: 'a' "
+              "(input: 'a')\n"
+              "ValueError: invalid literal for int() with base 10: 'b' "
+              "(input: 'b')\n"
+              "ValueError: invalid literal for int() with base 10: 'c' "
+              "(input: 'c')\n"
+              "KeyError: 'k'\n"),
+])
+def test_error_reporter(mode, expected):
+    errstream = StringIO()
+    report_error = utils.get_error_reporter(mode, errstream)
+    for err in _errors('a', 'b', 'c'):
+        report_error(err)
+    report_error.close()
+
+    assert errstream.getvalue() == expected.replace('\n', linesep)
+
+
+@pytest.mark.parametrize('mode,tracebacks', [
+    (None, 'abcK'),
+    ('full', 'abcK'),
+    ('first:2', 'ab'),
+    ('sample:0.5', 'bK'),
+    ('sample:1', 'abcK'),
+])
+def test_error_reporter_tracebacks(mode, tracebacks):
+    errstream = StringIO()
+    report_error = utils.get_error_reporter(mode, errstream)
+    for err in _errors('a', 'b', 'c'):
+        report_error(err)
+    report_error.close()
+
+    output = errstream.getvalue()
+    assert output.count('Traceback') == len(tracebacks)
+    for item in 'abc':
+        assert ("base 10: '%s'" % item in output) == (item in tracebacks)
+    assert ("KeyError: 'k'" in output) == ('K' in tracebacks)
+
+
+@pytest.mark.parametrize('mode', [
+    'bad', 'full:1', 'first', 'first:-1', 'sample:x', 'sample:2',
+])
+def test_parse_errors_mode_invalid(mode):
+    with pytest.raises(ValueError):
+        utils.parse_errors_mode(mode)